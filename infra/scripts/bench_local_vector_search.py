@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+小记忆本地向量检索 vs Weaviate 过滤检索：找 RAG_LOCAL_INDEX_MAX_VECTORS 的交叉点
+---------------------------------
+- local   ：LocalVectorIndex（float32 矩阵 + 一次矩阵乘），另计首次加载（fetch_with_vectors）耗时
+- weaviate：WeaviateStore.search(filters={memory_id, app})，需要运行中的 Weaviate（--weaviate）
+
+每个规模写入 n 条随机向量到一个临时 memory，分别测 p50 / p95。
+本地检索的单次成本随 n 线性增长，Weaviate 基本是固定的网络往返；
+取本地 p95 仍明显低于 Weaviate p50 的最大 n 作为阈值。
+
+示例：
+    python infra/scripts/bench_local_vector_search.py
+    python infra/scripts/bench_local_vector_search.py --weaviate --dim 1536
+"""
+import argparse
+import statistics
+import time
+import uuid
+from typing import Callable, List
+
+import numpy as np
+
+from rag.memory.local_index import LocalVectorIndex
+
+SIZES = [16, 64, 256, 512, 1024, 4096, 16384]
+
+
+def _measure(fn: Callable[[], None], requests: int) -> dict:
+    latencies: List[float] = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def _print(label: str, n: int, r: dict) -> None:
+    print(f"{label:<10} n={n:<6} p50={r['p50_ms']:>8.3f}ms  p95={r['p95_ms']:>8.3f}ms")
+
+
+def bench(dim: int, requests: int, top_k: int, use_weaviate: bool) -> None:
+    rng = np.random.default_rng(0)
+    store = None
+    if use_weaviate:
+        from rag.datasource.vectorstores.weaviate_store import WeaviateStore
+        store = WeaviateStore(collection="AuxiliaryMemory", embedding_dim=dim)
+
+    for n in SIZES:
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        props = [{"text": f"t{i}", "url": f"u{i}", "role": "user"} for i in range(n)]
+        query = rng.standard_normal(dim, dtype=np.float32).tolist()
+
+        index = LocalVectorIndex(max_vectors=max(SIZES), max_memories=4)
+        objs = [{"properties": p, "vector": v} for p, v in zip(props, vectors)]
+        t0 = time.perf_counter()
+        entry = index.get("bench", 0, lambda limit: objs)
+        load_ms = (time.perf_counter() - t0) * 1000
+        r = _measure(lambda: index.search(entry, query, top_k), requests)
+        _print("local", n, r)
+        print(f"{'':<10} 构建矩阵 {load_ms:.2f}ms（不含 Weaviate 拉取）")
+
+        if store is not None:
+            memory_id, app = f"bench_{uuid.uuid4().hex[:8]}", "bench"
+            store.add_texts(
+                texts=[p["text"] for p in props],
+                vectors=vectors.tolist(),
+                metadatas=props,
+                memory_id=memory_id,
+                app=app,
+                collection="AuxiliaryMemory",
+            )
+            filters = {"memory_id": memory_id, "app": app}
+            t0 = time.perf_counter()
+            store.fetch_with_vectors(collection="AuxiliaryMemory", filters=filters, limit=n + 1)
+            print(f"{'':<10} fetch_with_vectors {(time.perf_counter() - t0) * 1000:.2f}ms")
+            r = _measure(
+                lambda: store.search(query, top_k=top_k, collection="AuxiliaryMemory", filters=filters),
+                min(requests, 200),
+            )
+            _print("weaviate", n, r)
+            store.delete_by_filter("AuxiliaryMemory", filters)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--weaviate", action="store_true", help="同时压测 Weaviate 过滤检索")
+    args = ap.parse_args()
+    bench(args.dim, args.requests, args.top_k, args.weaviate)
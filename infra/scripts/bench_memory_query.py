@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+/memory/query 吞吐基准（1 / 8 / 32 并发）
+---------------------------------
+两种模式：
+- http  ：对运行中的服务压测 POST /memory/query（端到端，含 LLM）
+- sqlite：只压测主记忆读路径（mem_primary.get + mem_contexts.list_by_memory），
+          对比 单连接+锁（read_pool=False） 与 每线程只读连接（read_pool=True）
+
+示例：
+    python infra/scripts/bench_memory_query.py --mode sqlite
+    python infra/scripts/bench_memory_query.py --mode http --base-url http://localhost:8001 \\
+        --memory-id test_app_e25fac3b08d2 --app test_app
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
+from rag.datasource.sqlstores.mem_primary_store import MemPrimaryStore
+
+CONCURRENCY = [1, 8, 32]
+
+
+def _run(fn: Callable[[], None], concurrency: int, requests: int) -> dict:
+    latencies: List[float] = []
+
+    def one(_):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - t_start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "qps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def _print(label: str, r: dict) -> None:
+    print(
+        f"{label:<16} c={r['concurrency']:<3} "
+        f"qps={r['qps']:>9.1f}  p50={r['p50_ms']:>7.2f}ms  p95={r['p95_ms']:>7.2f}ms"
+    )
+
+
+def bench_sqlite(requests: int, rows: int) -> None:
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    seed = SQLiteConnection(db_path)
+    contexts = MemContextsStore(seed)
+    primary = MemPrimaryStore(seed)
+
+    memory_id = f"bench_{uuid.uuid4().hex[:8]}"
+    primary.upsert(memory_id)
+    for i in range(rows):
+        url = f"bench/{memory_id}/{i}.json"
+        contexts.create(
+            uid=uuid.uuid4().hex[:16],
+            memory_id=memory_id,
+            app="bench",
+            url=url,
+            content_sha256=hashlib.sha256(url.encode()).hexdigest(),
+        )
+    seed.close()
+
+    for read_pool in (False, True):
+        conn = SQLiteConnection(db_path, read_pool=read_pool)
+        c_store, p_store = MemContextsStore(conn), MemPrimaryStore(conn)
+
+        def query():
+            p_store.get(memory_id)
+            c_store.list_by_memory(memory_id, limit=12)
+
+        for c in CONCURRENCY:
+            _print("read_pool=" + str(read_pool).lower(), _run(query, c, requests))
+        conn.close()
+
+
+def bench_http(base_url: str, memory_id: str, app: str, query: str, requests: int) -> None:
+    import httpx
+
+    with httpx.Client(base_url=base_url, timeout=120.0) as client:
+        payload = {"memory_id": memory_id, "app": app, "query": query}
+
+        def call():
+            client.post("/memory/query", json=payload).raise_for_status()
+
+        for c in CONCURRENCY:
+            _print("http", _run(call, c, requests))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["sqlite", "http"], default="sqlite")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--rows", type=int, default=500, help="sqlite 模式预置的上下文条数")
+    ap.add_argument("--base-url", default="http://localhost:8001")
+    ap.add_argument("--memory-id", default="")
+    ap.add_argument("--app", default="default")
+    ap.add_argument("--query", default="总结一下我们之前聊了什么")
+    args = ap.parse_args()
+
+    if args.mode == "sqlite":
+        bench_sqlite(args.requests, args.rows)
+    else:
+        if not args.memory_id:
+            raise SystemExit("--memory-id 必填（http 模式）")
+        bench_http(args.base_url, args.memory_id, args.app, args.query, args.requests)
@@ -0,0 +1,154 @@
+# rag/api/container.py
+# -*- coding: utf-8 -*-
+"""
+Container: 进程内共享的长生命周期组件（应用启动时装配一次）
+- ds（Datasource）/ embedder / llm / memory（MemoryManager）/ pipeline（RAGPipeline）
+- 组件按需构建并缓存；build() 一次性构建全部（启动阶段调用，配置缺失时尽早暴露）
+- warmup()：预热连接与首请求才会加载的资源，避免发布后第一个请求最慢：
+  SQLite 读连接、Weaviate（就绪检查 + collection schema）、MinIO bucket、JD collection、
+  embedding 模型（一次短文本 embedding，同时建立 HTTP 连接池）、tokenizer、重排模型
+- rag/api/deps.py 的依赖函数都从同一个 Container 取组件，路由不再逐请求构建
+"""
+
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from rag.core.context_packer import get_tokenizer
+from rag.core.pipeline import RAGPipeline
+from rag.core.rerank import get_reranker
+from rag.datasource.base import Datasource
+from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
+from rag.llm.providers.openai_client import OpenAIClient
+from rag.memory.auxiliary_memory import AUX_COLLECTION
+from rag.memory.memory_manager import MemoryManager
+from rag.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+COMPONENTS = ("ds", "embedder", "llm", "memory", "pipeline")
+
+
+class Container:
+    def __init__(self, settings, **overrides: Any):
+        """
+        :param settings: rag.api.deps.Settings
+        :param overrides: 预先构建好的组件（如测试替身），键为 COMPONENTS 之一
+        """
+        unknown = set(overrides) - set(COMPONENTS)
+        if unknown:
+            raise ValueError(f"unknown components: {sorted(unknown)}")
+        self.settings = settings
+        self._components: Dict[str, Any] = dict(overrides)
+        self._lock = threading.RLock()
+        self.warmup_report: Optional[Dict[str, Dict[str, Any]]] = None
+
+    # ===================== 组件 =====================
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        comp = self._components.get(name)
+        if comp is None:
+            with self._lock:
+                comp = self._components.get(name)
+                if comp is None:
+                    comp = self._components[name] = factory()
+        return comp
+
+    @property
+    def ds(self) -> Datasource:
+        return self._get("ds", Datasource)
+
+    @property
+    def embedder(self) -> OpenAIEmbedder:
+        return self._get("embedder", OpenAIEmbedder)
+
+    @property
+    def llm(self) -> OpenAIClient:
+        s = self.settings
+        return self._get(
+            "llm",
+            lambda: OpenAIClient(model=s.openai_model, api_base=s.openai_api_base, api_key=s.openai_api_key),
+        )
+
+    @property
+    def memory(self) -> MemoryManager:
+        # 摘要与问答共用同一个 LLM 客户端（连接池复用）
+        return self._get("memory", lambda: MemoryManager(self.ds, embedder=self.embedder, llm=self.llm))
+
+    @property
+    def pipeline(self) -> RAGPipeline:
+        return self._get("pipeline", lambda: RAGPipeline(self.ds, self.memory, self.llm))
+
+    def build(self) -> "Container":
+        """构建全部组件"""
+        for name in COMPONENTS:
+            getattr(self, name)
+        return self
+
+    # ===================== 预热 =====================
+
+    def warmup(self) -> Dict[str, Dict[str, Any]]:
+        """
+        逐项预热，单项失败只记录不抛出；返回 {项: {"status": ok/skipped/error, "ms": 耗时, "error"?}}
+        """
+        steps = [
+            ("sqlite", self._warm_sqlite),
+            ("weaviate", self._warm_weaviate),
+            ("minio", self._warm_minio),
+            ("jd_collection", self._warm_jd),
+            ("embedding", self._warm_embedding),
+            ("tokenizer", lambda: get_tokenizer().count("warmup")),
+            ("reranker", self._warm_reranker),
+        ]
+        report: Dict[str, Dict[str, Any]] = {}
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            try:
+                status = "skipped" if fn() is False else "ok"
+                report[name] = {"status": status}
+            except Exception as e:
+                logger.warning("warmup %s failed: %s", name, e)
+                report[name] = {"status": "error", "error": str(e)}
+            report[name]["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        self.warmup_report = report
+        logger.info("warmup done: %s", {k: (v["status"], v["ms"]) for k, v in report.items()})
+        return report
+
+    def _warm_sqlite(self) -> None:
+        self.ds.sqlite_conn.query_one("SELECT 1 AS ok")
+
+    def _warm_weaviate(self) -> Optional[bool]:
+        if self.ds.weaviate is None:
+            return False
+        client = self.ds.weaviate.client
+        if not client.is_ready():
+            raise RuntimeError("weaviate not ready")
+        client.collections.get(AUX_COLLECTION).config.get()
+
+    def _warm_minio(self) -> Optional[bool]:
+        if self.ds.minio is None:
+            return False
+        self.ds.minio.client.bucket_exists(self.ds.minio.default_bucket)
+
+    def _warm_jd(self) -> Optional[bool]:
+        if self.ds.weaviate is None:
+            return False
+        self.pipeline.jd_retriever()
+
+    def _warm_embedding(self) -> None:
+        self.embedder.embed_query("warmup")
+
+    def _warm_reranker(self) -> Optional[bool]:
+        return None if get_reranker() is not None else False
+
+    # ===================== 关闭 =====================
+
+    def close(self) -> None:
+        for name in ("pipeline", "memory", "llm", "embedder", "ds"):
+            comp = self._components.get(name)
+            if comp is not None and hasattr(comp, "close"):
+                try:
+                    comp.close()
+                except Exception as e:
+                    logger.warning("close %s failed: %s", name, e)
@@ -40,24 +40,31 @@ class Settings(BaseModel):
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
 
-from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
-
-@lru_cache(maxsize=32)
-def get_embedder() -> OpenAIEmbedder:
-    return OpenAIEmbedder()
-
 # 单例 Settings
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
     return Settings()
 
-# ===== Datasource =====
+# ===== 组件容器（进程内唯一，应用启动时装配 + 预热，见 rag/api/container.py） =====
+from rag.api.container import Container
+from rag.core.pipeline import RAGPipeline
 from rag.datasource.base import Datasource
+from rag.datasource.vectorstores.weaviate_store import WeaviateStore
+from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
+from rag.llm.providers.openai_client import OpenAIClient
+from rag.memory.memory_manager import MemoryManager
 
 @lru_cache(maxsize=1)
+def get_container() -> Container:
+    return Container(get_settings())
+
+def get_embedder() -> OpenAIEmbedder:
+    return get_container().embedder
+
+# ===== Datasource =====
 def get_datasource() -> Datasource:
     s = get_settings()
-    ds = Datasource()
+    ds = get_container().ds
 
     # 如果服务被禁用，可以在这里直接报错
     if s.weaviate_enabled is False and ds.weaviate is None:
@@ -67,23 +74,21 @@ def get_datasource() -> Datasource:
 
     return ds
 
-# ===== MemoryManager =====
-from rag.memory.memory_manager import MemoryManager
+# ===== 知识库 WeaviateStore =====
+def get_weaviate_store() -> WeaviateStore:
+    """Datasource 的 WeaviateStore（默认 collection 为 WEAVIATE_COLLECTION，写入其它 collection 时按参数指定）"""
+    return get_datasource().weaviate
 
-@lru_cache(maxsize=32)
+# ===== MemoryManager =====
 def get_memory_manager() -> MemoryManager:
-    ds = get_datasource()
-    embedder = get_embedder()
-    return MemoryManager(ds, embedder=embedder)
+    get_datasource()  # 数据源被禁用时直接 503
+    return get_container().memory
 
 # ===== LLM Client =====
-from rag.llm.providers.openai_client import OpenAIClient
-
-@lru_cache(maxsize=32)
 def get_llm() -> OpenAIClient:
-    s = get_settings()
-    return OpenAIClient(
-        model=s.openai_model,
-        api_base=s.openai_api_base,
-        api_key=s.openai_api_key,
-    )
+    return get_container().llm
+
+# ===== RAGPipeline =====
+def get_pipeline() -> RAGPipeline:
+    get_datasource()
+    return get_container().pipeline
@@ -2,13 +2,63 @@
 # -*- coding: utf-8 -*-
 """
 FastAPI 主应用
-- 挂载 memory 路由
+- 挂载 memory / query / kb 路由（kb 上传的 collection 通过 RAG_KB_COLLECTIONS 接入问答检索）
 - 提供健康检查
+- 启动时装配组件容器（rag/api/container.py），RAG_WARMUP=true（默认）时预热连接与模型后再接收请求
+- RAG_INPROC_WORKER=true（默认）时随应用启动后台摘要 worker；
+  多副本部署建议关闭，改用独立进程 python -m rag.workers.ingest_worker
+- 每个请求开启一条 trace（rag/utils/tracing.py）：响应头 X-Trace-Id / Server-Timing，
+  慢请求（RAG_SLOW_REQUEST_MS，默认 2000）输出 span 树日志
+- 每个请求设置截止时间（rag/utils/deadline.py）：请求头 X-Request-Timeout-Ms 或 RAG_REQUEST_TIMEOUT_MS，
+  可选阶段按剩余时间降级（响应头 X-Degraded 列出被降级的阶段），必需阶段超时返回 504
+- GET /metrics：Prometheus 指标（rag/utils/metrics.py），RAG_METRICS_ENABLED=false 关闭
 """
 
-from fastapi import FastAPI
-from rag.api.deps import get_settings
-from rag.api.routers import memory, query, health
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from rag.api.deps import get_settings, get_container
+from rag.api.routers import memory, query, health, kb
+from rag.utils.logging import get_logger
+from rag.utils import deadline, metrics
+from rag.utils.tracing import start_trace
+
+logger = get_logger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    container = get_container()
+    try:
+        container.build()
+    except Exception as e:  # 配置缺失时不阻塞启动，相关接口在请求时报错
+        logger.warning("container build incomplete: %s", e)
+    if os.getenv("RAG_WARMUP", "true").lower() == "true":
+        await asyncio.to_thread(container.warmup)
+
+    worker = None
+    if os.getenv("RAG_INPROC_WORKER", "true").lower() == "true":
+        try:
+            from rag.workers.ingest_worker import build_worker
+
+            worker = build_worker(container.memory)
+            worker.start()
+        except Exception as e:  # 数据源不可用时不阻塞 API 启动
+            logger.warning("in-process ingest worker not started: %s", e)
+            worker = None
+    yield
+    if worker is not None:
+        worker.stop()
+    container.close()
+    get_container.cache_clear()
+
+
+def _queue_depths():
+    """mem_jobs 队列深度（抓取 /metrics 时查询；只依赖 SQLite）"""
+    return get_container().ds.mem_jobs.count_by_kind_status()
 
 
 def create_app() -> FastAPI:
@@ -18,8 +68,48 @@ def create_app() -> FastAPI:
         version=settings.service_version,
         docs_url="/docs",
         redoc_url="/redoc",
+        lifespan=lifespan,
     )
 
+    slow_ms = float(os.getenv("RAG_SLOW_REQUEST_MS", "2000"))
+    metrics_enabled = os.getenv("RAG_METRICS_ENABLED", "true").lower() == "true"
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        budget_ms = deadline.request_budget_ms(request.headers.get(deadline.HEADER))
+        with start_trace(f"{request.method} {request.url.path}") as root, deadline.start_deadline(budget_ms) as dl:
+            response = await call_next(request)
+            root.set(status=response.status_code)
+            if dl is not None and dl.degraded:
+                root.set(degraded=[d["stage"] for d in dl.degraded])
+                response.headers["X-Degraded"] = ",".join(d["stage"] for d in dl.degraded)
+        if metrics_enabled:
+            # 按路由模板（如 /memory/jobs/{job_id}）聚合，未匹配的路径归为一类，避免标签爆炸
+            route = request.scope.get("route")
+            metrics.observe_request(
+                request.method,
+                getattr(route, "path", "unmatched"),
+                response.status_code,
+                root.duration_ms / 1000.0,
+            )
+        response.headers["X-Trace-Id"] = root.trace_id
+        response.headers["Server-Timing"] = f"total;dur={root.duration_ms}"
+        if root.duration_ms > slow_ms:
+            logger.warning("slow request %s %.1fms: %s", root.name, root.duration_ms, root.to_dict())
+        return response
+
+    @app.exception_handler(deadline.DeadlineExceeded)
+    async def deadline_exceeded(request: Request, exc: deadline.DeadlineExceeded):
+        return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+    if metrics_enabled:
+        metrics.install()
+        metrics.QUEUE_JOBS.set_function(_queue_depths)
+
+        @app.get("/metrics", include_in_schema=False)
+        def prometheus_metrics():
+            return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
     # 健康检查
     app.include_router(health.router)
     # 挂载路由
@@ -27,6 +117,7 @@ def create_app() -> FastAPI:
     # app.include_router(debug.router)
 
     app.include_router(query.router)
+    app.include_router(kb.router)
     return app
 
 
@@ -1,7 +1,7 @@
 # rag/api/routers/health.py
 from fastapi import APIRouter, Depends
 from datetime import datetime
-from rag.api.deps import get_settings, Settings
+from rag.api.deps import get_settings, get_container, Settings
 from rag.datasource.connections.weaviate_connection import WeaviateConnection
 from rag.datasource.connections.minio_connection import MinioConnection
 from rag.utils.logging import get_logger
@@ -51,5 +51,9 @@ def health(settings: Settings = Depends(get_settings)):
     else:
         result["dependencies"]["minio"] = {"status": "disabled", "details": "MINIO_ENABLED=false"}
 
+    # 启动预热结果（未预热时不返回）
+    if get_container().warmup_report is not None:
+        result["warmup"] = get_container().warmup_report
+
     logger.info("Health check result: %s", result)
     return result
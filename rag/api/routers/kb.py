@@ -3,21 +3,29 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from rag.core.schemas import UpsertRequest, UpsertResponse, UploadTextResponse
+from rag.core.schemas import UpsertRequest, UpsertResponse
 from rag.api.deps import get_embedder, get_weaviate_store
+from rag.datasource.vectorstores.weaviate_store import WeaviateStore, _norm_class
 from rag.utils.text_splitter import simple_split
-router = APIRouter()
+router = APIRouter(prefix="/kb", tags=["KB"])
+
+
+def _kb_collection(store: WeaviateStore, collection: Optional[str]) -> str:
+    """规范化 collection 名称并确保存在（默认 store.collection）；问答检索需把它加入 RAG_KB_COLLECTIONS"""
+    name = _norm_class(collection or store.collection)
+    store.ensure_collection(name)
+    return name
 
 
 
 @router.post("/upload", response_model=UpsertResponse, summary="上传文本并入库（进入向量数据库）")
-def kb_upload(req: UpsertRequest, embedder=Depends(get_embedder)):
+def kb_upload(req: UpsertRequest, embedder=Depends(get_embedder), store: WeaviateStore = Depends(get_weaviate_store)):
     if not req.texts:
         raise HTTPException(status_code=400, detail="texts 不能为空")
     vectors = embedder.embed_documents(req.texts)
-    store = get_weaviate_store(req.collection)
-    ids = store.add_texts(req.texts, vectors, req.metadatas)
-    return UpsertResponse(collection=store.collection, count=len(ids), ids=ids)
+    collection = _kb_collection(store, req.collection)
+    ids = store.add_texts(req.texts, vectors, req.metadatas, collection=collection)
+    return UpsertResponse(collection=collection, count=len(ids), ids=ids)
 
 
 @router.post("/upload_file", summary="上传可编辑文本（.md/.txt）→ 切分 → 入库")
@@ -27,6 +35,7 @@ async def kb_upload_text(
     chunk_size: int = Form(1024),
     overlap: int = Form(150),
     embedder = Depends(get_embedder),
+    store: WeaviateStore = Depends(get_weaviate_store),
 ):
     # 1) 校验扩展名
     name = (file.filename or "upload.txt").strip()
@@ -59,11 +68,11 @@ async def kb_upload_text(
 
     # 4) 嵌入 & 入库
     vectors = embedder.embed_documents(chunk_texts)
-    store = get_weaviate_store(collection)
-    ids = store.add_texts(chunk_texts, vectors, metadatas)
+    collection = _kb_collection(store, collection)
+    ids = store.add_texts(chunk_texts, vectors, metadatas, collection=collection)
 
     return {
-        "collection": store.collection,
+        "collection": collection,
         "filename": name,
         "chunks": len(ids),
         "ids": ids[:10],  # 返回前 10 个以免响应过大
@@ -1,21 +1,28 @@
 # rag/api/routers/memory.py
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, Depends
+import os
+from typing import Optional
 
-from rag.api.deps import get_memory_manager, get_llm, get_datasource
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from rag.api.deps import get_memory_manager, get_pipeline
 from rag.core.pipeline import RAGPipeline
 from rag.memory.memory_manager import MemoryManager
-from rag.llm.providers.openai_client import OpenAIClient
 from rag.core.schemas import (
     CreateReq, CreateResp,
     PushReq, PushResp,
+    PushBatchReq, PushBatchResp,
     QueryReq, QueryResp,
     DeleteReq, DeleteResp,
     ClearReq, ClearResp,
+    JobResp, JobListResp,
 )
 
 router = APIRouter(prefix="/memory", tags=["Memory"])
 
+# 单次 push_batch 的最大条数
+MAX_PUSH_BATCH = int(os.getenv("RAG_PUSH_BATCH_MAX", "500"))
+
 
 @router.post("/create", response_model=CreateResp)
 def create_memory(req: CreateReq, memory: MemoryManager = Depends(get_memory_manager)):
@@ -25,19 +32,28 @@ def create_memory(req: CreateReq, memory: MemoryManager = Depends(get_memory_man
 
 @router.post("/push", response_model=PushResp)
 def push_message(req: PushReq, memory: MemoryManager = Depends(get_memory_manager)):
+    if memory.ingest_mode == "queue":
+        # 只入队 ingest 任务，row 为任务行（可用 GET /memory/jobs/{job_id} 查询进度）
+        job = memory.enqueue_ingest(req.memory_id, req.app, req.url, req.description)
+        return {"status": "queued", "row": job}
     row = memory.push_message(req.memory_id, req.app, req.url, req.description)
     return {"status": "ok", "row": row}
 
 
+@router.post("/push_batch", response_model=PushBatchResp)
+def push_batch(req: PushBatchReq, memory: MemoryManager = Depends(get_memory_manager)):
+    if len(req.items) > MAX_PUSH_BATCH:
+        raise HTTPException(status_code=413, detail=f"items 超过上限 {MAX_PUSH_BATCH}")
+    result = memory.push_messages(req.memory_id, req.app, [it.model_dump() for it in req.items])
+    return {"status": "ok", **result}
+
+
 @router.post("/query", response_model=QueryResp)
 def query_memory(
     req: QueryReq,
-    memory: MemoryManager = Depends(get_memory_manager),
-    llm: OpenAIClient = Depends(get_llm),
-    ds=Depends(get_datasource),
+    pipeline: RAGPipeline = Depends(get_pipeline),
 ):
-    pipeline = RAGPipeline(ds, memory, llm)
-    result = pipeline.run(req.memory_id, req.app, req.query)
+    result = pipeline.run(req.memory_id, req.app, req.query, max_tokens=req.max_tokens, debug=req.debug)
     return result
 
 
@@ -51,3 +67,36 @@ def delete_message(req: DeleteReq, memory: MemoryManager = Depends(get_memory_ma
 def clear_memory(req: ClearReq, memory: MemoryManager = Depends(get_memory_manager)):
     deleted = memory.clear_memory(req.memory_id, req.app)
     return {"deleted": deleted}
+
+
+@router.get("/jobs/{job_id}", response_model=JobResp)
+def get_job(job_id: str, memory: MemoryManager = Depends(get_memory_manager)):
+    job = memory.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    return job
+
+
+@router.get("/jobs", response_model=JobListResp)
+def list_jobs(
+    memory_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="按状态过滤，如 dead（死信）"),
+    kind: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=200),
+    memory: MemoryManager = Depends(get_memory_manager),
+):
+    if status:
+        return {"jobs": memory.list_jobs_by_status(status, kind=kind, limit=limit)}
+    if not memory_id:
+        raise HTTPException(status_code=422, detail="memory_id 与 status 至少提供一个")
+    return {"jobs": memory.list_jobs(memory_id, limit=limit)}
+
+
+@router.post("/jobs/{job_id}/requeue", response_model=JobResp)
+def requeue_job(job_id: str, memory: MemoryManager = Depends(get_memory_manager)):
+    job = memory.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    if not memory.requeue_job(job_id):
+        raise HTTPException(status_code=409, detail=f"job {job_id} 状态为 {job['status']}，无法重新排队")
+    return memory.get_job(job_id)
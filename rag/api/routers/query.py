@@ -7,12 +7,11 @@ RAG 通用查询接口（支持面试官模式）
 """
 from typing import Optional, Union
 from fastapi import APIRouter, HTTPException, Body, Depends
-from functools import lru_cache
 
-# 依赖与核心组件
-from rag.api.deps import get_memory_manager, get_datasource
-from rag.llm.providers.openai_client import OpenAIClient
+# 依赖与核心组件（均为容器内共享实例，见 rag/api/container.py）
+from rag.api.deps import get_datasource, get_pipeline
 from rag.core.pipeline import RAGPipeline
+from rag.utils.deadline import DeadlineExceeded
 from rag.core.schemas import (
     QueryReq,
     QueryResp,
@@ -23,13 +22,6 @@ from rag.core.schemas import (
 router = APIRouter()
 
 
-# ---------- 单例缓存 ----------
-@lru_cache(maxsize=1)
-def get_llm() -> OpenAIClient:
-    """缓存 LLM 实例，避免重复初始化"""
-    return OpenAIClient()
-
-
 # ---------- RAG 主接口 ----------
 @router.post(
     "/query",
@@ -38,9 +30,7 @@ def get_llm() -> OpenAIClient:
 )
 def query_rag(
     req: Union[QueryReq, InterviewQueryReq] = Body(...),
-    ds=Depends(get_datasource),
-    memory=Depends(get_memory_manager),
-    llm: OpenAIClient = Depends(get_llm),
+    pipeline: RAGPipeline = Depends(get_pipeline),
 ):
     """
     通用 RAG 查询接口
@@ -48,10 +38,6 @@ def query_rag(
     - app=default → 普通问答
     - app=interviewer → 生成面试题（只输出问题，不输出答案）
     """
-
-
-    pipeline = RAGPipeline(ds=ds, memory=memory, llm=llm)
-
     try:
         # interviewer 模式：生成面试题
         if req.app.lower() == "interviewer":
@@ -66,7 +52,8 @@ def query_rag(
                 target_position=getattr(req, "target_position", None),
                 jd_top_k=getattr(req, "jd_top_k", 3),
                 memory_top_k=getattr(req, "memory_top_k", 3),
-                max_chars=getattr(req, "max_chars", 4000),
+                max_tokens=getattr(req, "max_tokens", None),
+                debug=getattr(req, "debug", None),
             )
             return InterviewQueryResp(
                 app="interviewer",
@@ -85,13 +72,16 @@ def query_rag(
                 summary_k=getattr(req, "summary_k", 1),
                 recent_k=getattr(req, "recent_k", 6),
                 aux_top_k=getattr(req, "aux_top_k", 5),
-                max_chars=getattr(req, "max_chars", 4000),
+                max_tokens=getattr(req, "max_tokens", None),
+                debug=getattr(req, "debug", None),
             )
             return QueryResp(
                 answer=result["answer"],
                 context_used=result.get("context_used"),
             )
 
+    except DeadlineExceeded:
+        raise   # 由 main.py 的异常处理返回 504
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG 执行失败: {e}")
 
@@ -0,0 +1,249 @@
+# rag/core/context_packer.py
+# -*- coding: utf-8 -*-
+"""
+ContextPacker: 按 token 预算拼装 prompt 上下文
+- Tokenizer 可插拔：默认优先 tiktoken（已安装且编码可加载时），否则用中英文启发式估算
+- 去重：规范化文本的哈希相同只保留得分最高的一条；同一 url 已被前序来源整篇收录时，
+  后续来源的片段（如辅助记忆命中的单条 QA）不再重复放入
+- 分来源预算：summary / recent / retrieved / kb / jd 按比例分配，来源内按 score 贪心填充
+  （放不下的跳过、继续尝试后面的条目，而不是整体截断）；各来源剩余额度最后统一回收再分配
+- 输出保持来源顺序（摘要 → 最近 → 检索 → 知识库 → JD）与来源内原始顺序，一次 join 生成上下文
+
+环境变量：
+- RAG_TOKENIZER：auto（默认）/ tiktoken / heuristic
+- RAG_TOKENIZER_ENCODING：tiktoken 编码名，默认 cl100k_base
+- RAG_CONTEXT_MAX_TOKENS：默认上下文预算，默认 2000
+"""
+
+from __future__ import annotations
+import hashlib
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Protocol
+
+SOURCES = ("summary", "recent", "retrieved", "kb", "jd")
+
+# 各来源默认预算占比（未出现的来源不占额度，其份额在回收阶段分给其它来源）
+DEFAULT_SHARES: Dict[str, float] = {
+    "summary": 0.25,
+    "recent": 0.35,
+    "retrieved": 0.30,
+    "kb": 0.30,
+    "jd": 0.10,
+}
+
+SEPARATOR = "\n\n"
+
+_CJK = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WS = re.compile(r"\s+")
+
+
+# ===================== Tokenizer =====================
+
+class Tokenizer(Protocol):
+    def count(self, text: str) -> int: ...
+
+    def truncate(self, text: str, max_tokens: int) -> str: ...
+
+
+class HeuristicTokenizer:
+    """无依赖估算：CJK 字符按 1 token，其余字符按 4 个 1 token"""
+
+    @staticmethod
+    def _cost(ch: str) -> float:
+        return 1.0 if _CJK.match(ch) else 0.25
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(_CJK.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        used = 0.0
+        for i, ch in enumerate(text):
+            used += self._cost(ch)
+            if math.ceil(used) > max_tokens:
+                return text[:i]
+        return text
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken
+        self.enc = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self.enc.encode(text, disallowed_special=())) if text else 0
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        tokens = self.enc.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else self.enc.decode(tokens[:max_tokens])
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer() -> Tokenizer:
+    """按 RAG_TOKENIZER 返回进程内共享的 tokenizer；tiktoken 不可用时回落启发式"""
+    kind = os.getenv("RAG_TOKENIZER", "auto").lower()
+    if kind in ("auto", "tiktoken"):
+        try:
+            return TiktokenTokenizer(os.getenv("RAG_TOKENIZER_ENCODING", "cl100k_base"))
+        except Exception:
+            if kind == "tiktoken":
+                raise
+    return HeuristicTokenizer()
+
+
+def default_max_tokens() -> int:
+    return int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "2000"))
+
+
+# ===================== 数据结构 =====================
+
+@dataclass
+class ContextItem:
+    text: str
+    source: str                     # summary / recent / retrieved / kb / jd
+    score: float = 0.0              # 来源内填充优先级，越大越先放
+    url: Optional[str] = None       # 用于跨来源去重（整篇正文已收录时跳过其片段）
+    tokens: int = 0                 # 由 packer 计算
+    order: int = 0                  # 来源内原始顺序，由 packer 计算
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    items: List[ContextItem] = field(default_factory=list)
+    dropped: int = 0                # 因预算放不下而丢弃的条目数
+    duplicates: int = 0             # 因去重丢弃的条目数
+
+    def text_of(self, *sources: str) -> str:
+        """只取指定来源的条目（保持拼装顺序）"""
+        return SEPARATOR.join(it.text for it in self.items if it.source in sources)
+
+    def stats(self) -> Dict[str, object]:
+        used: Dict[str, int] = {}
+        for it in self.items:
+            used[it.source] = used.get(it.source, 0) + it.tokens
+        return {"tokens": self.tokens, "by_source": used, "dropped": self.dropped, "duplicates": self.duplicates}
+
+
+# ===================== Packer =====================
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(_WS.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        shares: Optional[Dict[str, float]] = None,
+        min_truncate_tokens: int = 64,
+    ):
+        """
+        :param tokenizer: token 计数器，默认 get_tokenizer()
+        :param shares: 各来源预算占比，默认 DEFAULT_SHARES
+        :param min_truncate_tokens: 剩余额度不少于该值时，放不下的最高分条目截断后放入
+        """
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.shares = dict(shares or DEFAULT_SHARES)
+        self.min_truncate_tokens = min_truncate_tokens
+        self._sep_tokens = self.tokenizer.count(SEPARATOR)
+
+    def count(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def pack(self, items: Iterable[ContextItem], max_tokens: Optional[int] = None) -> PackedContext:
+        budget = default_max_tokens() if max_tokens is None else max_tokens
+
+        # 1) 哈希去重（保留得分最高的一条）
+        by_hash: Dict[str, ContextItem] = {}
+        candidates: List[ContextItem] = []
+        duplicates = 0
+        for i, it in enumerate(items):
+            if not it.text or not it.text.strip():
+                continue
+            it.order = i
+            key = _fingerprint(it.text)
+            kept = by_hash.get(key)
+            if kept is not None:
+                duplicates += 1
+                if it.score > kept.score:
+                    candidates[candidates.index(kept)] = it
+                    by_hash[key] = it
+                continue
+            by_hash[key] = it
+            candidates.append(it)
+        for it in candidates:
+            it.tokens = self.tokenizer.count(it.text) + self._sep_tokens
+
+        # 2) 分来源预算（只在出现的来源之间按比例分配）
+        present = [s for s in SOURCES if any(it.source == s for it in candidates)]
+        present += sorted({it.source for it in candidates} - set(present))
+        total_share = sum(self.shares.get(s, 0.0) for s in present) or 1.0
+        quota = {s: int(budget * self.shares.get(s, 0.0) / total_share) for s in present}
+
+        ranked = {
+            s: sorted((it for it in candidates if it.source == s), key=lambda x: (-x.score, x.order))
+            for s in present
+        }
+        selected: List[ContextItem] = []
+        urls: Dict[str, str] = {}           # url -> 收录它的来源
+        left = budget
+
+        def _covered(it: ContextItem) -> bool:
+            return bool(it.url) and urls.get(it.url, it.source) != it.source
+
+        def _take(it: ContextItem) -> None:
+            nonlocal left
+            selected.append(it)
+            left -= it.tokens
+            if it.url:
+                urls.setdefault(it.url, it.source)
+
+        # 3) 来源内贪心：放不下的跳过，继续尝试后面的条目
+        rest: List[ContextItem] = []
+        for s in present:
+            for it in ranked[s]:
+                if _covered(it):
+                    duplicates += 1
+                elif it.tokens <= quota[s] and it.tokens <= left:
+                    quota[s] -= it.tokens
+                    _take(it)
+                else:
+                    rest.append(it)
+
+        # 4) 回收：剩余总额度按得分分给此前放不下的条目，最高分的超长条目可截断放入
+        dropped = 0
+        for it in sorted(rest, key=lambda x: (-x.score, SOURCES.index(x.source) if x.source in SOURCES else 99)):
+            if _covered(it):
+                duplicates += 1
+            elif it.tokens <= left:
+                _take(it)
+            elif left - self._sep_tokens >= self.min_truncate_tokens:
+                it.text = self.tokenizer.truncate(it.text, left - self._sep_tokens)
+                it.tokens = self.tokenizer.count(it.text) + self._sep_tokens
+                _take(it)
+            else:
+                dropped += 1
+
+        # 5) 来源顺序 + 原始顺序输出，一次 join
+        order = {s: i for i, s in enumerate(present)}
+        selected.sort(key=lambda x: (order[x.source], x.order))
+        text = SEPARATOR.join(it.text for it in selected)
+        return PackedContext(
+            text=text,
+            tokens=budget - left,
+            items=selected,
+            dropped=dropped,
+            duplicates=duplicates,
+        )
@@ -1,62 +1,230 @@
 # rag/core/pipeline.py
 # -*- coding: utf-8 -*-
 """
-RAGPipeline: 结合主记忆 + 辅助记忆 + 知识库（预留）
+RAGPipeline: 结合主记忆 + 辅助记忆 + 知识库
 - run(): 给定 query，拼接上下文，调用 LLM，返回答案
+- 知识库阶段（rag/core/retriever_kb.py，RAG_KB_COLLECTIONS 配置后启用）：embedding 模型与该 memory 一致时
+  与辅助记忆共用同一个 query 向量，否则用知识库自己的 embedder 另算；
+  多个 collection 并发检索、与记忆检索重叠进行，超出延迟预算的 collection 跳过
+- 请求截止时间（rag/utils/deadline.py）：辅助检索 / 知识库 / JD 检索 / 正文补齐在剩余时间不足时跳过或截断，
+  context_used.degraded 列出被降级的阶段；LLM 生成前已超时则抛 DeadlineExceeded
+- 上下文按 token 预算由 ContextPacker 拼装（分来源预算、去重、按得分填充）
+- 各阶段记为 span（rag/utils/tracing.py）；debug="timing" 时 context_used.trace 附带本次请求的 span 树
+- run() 可选语义答案缓存（MemoryManager.answers）：同一 memory、同一上下文版本下近似的问题直接返回上次答案
+- 实例为长生命周期组件（rag/api/container.py 启动时装配一次），JD 检索复用同一个 WeaviateStore / embedder
+- 简历按 url + ETag 只解析一次（rag/workers/resume_state.py），技能 / 项目文本块与简历 embedding 直接复用
 """
 import json
 import re
-from typing import Dict, Any, List
+import threading
+from typing import Dict, Any, List, Optional
 from rag.datasource.base import Datasource
 from rag.memory.memory_manager import MemoryManager
 from rag.llm.providers.openai_client import OpenAIClient
+from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
+from rag.datasource.vectorstores.weaviate_store import WeaviateStore
 from rag.core.retriever_jd import JDRetriever
+from rag.core.retriever_kb import KBRetriever
+from rag.core.context_packer import ContextItem, ContextPacker
+from rag.memory.answer_cache import answer_params_key
+from rag.utils import deadline
+from rag.utils.logging import get_logger
+from rag.utils.tracing import span, trace_tree
+from rag.workers.resume_state import ResumeStateService
+
+logger = get_logger(__name__)
+
+JD_COLLECTION = "InterviewerJDKnowledge"
+
 
 class RAGPipeline:
-    def __init__(self, ds: Datasource, memory: MemoryManager, llm: OpenAIClient):
+    def __init__(
+        self,
+        ds: Datasource,
+        memory: MemoryManager,
+        llm: OpenAIClient,
+        packer: Optional[ContextPacker] = None,
+        jd_embedder: Optional[OpenAIEmbedder] = None,
+        resumes: Optional[ResumeStateService] = None,
+        kb: Optional[KBRetriever] = None,
+    ):
         """
         :param ds: Datasource 实例（封装 minio / weaviate / registry / primary / contexts）
         :param memory: MemoryManager 实例
         :param llm: LLM 客户端（默认用 OpenAIClient，可换）
+        :param packer: 上下文拼装器（默认按 RAG_TOKENIZER 选择 tokenizer）
+        :param jd_embedder: JD 检索用 embedder（默认首次检索时创建并复用）
+        :param resumes: 简历状态服务（默认基于 ds.minio + ds.resume_states，简历 embedding 与 JD 检索同一 embedder）
+        :param kb: 知识库检索器（默认读取 RAG_KB_COLLECTIONS，使用 ds.weaviate）
         """
         self.ds = ds
         self.memory = memory
         self.llm = llm
-
-    def _fetch_texts(self, urls: List[str]) -> List[str]:
+        self.packer = packer or ContextPacker()
+        self.jd_embedder = jd_embedder
+        self._jd_store: Optional[WeaviateStore] = None
+        self._jd_lock = threading.Lock()
+        self.resumes = resumes or ResumeStateService(
+            getattr(ds, "minio", None),
+            store=getattr(ds, "resume_states", None),
+            embedder=self._get_jd_embedder,
+        )
+        self.kb = kb or KBRetriever(lambda: getattr(ds, "weaviate", None))
+
+    def _get_jd_embedder(self) -> OpenAIEmbedder:
+        if self.jd_embedder is None:
+            with self._jd_lock:
+                if self.jd_embedder is None:
+                    self.jd_embedder = OpenAIEmbedder()
+        return self.jd_embedder
+
+    def jd_retriever(self, company: Optional[str] = None) -> JDRetriever:
+        """JD 检索器：WeaviateStore（复用 ds 的 Weaviate 连接）与 embedder 首次使用时创建，之后共享"""
+        embedder = self._get_jd_embedder()
+        if self._jd_store is None:
+            with self._jd_lock:
+                if self._jd_store is None:
+                    self._jd_store = WeaviateStore(
+                        collection=JD_COLLECTION, conn=getattr(self.ds, "weaviate_conn", None)
+                    )
+        return JDRetriever(collection=JD_COLLECTION, company=company, store=self._jd_store, embedder=embedder)
+
+    def _fetch_texts(self, urls: List[str], known: Optional[Dict[str, str]] = None) -> List[str]:
         """
-        从 MinIO 拉取一批 url 对应的正文
+        拉取一批 url 对应的正文：优先使用 known（SQLite 内联正文），其余回落 MinIO
         """
+        known = known or {}
         texts = []
         for url in urls:
+            if url in known:
+                texts.append(known[url])
+                continue
+            if not deadline.allow("fetch_bodies"):
+                texts.append("")   # 剩余时间不足：不再补读，空正文不会进入上下文
+                continue
             try:
                 texts.append(self.ds.minio.get_text(url))
             except Exception as e:
                 texts.append(f"[读取失败: {url}, 错误: {e}]")
         return texts
 
+    def close(self) -> None:
+        """释放知识库检索线程池（应用关闭时调用）"""
+        self.kb.close()
+
+    @staticmethod
+    def _kb_items(kb_hits: List[Dict[str, Any]]) -> List[ContextItem]:
+        """知识库命中转为待拼装条目（使用检索得分）"""
+        return [ContextItem(h["text"], "kb", score=h["score"]) for h in kb_hits]
+
+    def _search_jd(
+        self,
+        company: Optional[str],
+        target_position: Optional[str],
+        top_k: int,
+        query_vector: Optional[List[float]] = None,
+    ) -> List[ContextItem]:
+        """JD 库检索（可选阶段：剩余时间不足时跳过，返回空列表）"""
+        if not deadline.allow("jd"):
+            return []
+        try:
+            jd_hits = self.jd_retriever(company).search(
+                target_position or "通用面试", top_k=top_k, query_vector=query_vector
+            )
+        except deadline.DeadlineExceeded:
+            deadline.degrade("jd", "timeout")
+            return []
+        return self._jd_items(jd_hits)
+
+    @staticmethod
+    def _jd_items(jd_hits: List[Dict[str, Any]]) -> List[ContextItem]:
+        """JD 检索结果转为待拼装条目（按检索顺序递减打分）"""
+        return [
+            ContextItem(f"岗位要求：{h['requirements']}\n描述：{h['description']}", "jd", score=1.0 - i / len(jd_hits))
+            for i, h in enumerate(jd_hits)
+        ]
+
+    def _memory_items(self, ctx: Dict[str, Any]) -> List[ContextItem]:
+        """
+        记忆上下文转为待拼装条目：
+        - 摘要：越新的得分越高（旧 → 新排列）
+        - 最近消息：越新的得分越高（新 → 旧排列）
+        - 辅助记忆命中：使用检索得分，带 url 以便与已收录的整篇正文去重
+        """
+        known = ctx.pop("texts", None)
+        items: List[ContextItem] = []
+        summary_urls = ctx.get("summary_urls", [])
+        for i, (url, text) in enumerate(zip(summary_urls, self._fetch_texts(summary_urls, known))):
+            items.append(ContextItem(text, "summary", score=1.0 + i / max(len(summary_urls), 1), url=url))
+        recent_urls = ctx.get("recent_urls", [])
+        for i, (url, text) in enumerate(zip(recent_urls, self._fetch_texts(recent_urls, known))):
+            items.append(ContextItem(text, "recent", score=1.0 - i / max(len(recent_urls), 1), url=url))
+        for hit in ctx.get("retrieved", []):
+            items.append(ContextItem(hit["content"], "retrieved", score=hit.get("score") or 0.0, url=hit.get("url")))
+        return items
+
     def run(
         self,
         memory_id: str,
         app: str,
         query: str,
-        summary_k: int = 1,
+        summary_k: Optional[int] = None,
         recent_k: int = 6,
         aux_top_k: int = 5,
         aux_threshold: float = None,
-        max_chars: int = 4000,
+        max_tokens: Optional[int] = None,
+        debug: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         这个函数是只结合记忆能力回答用户的问题
         执行一次完整的 RAG 推理：
         1) 调用 MemoryManager 获取上下文（主记忆 + 辅助记忆）
-        2) 从 MinIO 拉取正文
-        3) 拼接上下文（有 token/字符限制）
+        2) 从 MinIO 拉取正文；已配置知识库时收取并发检索的知识库片段
+        3) 按 token 预算拼装上下文（默认 RAG_CONTEXT_MAX_TOKENS）
         4) 调用 LLM 生成回答
 
-        :return: { "answer": str, "context_used": dict }
+        :param debug: "timing" 时在 context_used.trace 返回各阶段耗时（span 树）
+        :return: { "answer": str, "context_used": dict }，context_used.packing 为各来源 token 用量；
+                 启用答案缓存时 context_used.answer_cache 标明是否命中（命中时不含检索上下文）；
+                 启用知识库时 context_used.kb 为 {"hits": [...], "collections": {名称: 状态}}；
+                 设置了请求截止时间且有阶段被跳过 / 截断时 context_used.degraded 为 [{"stage", "reason"}]
         """
-        # 1) 从记忆模块获取上下文
+        # 0) 语义答案缓存：先读版本号并向量化 query（向量在未命中时复用于辅助检索）
+        cache = self.memory.answers
+        q_vec, version, params_key = None, None, None
+        if cache.enabled and query:
+            with span("answer_cache.lookup") as s:
+                version = self.ds.mem_primary.get_context_version(memory_id)
+                q_vec = self.memory.embed_query(memory_id, query)
+                params_key = answer_params_key(
+                    summary_k=summary_k,
+                    recent_k=recent_k,
+                    aux_top_k=aux_top_k,
+                    aux_threshold=aux_threshold,
+                    max_tokens=max_tokens,
+                )
+                hit = cache.get(memory_id, version, params_key, q_vec)
+                s.set(hit=hit is not None)
+            if hit is not None:
+                ctx = {"answer_cache": {"hit": True, **{k: v for k, v in hit.items() if k != "answer"}}}
+                if debug == "timing":
+                    ctx["trace"] = trace_tree()
+                return {"answer": hit["answer"], "context_used": ctx}
+
+        # 1) 知识库检索先提交（与记忆检索重叠），再从记忆模块获取上下文；
+        #    embedding 模型一致时两者共用同一个 query 向量
+        kb_search = None
+        if self.kb.enabled and query and deadline.allow("kb"):
+            try:
+                if self.memory.embedding_model(memory_id) == self.kb.embed_model:
+                    if q_vec is None:
+                        q_vec = self.memory.embed_query(memory_id, query)
+                    kb_vec = q_vec
+                else:
+                    kb_vec = self.kb.embed_query(query)
+                kb_search = self.kb.submit(kb_vec)
+            except Exception as e:  # 知识库不可用时只用记忆回答
+                logger.warning("kb search not started: %s", e)
         ctx = self.memory.get_context(
             memory_id=memory_id,
             app=app,
@@ -65,27 +233,31 @@ class RAGPipeline:
             recent_k=recent_k,
             aux_top_k=aux_top_k,
             aux_threshold=aux_threshold,
+            query_vector=q_vec,
         )
         # print(ctx)
 
-        # 2) 拉取摘要和最近消息的正文
-        texts = []
-        texts.extend(self._fetch_texts(ctx.get("summary_urls", [])))
-        texts.extend(self._fetch_texts(ctx.get("recent_urls", [])))
-
-        # 3) 加上辅助记忆检索到的内容
-        for hit in ctx.get("retrieved", []):
-            texts.append(hit["content"])
+        # 2) 拉取摘要和最近消息的正文（内联正文直接使用），连同辅助记忆命中转为待拼装条目
+        with span("pipeline.fetch_texts"):
+            items = self._memory_items(ctx)
+        if kb_search is not None:
+            with span("kb.collect") as s:
+                kb_hits, kb_report = kb_search.collect()
+                s.set(hits=len(kb_hits))
+            items += self._kb_items(kb_hits)
+            ctx["kb"] = {
+                "hits": [{"collection": h["collection"], "score": h["score"], "meta": h["meta"]} for h in kb_hits],
+                "collections": kb_report,
+            }
 
-        # print(" texts", texts)
-        # 4) 拼接上下文（加长度限制）
-        context = ""
-        for t in texts:
-            if len(context) + len(t) > max_chars:
-                break
-            context += "\n\n" + t
+        # 3) 按 token 预算拼装上下文
+        with span("pipeline.pack", items=len(items)) as s:
+            packed = self.packer.pack(items, max_tokens)
+            s.set(tokens=packed.tokens)
+        context = packed.text
+        ctx["packing"] = packed.stats()
 
-        # 5) 构造 prompt 并调用 LLM
+        # 4) 构造 prompt 并调用 LLM
         prompt = (
             f"以下是与用户相关的历史对话与信息，请结合它们回答用户问题。\n"
             f"--- 上下文开始 ---\n{context}\n--- 上下文结束 ---\n\n"
@@ -99,7 +271,15 @@ class RAGPipeline:
             max_tokens=800,
             system="你是一个严谨的助手，会结合历史上下文回答用户问题。"
         )
-
+        # 已在 llm.chat 内检查截止时间；这里汇总本次被降级的阶段
+        if deadline.degraded():
+            ctx["degraded"] = deadline.degraded()
+
+        if cache.enabled and q_vec is not None:
+            cache.put(memory_id, version, params_key, q_vec, query, answer)
+            ctx["answer_cache"] = {"hit": False}
+        if debug == "timing":
+            ctx["trace"] = trace_tree()
         return {
             "answer": answer,
             "context_used": ctx
@@ -115,7 +295,8 @@ class RAGPipeline:
             target_position: str | None = None,
             jd_top_k: int = 1,
             memory_top_k: int = 3,
-            max_chars: int = 500,
+            max_tokens: int | None = None,
+            debug: str | None = None,
     ):
         """
         面试官场景（改进版）：
@@ -123,16 +304,21 @@ class RAGPipeline:
         基于候选人简历 + 岗位JD + 历史上下文，
         分三步生成三类问题（基础题 / 项目题 / 场景题），
         各自独立调用 LLM，再汇总成9道高质量面试题。
+        历史上下文与 JD 共用一个 token 预算（max_tokens，默认 RAG_CONTEXT_MAX_TOKENS）。
+        debug="timing" 时 context_used.trace 附带各阶段耗时（span 树）。
         """
 
         # 1️⃣ 拉取候选人简历内容
-        resume_data = {}
+        # （按 url + ETag 缓存的解析结果，未变化时不再下载与解析）
+        resume = None
+        resume_error = None
         if resume_url:
             try:
-                resume_text = self.ds.minio.get_text(resume_url)
-                resume_data = json.loads(resume_text)
+                resume = self.resumes.get(resume_url)
             except Exception as e:
-                resume_data = {"error": f"读取简历失败: {str(e)}"}
+                resume_error = f"读取简历失败: {str(e)}"
+        # 未指定岗位时，用简历 embedding 匹配 JD
+        resume_vector = resume.embedding if resume is not None and not target_position else None
 
         # 2️⃣ 获取记忆上下文
         ctx = self.memory.get_context(
@@ -140,17 +326,13 @@ class RAGPipeline:
             app=app,
             query=target_position or "面试生成",
             recent_k=memory_top_k,
-            summary_k=1
+            summary_k=None
         )
-        texts = []
-        texts.extend(self._fetch_texts(ctx.get("summary_urls", [])))
-        texts.extend(self._fetch_texts(ctx.get("recent_urls", [])))
-        for hit in ctx.get("retrieved", []):
-            texts.append(hit["content"])
-        context = "\n\n".join(texts)[:max_chars]
+        items = self._memory_items(ctx)
 
         # 3️⃣ 获取 JD 内容（优先用户上传的 JD）
         jd_context = ""
+        jd_items: List[ContextItem] = []
         if jd_id:
             try:
                 row = self.ds.uploaded_jd.get(jd_id, memory_id)
@@ -158,37 +340,32 @@ class RAGPipeline:
                 if row:
                     company = row.get("company") or company  # ✅ 自动覆盖
                     target_position = row.get("position") or target_position
-                    jd_context = row.get("content") or ""
+                    jd_items = [ContextItem(row.get("content") or "", "jd", score=1.0)]
                     print(f"✅ 使用用户上传的JD：{jd_id} ({company or ''} - {target_position or ''})")
                 else:
                     jd_context = "[未找到上传的JD]"
                     print(f"⚠️ 未找到 jd_id={jd_id} 对应JD记录，回退至JD库检索。")
-                    retriever = JDRetriever(collection="InterviewerJDKnowledge", company=company)
-                    jd_hits = retriever.search(target_position or "通用面试", top_k=jd_top_k)
-                    jd_context = "\n".join([
-                        f"岗位要求：{h['requirements']}\n描述：{h['description']}"
-                        for h in jd_hits
-                    ])[:max_chars]
+                    jd_items = self._search_jd(company, target_position, jd_top_k, resume_vector)
             except Exception as e:
                 print(f"⚠️ 读取用户上传JD失败: {e}")
                 jd_context = f"[JD读取失败: {e}]"
         else:
             # 🔁 原逻辑：JD向量库检索
             print("# 🔁 原逻辑：JD向量库检索")
-            retriever = JDRetriever(collection="InterviewerJDKnowledge", company=company)
-            jd_hits = retriever.search(target_position or "通用面试", top_k=jd_top_k)
-            jd_context = "\n".join([
-                f"岗位要求：{h['requirements']}\n描述：{h['description']}"
-                for h in jd_hits
-            ])[:max_chars]
+            jd_items = self._search_jd(company, target_position, jd_top_k, resume_vector)
+
+        # 历史上下文与 JD 按同一 token 预算拼装
+        packed = self.packer.pack(items + jd_items, max_tokens)
+        context = packed.text_of("summary", "recent", "retrieved")
+        jd_context = packed.text_of("jd") or jd_context
 
 
         # 4️⃣ 通用基础信息块
         base_info = f"""
-    职位：{resume_data.get('position', '')}
-    技能：{', '.join(resume_data.get('skills', []))}
+    职位：{resume.position if resume else ''}
+    技能：{resume.skills_text if resume else ''}
     项目经历：
-    {chr(10).join(resume_data.get('projects', []))}
+    {resume.projects_text if resume else ''}
 
     历史面试上下文：
     {context}
@@ -286,9 +463,10 @@ class RAGPipeline:
                 )
             )
 
-        basic_questions = _ask_llm(basic_prompt, temperature=0.3)
-        project_questions = _ask_llm(project_prompt, temperature=0.5)
-        scenario_questions = _ask_llm(scenario_prompt, temperature=0.6)
+        with span("pipeline.questions"):
+            basic_questions = _ask_llm(basic_prompt, temperature=0.3)
+            project_questions = _ask_llm(project_prompt, temperature=0.5)
+            scenario_questions = _ask_llm(scenario_prompt, temperature=0.6)
 
         # ---------------------------------------------------------------------
         # 7️⃣ 汇总结果
@@ -296,16 +474,23 @@ class RAGPipeline:
         all_questions = basic_questions + project_questions + scenario_questions
         all_questions = [q for q in all_questions if q.strip()]  # 清理空项
 
+        context_used = {
+            "memory_context": ctx,
+            "packing": packed.stats(),
+            "jd_context_preview": jd_context[:500],
+            "resume_url": resume_url,
+            "resume_error": resume_error,
+            "num_basic": len(basic_questions),
+            "num_project": len(project_questions),
+            "num_scenario": len(scenario_questions)
+        }
+        if deadline.degraded():
+            context_used["degraded"] = deadline.degraded()
+        if debug == "timing":
+            context_used["trace"] = trace_tree()
         return {
             "questions": all_questions[:9],
-            "context_used": {
-                "memory_context": ctx,
-                "jd_context_preview": jd_context[:500],
-                "resume_url": resume_url,
-                "num_basic": len(basic_questions),
-                "num_project": len(project_questions),
-                "num_scenario": len(scenario_questions)
-            }
+            "context_used": context_used,
         }
 
     def _extract_questions(self, text: str) -> list[str]:
@@ -1 +1,194 @@
-# 重排逻辑的实现
\ No newline at end of file
+# rag/core/rerank.py
+# -*- coding: utf-8 -*-
+"""
+Reranker: 检索结果重排
+- 向量检索先多取一些候选（RAG_RERANK_CANDIDATES，默认 20），重排后只把前 top_n 条交给 LLM
+- 打分器可插拔：
+  - BM25Scorer：纯本地词法打分（中文按字 + 相邻二字，英文按词），以候选集自身统计 IDF，无需语料与网络
+  - CrossEncoderScorer：从本地路径加载的 CPU cross-encoder（需要 sentence-transformers，可选依赖）
+- 分批打分并检查时间预算（RAG_RERANK_BUDGET_MS）：超时则放弃重排，保持原始向量顺序
+- 最终得分 = weight × 归一化重排分 + (1 - weight) × 归一化原始分（BM25 默认 0.5，cross-encoder 默认 1.0）
+
+环境变量：
+- RAG_RERANK：bm25（默认）/ cross_encoder / none
+- RAG_RERANK_MODEL：cross-encoder 本地模型目录
+- RAG_RERANK_BATCH_SIZE：每批打分的候选数，默认 16
+"""
+
+from __future__ import annotations
+import math
+import os
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+from rag.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+class Scorer(Protocol):
+    default_weight: float
+    batched: bool             # False：需要整个候选集一起打分（如 BM25 的 IDF）
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]: ...
+
+
+# ===================== BM25 =====================
+
+def lexical_tokens(text: str) -> List[str]:
+    """中文：单字 + 相邻二字；英文 / 数字：小写词"""
+    text = (text or "").lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Scorer:
+    default_weight = 0.5
+    batched = False
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        q_terms = set(lexical_tokens(query))
+        docs = [Counter(lexical_tokens(t)) for t in texts]
+        if not q_terms or not docs:
+            return [0.0] * len(texts)
+
+        n = len(docs)
+        avgdl = sum(sum(d.values()) for d in docs) / n or 1.0
+        idf = {}
+        for term in q_terms:
+            df = sum(1 for d in docs if term in d)
+            idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        scores = []
+        for d in docs:
+            dl = sum(d.values())
+            s = 0.0
+            for term in q_terms:
+                tf = d.get(term)
+                if tf:
+                    s += idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+            scores.append(s)
+        return scores
+
+
+# ===================== Cross-encoder =====================
+
+class CrossEncoderScorer:
+    default_weight = 1.0
+    batched = True
+
+    def __init__(self, model_path: str, max_length: int = 512):
+        """
+        :param model_path: 本地模型目录（不从网络下载）
+        """
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise RuntimeError("CrossEncoderScorer 需要 sentence-transformers") from e
+        if not model_path or not os.path.isdir(model_path):
+            raise RuntimeError(f"cross-encoder 模型目录不存在: {model_path}")
+        self.model = CrossEncoder(model_path, max_length=max_length, device="cpu")
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        return [float(s) for s in self.model.predict([(query, t) for t in texts], show_progress_bar=False)]
+
+
+# ===================== Reranker =====================
+
+def _minmax(values: List[float]) -> List[float]:
+    lo, hi = min(values), max(values)
+    if hi - lo < 1e-12:
+        return [1.0] * len(values)
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+class Reranker:
+    def __init__(
+        self,
+        scorer: Scorer,
+        batch_size: int = 16,
+        budget_ms: Optional[float] = None,
+        weight: Optional[float] = None,
+    ):
+        """
+        :param scorer: 打分器
+        :param batch_size: 每批打分的候选数（scorer.batched 为 True 时）；每批结束检查一次时间预算
+        :param budget_ms: 重排时间预算（毫秒），None 表示不限
+        :param weight: 重排分在最终得分中的权重，默认取 scorer.default_weight
+        """
+        self.scorer = scorer
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.weight = scorer.default_weight if weight is None else weight
+
+    def rerank(
+        self,
+        query: str,
+        hits: List[Dict[str, Any]],
+        top_n: Optional[int] = None,
+        text_key: str = "content",
+        score_key: str = "score",
+    ) -> List[Dict[str, Any]]:
+        """
+        返回重排后的前 top_n 条（新 dict，带 rerank_score）；超出预算时按原始顺序截断
+        """
+        top_n = len(hits) if top_n is None else top_n
+        if not query or len(hits) <= 1:
+            return hits[:top_n]
+
+        t0 = time.perf_counter()
+        texts = [h.get(text_key) or "" for h in hits]
+        step = self.batch_size if getattr(self.scorer, "batched", True) else len(texts)
+        scores: List[float] = []
+        for i in range(0, len(texts), step):
+            scores.extend(self.scorer.score(query, texts[i:i + step]))
+            elapsed = (time.perf_counter() - t0) * 1000
+            if self.budget_ms is not None and elapsed > self.budget_ms:
+                logger.warning("rerank over budget (%.1fms > %sms), keep vector order", elapsed, self.budget_ms)
+                return hits[:top_n]
+
+        rerank = _minmax(scores)
+        original = _minmax([float(h.get(score_key) or 0.0) for h in hits])
+        fused = [self.weight * r + (1 - self.weight) * o for r, o in zip(rerank, original)]
+        order = sorted(range(len(hits)), key=lambda i: -fused[i])
+        return [dict(hits[i], rerank_score=round(fused[i], 6)) for i in order[:top_n]]
+
+
+@lru_cache(maxsize=1)
+def get_reranker() -> Optional[Reranker]:
+    """按环境变量构建进程内共享的重排器；RAG_RERANK=none 返回 None，cross-encoder 不可用时回落 BM25"""
+    kind = os.getenv("RAG_RERANK", "bm25").lower()
+    if kind in ("none", "off", "false", ""):
+        return None
+
+    budget = os.getenv("RAG_RERANK_BUDGET_MS", "150")
+    budget_ms = float(budget) if budget else None
+    batch_size = int(os.getenv("RAG_RERANK_BATCH_SIZE", "16"))
+
+    if kind == "cross_encoder":
+        try:
+            scorer = CrossEncoderScorer(os.getenv("RAG_RERANK_MODEL", ""))
+            return Reranker(scorer, batch_size=batch_size, budget_ms=budget_ms)
+        except Exception as e:
+            logger.warning("cross-encoder 不可用，回落 BM25: %s", e)
+    return Reranker(BM25Scorer(), batch_size=batch_size, budget_ms=budget_ms)
+
+
+def rerank_candidates(top_k: int) -> int:
+    """启用重排时向量检索应取的候选数"""
+    return max(top_k, int(os.getenv("RAG_RERANK_CANDIDATES", "20")))
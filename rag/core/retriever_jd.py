@@ -6,6 +6,7 @@ JD 检索模块（面试官场景）
 1. 输入自然语言查询，检索 JD 知识库（InterviewerJDKnowledge）
 2. 支持 top_k 限制、可选公司过滤
 3. 返回结构化岗位信息及相似度分数
+4. 多取候选后去冗余（重复抓取的同一份 JD 只保留一条，见 rag/core/selectors.py）
 """
 # # ===== Test 用，正常不加载 =====
 # from dotenv import load_dotenv
@@ -13,9 +14,11 @@ JD 检索模块（面试官场景）
 # # ===== Test 用，正常不加载 =====
 
 from typing import List, Dict, Optional
-from rag.datasource.vectorstores.weaviate_store import WeaviateStore
+from rag.core.selectors import select, selectors_enabled
+from rag.datasource.vectorstores.weaviate_store import WeaviateStore, default_vector
 from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
 from weaviate.classes.query import Filter
+import weaviate.classes.query as wq
 
 
 class JDRetriever:
@@ -30,20 +33,26 @@ class JDRetriever:
     def __init__(
         self,
         collection: str = "InterviewerJDKnowledge",
-        company: Optional[str] = None
+        company: Optional[str] = None,
+        store: Optional[WeaviateStore] = None,
+        embedder: Optional[OpenAIEmbedder] = None,
     ):
+        """
+        :param store / embedder: 共享的长生命周期实例（RAGPipeline 传入）；不传则各自新建
+        """
         # 初始化向量库和 embedder
-        self.store = WeaviateStore(collection=collection)
-        self.embedder = OpenAIEmbedder()
+        self.store = store or WeaviateStore(collection=collection)
+        self.embedder = embedder or OpenAIEmbedder()
         self.company = company  # 可选：限定公司检索
 
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+    def search(self, query: str, top_k: int = 3, query_vector: Optional[List[float]] = None) -> List[Dict]:
         """
         在 JD 知识库中进行语义检索
         :param query: 用户查询文本
         :param top_k: 返回条数
+        :param query_vector: 已算好的查询向量（如简历 embedding），传入时不再向量化 query
         """
-        emb = self.embedder.embed_query(query)
+        emb = query_vector if query_vector is not None else self.embedder.embed_query(query)
         col = self.store.client.collections.get(self.store.collection)
 
         # 可选公司过滤
@@ -51,22 +60,26 @@ class JDRetriever:
         if self.company:
             filters = Filter.by_property("company").equal(self.company)
 
-        # 执行向量检索
+        # 执行向量检索（启用选择器时多取候选并带回向量）
+        use_select = selectors_enabled()
         result = col.query.near_vector(
             near_vector=emb,
-            limit=top_k,
+            limit=top_k * 3 if use_select else top_k,
             filters=filters,
             return_properties=[
                 "job_id", "company", "position", "category",
                 "requirements", "description", "location"
-            ]
+            ],
+            return_metadata=wq.MetadataQuery(distance=True),
+            include_vector=use_select,
         )
 
         # 处理结果
         hits = []
         for obj in result.objects:
             p = obj.properties
-            hits.append({
+            dist = getattr(obj.metadata, "distance", None)
+            hit = {
                 "job_id": p.get("job_id"),
                 "company": p.get("company"),
                 "position": p.get("position"),
@@ -74,8 +87,15 @@ class JDRetriever:
                 "requirements": p.get("requirements"),
                 "description": p.get("description"),
                 "location": p.get("location"),
-            })
+                "score": 1 / (1 + dist) if dist is not None else 0.0,
+            }
+            if use_select:
+                hit["vector"] = default_vector(obj.vector)
+            hits.append(hit)
 
+        if use_select:
+            # 同一 job_id 只保留一条；内容近重复的 JD 只保留得分最高的
+            hits = select(hits, top_k, max_per_key=1, key="job_id", text_key="description")
         return hits
 
 
@@ -0,0 +1,205 @@
+# rag/core/retriever_kb.py
+# -*- coding: utf-8 -*-
+"""
+知识库检索（RAGPipeline.run 的 kb 阶段）
+- 同一个 query 向量并发检索多个 collection（rag/api/routers/kb.py 上传的文档所在的 collection）
+- 每个 collection 有自己的延迟预算：从提交起超过预算仍未返回的 collection 本次跳过（不阻塞回答），
+  检索失败的 collection 同样跳过，结果里记录状态
+- 合并：每个 collection 至多取 top_k 条（分来源预算），去掉正文相同的片段后按得分排序
+- submit() 立即返回，检索在线程池里进行，可与记忆检索重叠；collect() 按预算收取结果
+  （同时受请求截止时间约束，见 rag/utils/deadline.py；有 collection 被跳过时记为 kb 降级）
+- Weaviate 客户端不支持逐次调用超时，超出预算的检索无法中断：同一 collection 上一次检索仍在执行时，
+  本次直接跳过（状态 busy），卡住的 collection 至多占用一个检索线程，不会拖垮整个线程池
+- query 向量必须与入库时的 embedding 模型一致：embed_model 为知识库文档的模型（RAG_KB_EMBEDDING_MODEL，
+  默认 EMBED_MODEL），与记忆的模型不同时由 embed_query() 用知识库自己的 embedder 计算
+
+环境变量：
+- RAG_KB_COLLECTIONS：逗号分隔的 collection 列表，可写成 Name:毫秒 单独指定预算；默认空（不检索知识库）
+- RAG_KB_TOP_K：每个 collection 的最大命中数，默认 4
+- RAG_KB_TIMEOUT_MS：默认延迟预算（毫秒），默认 800
+- RAG_KB_MIN_SCORE：最低得分，默认 0
+- RAG_KB_WORKERS：检索线程数，默认 4
+- RAG_KB_EMBEDDING_MODEL：知识库文档的 embedding 模型，默认与 EMBED_MODEL 相同
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rag.llm.embeddings.openai_embedding import DEFAULT_EMBED_MODEL, OpenAIEmbedder
+from rag.utils import deadline
+from rag.utils.logging import get_logger
+from rag.utils.tracing import span, wrap
+
+logger = get_logger(__name__)
+
+Hit = Dict[str, Any]
+
+
+def parse_collections(spec: str, default_timeout_ms: float) -> Dict[str, float]:
+    """"KbDefault, Docs:300" → {"KbDefault": 800.0, "Docs": 300.0}"""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, ms = part.strip().partition(":")
+        name = name.strip()
+        if name:
+            out[name] = float(ms) if ms.strip() else default_timeout_ms
+    return out
+
+
+def _hit(collection: str, raw: Hit) -> Hit:
+    props = raw.get("properties") or {}
+    try:
+        meta = json.loads(props.get("meta") or "{}")
+    except (TypeError, ValueError):
+        meta = {}
+    return {"collection": collection, "text": props.get("text") or "", "score": raw.get("score") or 0.0, "meta": meta}
+
+
+class KBSearch:
+    """一次已提交的多 collection 检索"""
+
+    def __init__(
+        self, futures: Dict[str, Optional[Future]], budgets: Dict[str, float], top_k: int, min_score: float, started: float
+    ):
+        self._futures = futures
+        self._budgets = budgets
+        self._top_k = top_k
+        self._min_score = min_score
+        self._started = started
+
+    def collect(self) -> Tuple[List[Hit], Dict[str, Dict[str, Any]]]:
+        """
+        按各 collection 的预算收取结果；返回 (合并后的命中, {collection: {"status", "hits", "ms", "error"?}})
+        status：ok / timeout（超出预算，跳过）/ error（检索失败，跳过）/ busy（上一次检索仍在执行，跳过）
+        """
+        report: Dict[str, Dict[str, Any]] = {}
+        merged: List[Hit] = []
+        # 预算短的先收，等待时间不会叠加
+        for name in sorted(self._futures, key=lambda n: self._budgets[n]):
+            fut = self._futures[name]
+            if fut is None:
+                report[name] = {"status": "busy", "hits": 0}
+                deadline.degrade("kb", "busy")
+                continue
+            left = self._budgets[name] / 1000.0 - (time.perf_counter() - self._started)
+            cap = deadline.wait_s()
+            if cap is not None:
+                left = min(left, cap)
+            try:
+                hits, ms = fut.result(timeout=max(left, 0.0))
+            except FutureTimeout:
+                fut.cancel()
+                report[name] = {"status": "timeout", "hits": 0, "ms": self._budgets[name]}
+                deadline.degrade("kb", "timeout")
+                continue
+            except Exception as e:
+                logger.warning("kb search %s failed: %s", name, e)
+                report[name] = {"status": "error", "hits": 0, "error": str(e)}
+                continue
+            hits = [h for h in hits if h["score"] >= self._min_score and h["text"].strip()][: self._top_k]
+            report[name] = {"status": "ok", "hits": len(hits), "ms": ms}
+            merged.extend(hits)
+
+        seen, out = set(), []
+        for h in sorted(merged, key=lambda x: -x["score"]):
+            key = " ".join(h["text"].split())
+            if key not in seen:
+                seen.add(key)
+                out.append(h)
+        return out, report
+
+
+class KBRetriever:
+    def __init__(
+        self,
+        store_factory: Callable[[], Any],
+        collections: Optional[Dict[str, float]] = None,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None,
+        workers: Optional[int] = None,
+        embedder: Optional[Callable[[], Any]] = None,
+        embed_model: Optional[str] = None,
+    ):
+        """
+        :param store_factory: 返回 WeaviateStore 的函数（首次检索时调用，之后复用；返回 None 表示 Weaviate 未启用）
+        :param collections: {collection: 延迟预算毫秒}，默认读取 RAG_KB_COLLECTIONS
+        :param embedder: 返回知识库 embedder 的函数（首次 embed_query 时调用），默认按 embed_model 新建
+        :param embed_model: 知识库文档的 embedding 模型，默认读取 RAG_KB_EMBEDDING_MODEL
+        """
+        if collections is None:
+            collections = parse_collections(
+                os.getenv("RAG_KB_COLLECTIONS", ""), float(os.getenv("RAG_KB_TIMEOUT_MS", "800"))
+            )
+        self.collections = dict(collections)
+        self.top_k = int(os.getenv("RAG_KB_TOP_K", "4")) if top_k is None else top_k
+        self.min_score = float(os.getenv("RAG_KB_MIN_SCORE", "0")) if min_score is None else min_score
+        self._workers = int(os.getenv("RAG_KB_WORKERS", "4")) if workers is None else workers
+        self.embed_model = embed_model or os.getenv("RAG_KB_EMBEDDING_MODEL") or DEFAULT_EMBED_MODEL
+        self._store_factory = store_factory
+        self._embedder_factory = embedder or (lambda: OpenAIEmbedder(model=self.embed_model))
+        self._embedder = None
+        self._store = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # 每个 collection 最近一次提交的检索（仍在执行时下一次跳过）
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.collections) and self.top_k > 0
+
+    def _ensure(self):
+        if self._pool is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._store_factory()
+                    if self._store is None:
+                        raise RuntimeError("weaviate disabled")
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="kb-search")
+        return self._store, self._pool
+
+    def embed_query(self, query: str) -> List[float]:
+        """用知识库自己的 embedder（embed_model）向量化 query"""
+        if self._embedder is None:
+            with self._lock:
+                if self._embedder is None:
+                    self._embedder = self._embedder_factory()
+        return self._embedder.embed_query(query)
+
+    def _search_one(self, store, collection: str, query_vector: List[float]) -> Tuple[List[Hit], float]:
+        t0 = time.perf_counter()
+        with span("kb.search", collection=collection) as s:
+            hits = [_hit(collection, h) for h in store.search(query_vector, top_k=self.top_k, collection=collection)]
+            s.set(hits=len(hits))
+        return hits, round((time.perf_counter() - t0) * 1000, 2)
+
+    def submit(self, query_vector: List[float]) -> KBSearch:
+        """并发提交全部 collection 的检索（立即返回）；上一次检索仍在执行的 collection 本次跳过"""
+        store, pool = self._ensure()
+        started = time.perf_counter()
+        futures: Dict[str, Optional[Future]] = {}
+        with self._lock:
+            for name in self.collections:
+                prev = self._inflight.get(name)
+                if prev is not None and not prev.done():
+                    futures[name] = None
+                    continue
+                futures[name] = self._inflight[name] = pool.submit(
+                    wrap(self._search_one), store, name, query_vector
+                )
+        return KBSearch(futures, self.collections, self.top_k, self.min_score, started)
+
+    def search(self, query_vector: List[float]) -> Tuple[List[Hit], Dict[str, Dict[str, Any]]]:
+        return self.submit(query_vector).collect()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        if self._embedder is not None and hasattr(self._embedder, "close"):
+            self._embedder.close()
@@ -6,7 +6,11 @@ Pydantic 数据模型 (schemas)
 """
 
 from typing import Optional, Dict, Any, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+
+from rag.utils.logging import get_logger
+
+logger = get_logger(__name__)
 
 # ===== 面试官应用（Interviewer 模块） =====
 class InterviewQueryReq(BaseModel):
@@ -19,7 +23,19 @@ class InterviewQueryReq(BaseModel):
     target_position: Optional[str] = None
     jd_top_k: int = 2
     memory_top_k: int = 3
-    max_chars: int = 500
+    max_tokens: Optional[int] = None   # 上下文 token 预算，默认 RAG_CONTEXT_MAX_TOKENS
+    # 已废弃：旧版按字符数截断上下文。仍接受，未传 max_tokens 时按 1 字符 ≈ 1 token 换算为预算
+    # （中文 1 字 ≈ 1 token，上下文不会比旧版更长）；请改用 max_tokens
+    max_chars: Optional[int] = Field(default=None, json_schema_extra={"deprecated": True})
+    debug: Optional[str] = None        # "timing"：context_used.trace 返回各阶段耗时
+
+    @model_validator(mode="after")
+    def _map_max_chars(self) -> "InterviewQueryReq":
+        if self.max_chars is not None:
+            logger.warning("InterviewQueryReq.max_chars 已废弃，请改用 max_tokens")
+            if self.max_tokens is None:
+                self.max_tokens = self.max_chars
+        return self
 
 
 class InterviewQueryResp(BaseModel):
@@ -38,6 +54,18 @@ class UploadJDReq(BaseModel):
 class UploadResp(BaseModel):
     jd_id: str
 
+# ===== 知识库（kb 模块） =====
+class UpsertRequest(BaseModel):
+    texts: List[str]
+    metadatas: Optional[List[Dict[str, Any]]] = None
+    collection: Optional[str] = None   # 默认 WEAVIATE_COLLECTION（KbDefault）
+
+
+class UpsertResponse(BaseModel):
+    collection: str
+    count: int
+    ids: List[str]
+
 # ===== Memory 模块 =====
 class CreateReq(BaseModel):
     app: str
@@ -60,10 +88,30 @@ class PushResp(BaseModel):
     row: Dict[str, Any]
 
 
+class PushItem(BaseModel):
+    url: str
+    description: Optional[str] = None
+
+
+class PushBatchReq(BaseModel):
+    memory_id: str
+    app: str
+    items: List[PushItem]
+
+
+class PushBatchResp(BaseModel):
+    status: str = "ok"
+    rows: List[Dict[str, Any]]
+    inserted: int = 0                  # 新登记条数（重复 url 不计）
+    summary_job_id: Optional[str] = None
+
+
 class QueryReq(BaseModel):
     memory_id: str
     app: str
     query: Optional[str] = None
+    max_tokens: Optional[int] = None   # 上下文 token 预算，默认 RAG_CONTEXT_MAX_TOKENS
+    debug: Optional[str] = None        # "timing"：context_used.trace 返回各阶段耗时
 
 
 class QueryResp(BaseModel):
@@ -90,6 +138,28 @@ class ClearResp(BaseModel):
     deleted: int
 
 
+class JobResp(BaseModel):
+    job_id: str
+    kind: str
+    memory_id: str
+    app: Optional[str] = None
+    status: str
+    attempts: int
+    max_attempts: int
+    payload: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    checkpoint: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+class JobListResp(BaseModel):
+    jobs: List[JobResp]
+
+
 # ===== 可选通用模型 =====
 class ErrorResp(BaseModel):
     detail: str
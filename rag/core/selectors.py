@@ -0,0 +1,174 @@
+# rag/core/selectors.py
+# -*- coding: utf-8 -*-
+"""
+候选选择器：在检索结果交给 LLM 之前去冗余
+- suppress_near_duplicates：向量余弦相似度超过阈值的候选只保留得分最高的一条
+  （如同一轮对话里的问题与回答、重复抓取的同一份 JD）
+- cap_per_key：每个 url（或其它字段）最多保留 n 条
+- mmr：最大边际相关（Maximal Marginal Relevance），在相关性与多样性之间取舍
+- select：以上三步的组合，供 MemoryManager.get_context / JDRetriever.search 使用
+
+相似度全部基于候选自带的向量（检索时 include_vector=True），用 NumPy 一次算出相似度矩阵；
+numpy 未安装或候选缺少向量时退化为按规范化文本去重 + 原始顺序。
+
+环境变量：
+- RAG_MMR_ENABLED：默认 true
+- RAG_MMR_LAMBDA：相关性权重，默认 0.7（1.0 退化为纯按得分）
+- RAG_DUP_THRESHOLD：近重复判定阈值（余弦），默认 0.95
+- RAG_MAX_HITS_PER_URL：每个 url 最多保留的命中数，默认 2
+"""
+
+from __future__ import annotations
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy 未安装时只做文本去重
+    np = None
+
+Hit = Dict[str, Any]
+
+_WS = re.compile(r"\s+")
+
+
+def selectors_enabled() -> bool:
+    return os.getenv("RAG_MMR_ENABLED", "true").lower() == "true"
+
+
+def _has_vectors(hits: List[Hit], vector_key: str) -> bool:
+    return np is not None and bool(hits) and all(h.get(vector_key) is not None for h in hits)
+
+
+def _similarity(hits: List[Hit], vector_key: str) -> "np.ndarray":
+    m = np.asarray([h[vector_key] for h in hits], dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    m = m / norms
+    return m @ m.T
+
+
+def _scores(hits: List[Hit], score_key: str) -> List[float]:
+    return [float(h.get(score_key) or 0.0) for h in hits]
+
+
+# ===================== 近重复 / 分组上限 =====================
+
+def suppress_near_duplicates(
+    hits: List[Hit],
+    threshold: float = 0.95,
+    vector_key: str = "vector",
+    text_key: str = "content",
+    score_key: str = "score",
+) -> List[Hit]:
+    """按得分从高到低保留，与已保留候选的相似度超过 threshold 的丢弃；结果保持得分降序"""
+    if not hits:
+        return []
+    scores = _scores(hits, score_key)
+    order = sorted(range(len(hits)), key=lambda i: -scores[i])
+
+    if not _has_vectors(hits, vector_key):
+        seen, kept = set(), []
+        for i in order:
+            key = _WS.sub(" ", str(hits[i].get(text_key) or "")).strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            kept.append(hits[i])
+        return kept
+
+    sims = _similarity(hits, vector_key)
+    kept_idx: List[int] = []
+    for i in order:
+        if kept_idx and sims[i, kept_idx].max() > threshold:
+            continue
+        kept_idx.append(i)
+    return [hits[i] for i in kept_idx]
+
+
+def cap_per_key(hits: List[Hit], max_per_key: int, key: str = "url") -> List[Hit]:
+    """每个 key 最多保留 max_per_key 条（保持输入顺序）；key 缺失的候选不受限制"""
+    if max_per_key <= 0:
+        return list(hits)
+    counts: Dict[Any, int] = {}
+    out = []
+    for h in hits:
+        k = h.get(key)
+        if k is not None:
+            if counts.get(k, 0) >= max_per_key:
+                continue
+            counts[k] = counts.get(k, 0) + 1
+        out.append(h)
+    return out
+
+
+# ===================== MMR =====================
+
+def mmr(
+    hits: List[Hit],
+    k: int,
+    lambda_: float = 0.7,
+    vector_key: str = "vector",
+    score_key: str = "score",
+) -> List[Hit]:
+    """
+    最大边际相关：每步选 lambda × 相关性 - (1 - lambda) × 与已选集合的最大相似度 最高的候选。
+    相关性用检索（或重排）得分，归一化到 [0, 1]；缺少向量时按得分截取前 k 条。
+    """
+    if k <= 0 or not hits:
+        return []
+    scores = _scores(hits, score_key)
+    if not _has_vectors(hits, vector_key) or len(hits) <= 1:
+        return [hits[i] for i in sorted(range(len(hits)), key=lambda i: -scores[i])[:k]]
+
+    rel = np.asarray(scores, dtype=np.float32)
+    span = rel.max() - rel.min()
+    rel = (rel - rel.min()) / span if span > 1e-12 else np.ones_like(rel)
+
+    sims = _similarity(hits, vector_key)
+    n = len(hits)
+    max_sim = np.full(n, -np.inf, dtype=np.float32)   # 与已选集合的最大相似度
+    chosen = np.zeros(n, dtype=bool)
+    picked: List[int] = []
+    for _ in range(min(k, n)):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        gain = lambda_ * rel - (1 - lambda_) * redundancy
+        gain[chosen] = -np.inf
+        i = int(np.argmax(gain))
+        picked.append(i)
+        chosen[i] = True
+        max_sim = np.maximum(max_sim, sims[:, i])
+    return [hits[i] for i in picked]
+
+
+# ===================== 组合 =====================
+
+def select(
+    hits: List[Hit],
+    k: int,
+    lambda_: Optional[float] = None,
+    dup_threshold: Optional[float] = None,
+    max_per_key: Optional[int] = None,
+    key: str = "url",
+    vector_key: str = "vector",
+    text_key: str = "content",
+    score_key: str = "score",
+    strip_vectors: bool = True,
+) -> List[Hit]:
+    """
+    近重复抑制 → 分组上限 → MMR 取 k 条；strip_vectors=True 时去掉结果中的向量字段
+    参数为 None 时读取对应环境变量
+    """
+    lambda_ = float(os.getenv("RAG_MMR_LAMBDA", "0.7")) if lambda_ is None else lambda_
+    dup_threshold = float(os.getenv("RAG_DUP_THRESHOLD", "0.95")) if dup_threshold is None else dup_threshold
+    max_per_key = int(os.getenv("RAG_MAX_HITS_PER_URL", "2")) if max_per_key is None else max_per_key
+
+    out = suppress_near_duplicates(
+        hits, threshold=dup_threshold, vector_key=vector_key, text_key=text_key, score_key=score_key
+    )
+    out = cap_per_key(out, max_per_key, key=key)
+    out = mmr(out, k, lambda_=lambda_, vector_key=vector_key, score_key=score_key)
+    if strip_vectors:
+        out = [{f: v for f, v in h.items() if f != vector_key} for h in out]
+    return out
@@ -1 +1,199 @@
-# 主记忆摘要策略（触发阈值、增量摘要、去冗余）。
\ No newline at end of file
+# rag/core/summarizer.py
+# -*- coding: utf-8 -*-
+"""
+MapReduceSummarizer: 分块并行摘要
+- 输入总长不超过 chunk_chars 时与原来一样，一次 LLM 调用
+- 否则：
+  1) 切分（map 输入）：单条超长文本用 rag/utils/text_splitter.simple_split 切块，
+     短文本按顺序合并到同一块（不超过 chunk_chars），避免每条消息单独调用一次
+  2) map：各块并行提取要点（RAG_SUMMARY_CONCURRENCY 控制并发），
+     结果按块哈希缓存（默认 SQLite mem_summary_chunks）；再次摘要时已见过的块直接命中，只为新内容付费
+  3) reduce：部分摘要按原顺序合并；合并后仍超过 chunk_chars 时分组递归 reduce，最后按原指令输出
+- map / 分组 reduce 的内置指令按 language（zh / en，与 registry 的 summary_language 一致）选择；
+  缓存键包含提示词版本、语言、system prompt 与 max_tokens，任一变化都不会命中旧结果
+- 缓存条目由 IngestWorker 定期按 RAG_SUMMARY_CHUNK_TTL_DAYS 清理（见 rag/workers/ingest_worker.build_worker）
+
+环境变量：
+- RAG_SUMMARY_CHUNK_CHARS：单块字符上限，默认 6000
+- RAG_SUMMARY_CHUNK_OVERLAP：超长文本切块的重叠字符，默认 200
+- RAG_SUMMARY_CONCURRENCY：map 阶段并发上限，默认 4
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Protocol
+
+from rag.utils.logging import get_logger
+from rag.utils.metrics import record_cache
+from rag.utils.text_splitter import simple_split
+
+logger = get_logger(__name__)
+
+JOINER = "\n\n---\n\n"
+
+# map 提示词变化时递增，使旧缓存自然失效
+MAP_PROMPT_VERSION = "v1"
+MAP_INSTRUCTIONS = {
+    "zh": (
+        "以下是一段较长对话或摘要中的一部分，请提取其中的重要事实、实体和关键决策，"
+        "忽略闲聊与重复内容，用简洁的要点输出。"
+    ),
+    "en": (
+        "The following is one part of a longer conversation or summary. Extract the important facts, "
+        "entities and key decisions, ignore small talk and repetition, and answer with concise bullet points."
+    ),
+}
+REDUCE_INSTRUCTIONS = {
+    "zh": "以下是同一段内容按时间顺序的若干部分要点，请合并去重，保持时间顺序，输出简洁的要点。",
+    "en": (
+        "The following are bullet points from consecutive parts of the same content, in time order. "
+        "Merge them, remove duplicates, keep the time order and answer with concise bullet points."
+    ),
+}
+
+
+def _lang(language: Optional[str]) -> str:
+    """未知语言回退到中文（与 PrimaryMemory 的 summary_language 默认值一致）"""
+    return language if language in MAP_INSTRUCTIONS else "zh"
+
+
+class ChunkCache(Protocol):
+    def get_many(self, chunk_hashes: List[str]) -> Dict[str, str]: ...
+
+    def put(self, chunk_hash: str, summary_text: str) -> None: ...
+
+
+class MapReduceSummarizer:
+    def __init__(
+        self,
+        llm,
+        cache: Optional[ChunkCache] = None,
+        chunk_chars: Optional[int] = None,
+        overlap: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ):
+        """
+        :param llm: 提供 complete(prompt, temperature, top_p, max_tokens, system) 的客户端
+        :param cache: 分块摘要缓存（如 MemSummaryChunksStore），None 时不缓存
+        """
+        self.llm = llm
+        self.cache = cache
+        self.chunk_chars = chunk_chars or int(os.getenv("RAG_SUMMARY_CHUNK_CHARS", "6000"))
+        self.overlap = int(os.getenv("RAG_SUMMARY_CHUNK_OVERLAP", "200")) if overlap is None else overlap
+        self.max_workers = max_workers or int(os.getenv("RAG_SUMMARY_CONCURRENCY", "4"))
+
+    # ===================== 对外接口 =====================
+
+    def summarize(
+        self,
+        instruction: str,
+        texts: List[str],
+        max_tokens: int = 512,
+        system: Optional[str] = None,
+        language: str = "zh",
+    ) -> str:
+        """
+        按 instruction 摘要 texts（按时间顺序），返回摘要文本
+        :param language: 内置 map / reduce 指令的语言（zh / en）
+        """
+        texts = [t for t in texts if t and t.strip()]
+        if sum(len(t) for t in texts) + len(JOINER) * max(len(texts) - 1, 0) <= self.chunk_chars:
+            return self._complete(instruction, texts, max_tokens, system)
+
+        language = _lang(language)
+        chunks = self.split(texts)
+        partials = self._map(chunks, max(128, max_tokens // 2), system, language)
+        logger.info("map-reduce summary: texts=%d chunks=%d", len(texts), len(chunks))
+        return self._reduce(instruction, partials, max_tokens, system, language)
+
+    def split(self, texts: List[str]) -> List[str]:
+        """切块：超长文本切分，短文本按顺序合并，每块不超过 chunk_chars"""
+        pieces: List[str] = []
+        for t in texts:
+            if len(t) <= self.chunk_chars:
+                pieces.append(t)
+            else:
+                pieces.extend(c["text"] for c in simple_split(t, self.chunk_chars, self.overlap))
+
+        chunks: List[str] = []
+        buf: List[str] = []
+        size = 0
+        for p in pieces:
+            extra = len(p) + (len(JOINER) if buf else 0)
+            if buf and size + extra > self.chunk_chars:
+                chunks.append(JOINER.join(buf))
+                buf, size = [], 0
+                extra = len(p)
+            buf.append(p)
+            size += extra
+        if buf:
+            chunks.append(JOINER.join(buf))
+        return chunks
+
+    # ===================== map / reduce =====================
+
+    @staticmethod
+    def chunk_hash(chunk: str, max_tokens: int, system: Optional[str] = None, language: str = "zh") -> str:
+        raw = f"{MAP_PROMPT_VERSION}\x00{language}\x00{system or ''}\x00{max_tokens}\x00{chunk}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _map(self, chunks: List[str], max_tokens: int, system: Optional[str], language: str) -> List[str]:
+        keys = [self.chunk_hash(c, max_tokens, system, language) for c in chunks]
+        cached: Dict[str, str] = {}
+        if self.cache is not None:
+            try:
+                cached = self.cache.get_many(keys)
+            except Exception as e:
+                logger.warning("summary chunk cache read failed: %s", e)
+
+        todo = [(k, c) for k, c in dict(zip(keys, chunks)).items() if k not in cached]
+        record_cache("summary_chunks", True, len(set(keys)) - len(todo))
+        record_cache("summary_chunks", False, len(todo))
+
+        def _run(item):
+            key, chunk = item
+            text = self._complete(MAP_INSTRUCTIONS[language], [chunk], max_tokens, system)
+            if self.cache is not None:
+                try:
+                    self.cache.put(key, text)
+                except Exception as e:
+                    logger.warning("summary chunk cache write failed: %s", e)
+            return key, text
+
+        if todo:
+            workers = max(1, min(self.max_workers, len(todo)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary-map") as pool:
+                cached.update(pool.map(_run, todo))
+        logger.info("summary map: chunks=%d cached=%d", len(chunks), len(chunks) - len(todo))
+        return [cached[k] for k in keys]
+
+    def _reduce(
+        self, instruction: str, partials: List[str], max_tokens: int, system: Optional[str], language: str
+    ) -> str:
+        total = sum(len(p) for p in partials) + len(JOINER) * max(len(partials) - 1, 0)
+        if total > self.chunk_chars and len(partials) > 1:
+            groups = self.split(partials)
+            if len(groups) < len(partials):
+                merged = self._map_reduce_groups(groups, max(128, max_tokens // 2), system, language)
+                return self._reduce(instruction, merged, max_tokens, system, language)
+        return self._complete(instruction, partials, max_tokens, system)
+
+    def _map_reduce_groups(
+        self, groups: List[str], max_tokens: int, system: Optional[str], language: str
+    ) -> List[str]:
+        instruction = REDUCE_INSTRUCTIONS[language]
+        workers = max(1, min(self.max_workers, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary-reduce") as pool:
+            return list(pool.map(lambda g: self._complete(instruction, [g], max_tokens, system), groups))
+
+    def _complete(self, instruction: str, texts: List[str], max_tokens: int, system: Optional[str]) -> str:
+        prompt = instruction + "\n\n" + JOINER.join(texts)
+        return self.llm.complete(
+            prompt,
+            temperature=0.2,
+            top_p=1.0,
+            max_tokens=max_tokens,
+            system=system,
+        )
@@ -14,6 +14,12 @@ from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
 from rag.datasource.sqlstores.mem_primary_store import MemPrimaryStore
 from rag.datasource.sqlstores.mem_registry_store import MemRegistryStore
 from rag.datasource.sqlstores.mem_deleted_store import MemDeletedStore
+from rag.datasource.sqlstores.mem_jobs_store import MemJobsStore
+from rag.datasource.sqlstores.mem_leases_store import MemLeasesStore
+from rag.datasource.sqlstores.mem_summaries_store import MemSummariesStore
+from rag.datasource.sqlstores.mem_context_snapshots_store import MemContextSnapshotsStore
+from rag.datasource.sqlstores.mem_summary_chunks_store import MemSummaryChunksStore
+from rag.datasource.sqlstores.resume_states_store import ResumeStatesStore
 
 # Object store
 from rag.datasource.connections.minio_connection import MinioConnection
@@ -34,6 +40,12 @@ class Datasource:
         self.mem_primary = MemPrimaryStore(self.sqlite_conn)
         self.mem_registry = MemRegistryStore(self.sqlite_conn)
         self.mem_deleted = MemDeletedStore(self.sqlite_conn)
+        self.mem_jobs = MemJobsStore(self.sqlite_conn)
+        self.mem_leases = MemLeasesStore(self.sqlite_conn)
+        self.mem_summaries = MemSummariesStore(self.sqlite_conn)
+        self.mem_snapshots = MemContextSnapshotsStore(self.sqlite_conn)
+        self.mem_summary_chunks = MemSummaryChunksStore(self.sqlite_conn)
+        self.resume_states = ResumeStatesStore(self.sqlite_conn)
         self.uploaded_jd = UploadedJDStore(self.sqlite_conn)
 
         # ---------- MinIO ----------
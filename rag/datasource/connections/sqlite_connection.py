@@ -1,15 +1,19 @@
 # -*- coding: utf-8 -*-
 """
 SQLiteConnection
-- 单例/线程安全封装
+- 线程安全封装：1 个写连接（RLock 串行化）+ 每线程 1 个只读连接（WAL 下并发读）
+- 可配置 PRAGMA 档位（mmap_size / cache_size / temp_store / busy_timeout）
 - 自动创建 db 目录
 - 初始化表结构（mem_contexts, mem_primary）
-- 提供 execute/query_all/query_one 等基础操作
+- 提供 execute/executemany/execute_returning/query_all/query_one 等基础操作
+- transaction()：工作单元，多条写语句合并为一次提交（一次 fsync）
 """
 from __future__ import annotations
 import os, sqlite3, threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Iterator, Optional, Sequence
 
 # ---------- 表定义 ----------
 DDL = r"""
@@ -24,6 +28,7 @@ CREATE TABLE IF NOT EXISTS mem_registry (
   name         TEXT,                              -- 可选：记忆别名
   owner        TEXT,                              -- 可选：创建者/归属人
   params_json  TEXT,                              -- 主/辅记忆配置参数
+  params_version INTEGER NOT NULL DEFAULT 0,      -- 参数版本号：每次改参 +1，多进程缓存据此失效
   status       TEXT NOT NULL DEFAULT 'active',    -- active / archived / disabled
   created_at   TEXT NOT NULL DEFAULT (datetime('now')),
   updated_at   TEXT NOT NULL DEFAULT (datetime('now'))
@@ -40,7 +45,9 @@ CREATE TABLE IF NOT EXISTS mem_deleted (
   deleted_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
 
-CREATE INDEX IF NOT EXISTS idx_mem_deleted_memory ON mem_deleted(memory_id);
+-- (memory_id, key) 复合索引：支撑 mem_contexts 列表的 NOT EXISTS 反连接，也覆盖按 memory_id 前缀查询
+DROP INDEX IF EXISTS idx_mem_deleted_memory;
+CREATE INDEX IF NOT EXISTS idx_mem_deleted_memory_key ON mem_deleted(memory_id, key);
 CREATE INDEX IF NOT EXISTS idx_mem_deleted_key ON mem_deleted(key);
 
 -- 会话上下文目录（每次会话一个文件）
@@ -54,6 +61,8 @@ CREATE TABLE IF NOT EXISTS mem_contexts (
   qa_count       INTEGER NOT NULL DEFAULT 0,
   is_summarized  INTEGER NOT NULL DEFAULT 0,       -- 0/1
   summarized_at  TEXT,
+  body_blob      BLOB,                             -- 可选：内联正文（压缩后），小对象免读 MinIO
+  body_codec     TEXT,                             -- 内联正文编码：zlib / NULL
   created_at     TEXT NOT NULL DEFAULT (datetime('now')),
   updated_at     TEXT NOT NULL DEFAULT (datetime('now'))
 );
@@ -61,6 +70,10 @@ CREATE TABLE IF NOT EXISTS mem_contexts (
 CREATE INDEX IF NOT EXISTS idx_mem_contexts_memory_created
   ON mem_contexts (memory_id, created_at DESC);
 
+-- 未摘要窗口 / 最近消息：按 (memory_id, is_summarized) 定位后按时间倒序
+CREATE INDEX IF NOT EXISTS idx_mem_contexts_memory_summarized_created
+  ON mem_contexts (memory_id, is_summarized, created_at DESC);
+
 CREATE INDEX IF NOT EXISTS idx_mem_contexts_app_created
   ON mem_contexts (app, created_at DESC);
 
@@ -73,10 +86,100 @@ CREATE TABLE IF NOT EXISTS mem_primary (
   total_qa_count     INTEGER NOT NULL DEFAULT 0,   -- 累计 QA
   last_summary_index INTEGER NOT NULL DEFAULT 0,   -- 已摘要到的 QA 索引（0..n）
   last_summary_at    TEXT,
+  summary_blob       BLOB,                         -- 可选：内联摘要正文（压缩后）
+  summary_codec      TEXT,                         -- 内联摘要编码：zlib / NULL
+  context_version    INTEGER NOT NULL DEFAULT 0,   -- 上下文版本：push / 删除 / 摘要时 +1（快照校验用）
+  vector_version     INTEGER NOT NULL DEFAULT 0,   -- 辅助记忆版本：向量写入 / 删除成功后 +1，摘要不变（本地向量索引校验用）
   created_at         TEXT NOT NULL DEFAULT (datetime('now')),
   updated_at         TEXT NOT NULL DEFAULT (datetime('now'))
 );
 
+-- 后台任务队列（摘要等耗时操作异步化）
+CREATE TABLE IF NOT EXISTS mem_jobs (
+  job_id       TEXT PRIMARY KEY,                 -- UUID
+  kind         TEXT NOT NULL,                    -- 任务类型：summarize / ...
+  memory_id    TEXT NOT NULL,
+  app          TEXT,
+  dedupe_key   TEXT,                             -- 同一 key 同时最多一个排队中的任务
+  idempotency_key TEXT,                          -- 幂等键：同一 key 同时最多一个未结束（queued / running）的任务
+  payload_json TEXT,
+  checkpoint_json TEXT,                          -- 分阶段进度（重放时跳过已完成阶段）
+  status       TEXT NOT NULL DEFAULT 'queued',   -- queued / running / done / failed / dead（死信）
+  attempts     INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 3,
+  available_at REAL NOT NULL DEFAULT 0,          -- 可被领取的时间（epoch 秒，重试退避用）
+  locked_by    TEXT,                             -- 领取者 worker_id
+  locked_until REAL,                             -- 租约到期（epoch 秒），过期视为 worker 崩溃可重领
+  result_json  TEXT,
+  error        TEXT,
+  created_at   TEXT NOT NULL DEFAULT (datetime('now')),
+  updated_at   TEXT NOT NULL DEFAULT (datetime('now')),
+  started_at   TEXT,
+  finished_at  TEXT
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_mem_jobs_dedupe_queued
+  ON mem_jobs (dedupe_key) WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_mem_jobs_status_available
+  ON mem_jobs (status, available_at);
+
+CREATE INDEX IF NOT EXISTS idx_mem_jobs_memory_created
+  ON mem_jobs (memory_id, created_at DESC);
+
+-- 分层摘要：level 0 为每个窗口的叶子摘要，攒满 summary_rollup_n 条后合并为上一层
+CREATE TABLE IF NOT EXISTS mem_summaries (
+  summary_id    TEXT PRIMARY KEY,                -- UUID
+  memory_id     TEXT NOT NULL,
+  level         INTEGER NOT NULL DEFAULT 0,      -- 0=叶子（窗口摘要），n=第 n 层合并摘要
+  url           TEXT NOT NULL,                   -- MinIO 中的摘要文件
+  summary_blob  BLOB,                            -- 内联摘要正文（同 mem_primary.summary_blob）
+  summary_codec TEXT,
+  start_index   INTEGER NOT NULL DEFAULT 0,      -- 覆盖的 QA 区间 [start_index, end_index)
+  end_index     INTEGER NOT NULL DEFAULT 0,
+  rolled_up     INTEGER NOT NULL DEFAULT 0,      -- 已被合并进上一层（不再参与上下文）
+  parent_id     TEXT,                            -- 合并后的上层摘要
+  created_at    TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_mem_summaries_active
+  ON mem_summaries (memory_id, rolled_up, level, end_index);
+
+-- 上下文快照（可选的跨进程共享层）：按 memory + 形状（summary_k/recent_k）缓存摘要与最近消息正文
+CREATE TABLE IF NOT EXISTS mem_context_snapshots (
+  memory_id     TEXT NOT NULL,
+  shape         TEXT NOT NULL,                   -- 如 s:all|r:6
+  version       INTEGER NOT NULL,                -- 对应 mem_primary.context_version
+  snapshot_json TEXT NOT NULL,
+  updated_at    TEXT NOT NULL DEFAULT (datetime('now')),
+  PRIMARY KEY (memory_id, shape)
+);
+
+-- 跨进程租约（单飞锁）：同一 name 同时只有一个未过期的持有者
+CREATE TABLE IF NOT EXISTS mem_leases (
+  name        TEXT PRIMARY KEY,                  -- 锁名，如 summarize:<memory_id>
+  owner       TEXT NOT NULL,                     -- 持有者标识（进程/线程）
+  expires_at  REAL NOT NULL,                     -- 到期时间（epoch 秒），过期后可被抢占
+  acquired_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- 分块摘要缓存：map 阶段按分块内容哈希缓存部分摘要，重新摘要时只为新内容调用 LLM
+CREATE TABLE IF NOT EXISTS mem_summary_chunks (
+  chunk_hash   TEXT PRIMARY KEY,                 -- sha256(提示词版本 + 语言 + system prompt + max_tokens + 分块正文)
+  summary_text TEXT NOT NULL,
+  created_at   TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- 简历解析状态：按对象 url + ETag 缓存解析后的简历（规范化技能 / 项目 + 预计算 embedding）
+CREATE TABLE IF NOT EXISTS resume_states (
+  url           TEXT PRIMARY KEY,                -- MinIO 对象 key
+  etag          TEXT NOT NULL,                   -- 解析时对象的 ETag，不一致即重新解析
+  state_json    TEXT NOT NULL,                   -- {position, skills, projects, raw}
+  embedding     TEXT,                            -- JSON 数组；embedding 失败时为 NULL
+  embed_model   TEXT,
+  updated_at    TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
 CREATE TABLE IF NOT EXISTS user_uploaded_jd (
   jd_id       TEXT PRIMARY KEY,                -- JD 唯一标识 UUID
   memory_id   TEXT NOT NULL,                   -- 所属会话或用户ID
@@ -91,46 +194,229 @@ CREATE INDEX IF NOT EXISTS idx_user_uploaded_jd_memory
   ON user_uploaded_jd (memory_id, uploaded_at DESC);
 """
 
+# ---------- 增量列（老库升级用：CREATE TABLE IF NOT EXISTS 不会补列） ----------
+MIGRATIONS: list[tuple[str, str, str]] = [
+    ("mem_contexts", "body_blob", "BLOB"),
+    ("mem_contexts", "body_codec", "TEXT"),
+    ("mem_primary", "summary_blob", "BLOB"),
+    ("mem_primary", "summary_codec", "TEXT"),
+    ("mem_registry", "params_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("mem_primary", "context_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("mem_primary", "vector_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("mem_jobs", "idempotency_key", "TEXT"),
+    ("mem_jobs", "checkpoint_json", "TEXT"),
+]
+
+# 依赖增量列的索引：必须在 _migrate() 之后创建（老库在 DDL 阶段还没有这些列）
+POST_MIGRATION_DDL = r"""
+-- 老版本的幂等索引覆盖全部状态（done 之后同一 key 无法再入队），替换为只约束未结束的任务
+DROP INDEX IF EXISTS uq_mem_jobs_idempotency;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_mem_jobs_idempotency_active
+  ON mem_jobs (idempotency_key) WHERE idempotency_key IS NOT NULL AND status IN ('queued', 'running');
+"""
+
+# ---------- PRAGMA 档位 ----------
+def _env_int(key: str, default: int) -> int:
+    try:
+        return int(os.getenv(key, default))
+    except ValueError:
+        return default
+
+
+@dataclass
+class PragmaProfile:
+    """
+    每个连接（写连接与只读连接）建立后执行的 PRAGMA。
+    默认值面向“单机 API + 小库”，可用 RAG_SQLITE_* 环境变量覆盖。
+    """
+    mmap_size: int = 256 * 1024 * 1024     # 字节；0 表示关闭 mmap
+    cache_size: int = -64 * 1024           # 负数表示 KiB（-65536 ≈ 64MB）
+    temp_store: str = "MEMORY"             # DEFAULT / FILE / MEMORY
+    busy_timeout: int = 5000               # 毫秒
+
+    @classmethod
+    def from_env(cls) -> "PragmaProfile":
+        d = cls()
+        return cls(
+            mmap_size=_env_int("RAG_SQLITE_MMAP_SIZE", d.mmap_size),
+            cache_size=_env_int("RAG_SQLITE_CACHE_SIZE", d.cache_size),
+            temp_store=os.getenv("RAG_SQLITE_TEMP_STORE", d.temp_store).upper(),
+            busy_timeout=_env_int("RAG_SQLITE_BUSY_TIMEOUT", d.busy_timeout),
+        )
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        if self.temp_store not in ("DEFAULT", "FILE", "MEMORY"):
+            raise ValueError(f"非法 temp_store: {self.temp_store}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA temp_store={self.temp_store}")
+
+
 # ---------- SQLite 封装 ----------
 class SQLiteConnection:
-    def __init__(self, db_path: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        pragmas: Optional[PragmaProfile] = None,
+        read_pool: Optional[bool] = None,
+    ) -> None:
+        """
+        :param pragmas: PRAGMA 档位，默认 PragmaProfile.from_env()
+        :param read_pool: 是否启用每线程只读连接；默认读取 RAG_SQLITE_READ_POOL（true），
+                          内存库（:memory:）无法跨连接共享，强制关闭
+        """
         # 默认路径：项目根目录/db/rag.sqlite3
         default_path = Path(os.getcwd()) / "db" / "rag.sqlite3"
         self.db_path = Path(db_path or os.getenv("RAG_DB_PATH", default_path))
+        self.pragmas = pragmas or PragmaProfile.from_env()
+
+        if read_pool is None:
+            read_pool = os.getenv("RAG_SQLITE_READ_POOL", "true").lower() == "true"
+        self.read_pool = read_pool and self.db_path.as_posix() != ":memory:"
 
         # 确保目录存在
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 连接数据库（允许多线程复用）
-        self._conn = sqlite3.connect(self.db_path.as_posix(), check_same_thread=False)
-        self._conn.row_factory = sqlite3.Row
+        # 写连接（允许多线程复用，靠 RLock 串行化）；
+        # autocommit 模式，事务边界由 transaction() 显式控制
+        self._conn = self._connect(autocommit=True)
         self._lock = threading.RLock()
+        self._tx = threading.local()
+
+        # 只读连接：每线程一个，WAL 模式下互不阻塞
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
 
         # 初始化表结构
         self._init_schema()
 
+    def _connect(self, readonly: bool = False, autocommit: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path.as_posix(),
+            check_same_thread=False,
+            isolation_level=None if autocommit else "",
+        )
+        conn.row_factory = sqlite3.Row
+        self.pragmas.apply(conn)
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """
+        当前线程的只读连接；以下情况返回 None（回落写连接）：
+        - 未启用读池
+        - 当前线程处于 transaction() 中（需要读到本事务未提交的写入）
+        """
+        if not self.read_pool or self.in_transaction:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit：避免隐式 BEGIN 把读连接钉在旧快照上
+            conn = self._connect(readonly=True, autocommit=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
     def _init_schema(self) -> None:
-        with self._lock, self._conn:
+        with self._lock:
             self._conn.executescript(DDL)
+            self._migrate()
+            self._conn.executescript(POST_MIGRATION_DDL)
+
+    def _migrate(self) -> None:
+        """为老库补齐后续新增的列（幂等）"""
+        for table, column, decl in MIGRATIONS:
+            cols = {r["name"] for r in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in cols:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    # ---------- 事务（工作单元） ----------
+    @property
+    def in_transaction(self) -> bool:
+        """当前线程是否处于 transaction() 中"""
+        return getattr(self._tx, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator["SQLiteConnection"]:
+        """
+        工作单元：块内所有写语句共用一个事务，退出时一次提交；异常则整体回滚。
+        - 可重入：嵌套调用并入最外层事务
+        - 持有写锁期间，其它线程的写入排队；只读连接不受影响
+        - 块内的 query_all/query_one 走写连接，能读到本事务未提交的数据
+
+            with conn.transaction():
+                store_a.create(...)
+                store_b.bump(...)
+        """
+        with self._lock:
+            depth = getattr(self._tx, "depth", 0)
+            if depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._tx.depth = depth + 1
+            try:
+                yield self
+            except BaseException:
+                self._tx.depth = depth
+                if depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._tx.depth = depth
+            if depth == 0:
+                try:
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
 
     # ---------- 基础执行 ----------
     def execute(self, sql: str, params: Iterable[Any] = ()) -> sqlite3.Cursor:
-        with self._lock, self._conn:
+        """单条写语句；事务外自动提交，事务内随事务提交"""
+        with self._lock:
             cur = self._conn.execute(sql, params)
             return cur
 
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> int:
+        """批量写入，整批一个事务；返回影响行数"""
+        with self.transaction():
+            cur = self._conn.executemany(sql, seq_of_params)
+            return cur.rowcount
+
+    def execute_returning(self, sql: str, params: Iterable[Any] = ()) -> list[dict]:
+        """执行带 RETURNING 的写语句，返回结果行（需 SQLite ≥ 3.35）"""
+        with self.transaction():
+            cur = self._conn.execute(sql, params)
+            return [dict(r) for r in cur.fetchall()]
+
     def query_all(self, sql: str, params: Iterable[Any] = ()) -> list[dict]:
+        reader = self._reader()
+        if reader is not None:
+            return [dict(r) for r in reader.execute(sql, params).fetchall()]
         with self._lock:
             cur = self._conn.execute(sql, params)
             return [dict(r) for r in cur.fetchall()]
 
     def query_one(self, sql: str, params: Iterable[Any] = ()) -> Optional[dict]:
+        reader = self._reader()
+        if reader is not None:
+            row = reader.execute(sql, params).fetchone()
+            return dict(row) if row else None
         with self._lock:
             cur = self._conn.execute(sql, params)
             row = cur.fetchone()
             return dict(row) if row else None
 
     def close(self) -> None:
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except Exception:
+                pass
         try:
             self._conn.close()
         except Exception:
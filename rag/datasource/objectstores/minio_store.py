@@ -6,6 +6,8 @@ import datetime, uuid
 from typing import Optional, List
 from minio.error import S3Error
 
+from rag.utils import deadline
+from rag.utils.tracing import span
 from ..connections.common import HealthResult
 from ..connections.minio_connection import MinioConnection
 
@@ -90,7 +92,8 @@ class MinIOStore:
     # ---------- 便捷 Bytes/Text API（主记忆在用） ----------
     def put_bytes(self, key: str, data: bytes, bucket: Optional[str] = None, content_type: Optional[str] = None) -> str:
         bkt = bucket or self.default_bucket
-        self.client.put_object(bkt, key, io.BytesIO(data), length=len(data), content_type=content_type)
+        with span("minio.put", key=key, bytes=len(data)):
+            self.client.put_object(bkt, key, io.BytesIO(data), length=len(data), content_type=content_type)
         return key
 
     def put_text(self, key: str, text: str, bucket: Optional[str] = None, content_type: str = "text/plain; charset=utf-8") -> str:
@@ -105,12 +108,16 @@ class MinIOStore:
         读取对象并以 bytes 返回；内部负责安全关闭流。
         """
         bkt = bucket or self.default_bucket
-        resp = self.client.get_object(bkt, key)
-        try:
-            return resp.read()
-        finally:
-            resp.close()
-            resp.release_conn()
+        deadline.check("minio.get")
+        with span("minio.get", key=key) as s:
+            resp = self.client.get_object(bkt, key)
+            try:
+                data = resp.read()
+            finally:
+                resp.close()
+                resp.release_conn()
+            s.set(bytes=len(data))
+        return data
 
     def get_text(self, key: str, bucket: Optional[str] = None, encoding: str = "utf-8") -> str:
         """
@@ -152,6 +159,16 @@ class MinIOStore:
         except Exception:
             return False
 
+    def etag(self, key: str, bucket: Optional[str] = None) -> Optional[str]:
+        """
+        对象的 ETag（只发 HEAD，不下载内容），用于判断已解析的缓存是否过期。
+        """
+        bkt = bucket or self.default_bucket
+        deadline.check("minio.stat")
+        with span("minio.stat", key=key):
+            st = self.client.stat_object(bkt, key)
+        return (st.etag or "").strip('"') or None
+
     def make_key(self, app: str, memory_id: str, filename: Optional[str] = None, ext: Optional[str] = None) -> str:
         """
         生成符合规范的对象 key：
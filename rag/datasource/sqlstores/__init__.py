@@ -1,4 +1,10 @@
 from .mem_contexts_store import MemContextsStore
 from .mem_primary_store import MemPrimaryStore
-from .mem_registry_store import MemRegistryStore
-from .mem_deleted_store import MemDeletedStore
\ No newline at end of file
+from .mem_registry_store import MemRegistryStore, MemoryParams
+from .mem_deleted_store import MemDeletedStore
+from .mem_jobs_store import MemJobsStore
+from .mem_leases_store import MemLeasesStore
+from .mem_summaries_store import MemSummariesStore
+from .mem_context_snapshots_store import MemContextSnapshotsStore
+from .mem_summary_chunks_store import MemSummaryChunksStore
+from .resume_states_store import ResumeStatesStore
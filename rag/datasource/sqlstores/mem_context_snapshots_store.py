@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+MemContextSnapshotsStore：上下文快照的共享层（mem_context_snapshots）
+同一台机器上的多个进程共用 SQLite 文件时，一个进程算出的快照可被其它进程直接复用。
+- get()：按 memory_id + shape 读取（调用方自行比对 version）
+- put()：写入/覆盖
+- delete_by_memory()：失效某个 memory 的全部快照
+"""
+from __future__ import annotations
+import json
+from typing import Optional, Dict, Any
+
+from ..connections.sqlite_connection import SQLiteConnection
+
+Row = Dict[str, Any]
+
+
+class MemContextSnapshotsStore:
+    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+        self.conn = conn or SQLiteConnection()
+
+    def get(self, memory_id: str, shape: str) -> Optional[Row]:
+        row = self.conn.query_one(
+            "SELECT version, snapshot_json FROM mem_context_snapshots WHERE memory_id = ? AND shape = ?",
+            (memory_id, shape),
+        )
+        if not row:
+            return None
+        try:
+            snapshot = json.loads(row["snapshot_json"])
+        except Exception:
+            return None
+        return {"version": row["version"], "snapshot": snapshot}
+
+    def put(self, memory_id: str, shape: str, version: int, snapshot: Dict[str, Any]) -> None:
+        """只允许版本前进，避免慢的写入者用旧快照覆盖新快照"""
+        self.conn.execute(
+            """
+            INSERT INTO mem_context_snapshots(memory_id, shape, version, snapshot_json)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(memory_id, shape) DO UPDATE
+               SET version       = excluded.version,
+                   snapshot_json = excluded.snapshot_json,
+                   updated_at    = datetime('now')
+             WHERE excluded.version >= mem_context_snapshots.version
+            """,
+            (memory_id, shape, version, json.dumps(snapshot, ensure_ascii=False)),
+        )
+
+    def delete_by_memory(self, memory_id: str) -> int:
+        cur = self.conn.execute("DELETE FROM mem_context_snapshots WHERE memory_id = ?", (memory_id,))
+        return cur.rowcount
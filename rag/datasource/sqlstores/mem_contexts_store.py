@@ -1,44 +1,103 @@
 # -*- coding: utf-8 -*-
 """
 MemContextsStore：对 mem_contexts 表的面向业务封装
-- create()：插入一条上下文记录（同内容哈希去重）
+- create()：插入一条上下文记录（同内容哈希去重；可选内联小正文）
 - get_by_uid() / get_by_hash()：单条查询
-- list_by_memory() / list_by_app()：分页列表
+- list_by_memory() / list_by_app()：分页列表（with_body=True 时附带内联正文）
+- list_active_by_memory()：排除逻辑删除（mem_deleted）的列表，单条 SQL 反连接
 - bump_qa()：累加 QA 计数
-- mark_summarized()：标记已摘要
+- mark_summarized() / mark_summarized_many()：标记已摘要（后者整窗一条语句）
 - update_desc()：更新描述
 """
 from __future__ import annotations
-import sqlite3
+import json
 from typing import Optional, List, Dict, Any
 from ..connections.sqlite_connection import SQLiteConnection
+from rag.utils.inline_body import inline_max_bytes, encode_body, decode_body
 
 Row = Dict[str, Any]
 
+# 对外返回的列（不含 body_blob，避免二进制进入 API 响应）
+COLUMNS = (
+    "uid, memory_id, app, description, url, content_sha256, qa_count, "
+    "is_summarized, summarized_at, created_at, updated_at"
+)
+
+
+def _with_body(row: Row) -> Row:
+    """把 body_blob/body_codec 解码为 body（无内联时为 None）"""
+    row["body"] = decode_body(row.pop("body_blob", None), row.pop("body_codec", None))
+    return row
+
+
 class MemContextsStore:
-    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+    def __init__(self, conn: SQLiteConnection | None = None, inline_max: Optional[int] = None) -> None:
+        """
+        :param inline_max: 内联正文阈值（字节），None 时读取 RAG_INLINE_BODY_*，0 表示关闭
+        """
         self.conn = conn or SQLiteConnection()
+        self.inline_max = inline_max_bytes() if inline_max is None else inline_max
 
     # ---------- 基础查询 ----------
     def get_by_uid(self, uid: str) -> Optional[Row]:
-        return self.conn.query_one("SELECT * FROM mem_contexts WHERE uid = ?", (uid,))
+        return self.conn.query_one(f"SELECT {COLUMNS} FROM mem_contexts WHERE uid = ?", (uid,))
 
     def get_by_hash(self, content_sha256: str) -> Optional[Row]:
-        return self.conn.query_one("SELECT * FROM mem_contexts WHERE content_sha256 = ?", (content_sha256,))
+        return self.conn.query_one(f"SELECT {COLUMNS} FROM mem_contexts WHERE content_sha256 = ?", (content_sha256,))
 
     # ---------- 列表 ----------
-    def list_by_memory(self, memory_id: str, limit: int = 20, offset: int = 0) -> List[Row]:
-        sql = """
-        SELECT * FROM mem_contexts
+    def list_by_memory(self, memory_id: str, limit: int = 20, offset: int = 0, with_body: bool = False) -> List[Row]:
+        """
+        with_body=True 时一次查询带回内联正文（行内 body 字段，未内联为 None）
+        """
+        cols = f"{COLUMNS}, body_blob, body_codec" if with_body else COLUMNS
+        sql = f"""
+        SELECT {cols} FROM mem_contexts
          WHERE memory_id = ?
          ORDER BY created_at DESC
          LIMIT ? OFFSET ?
         """
-        return self.conn.query_all(sql, (memory_id, limit, offset))
+        rows = self.conn.query_all(sql, (memory_id, limit, offset))
+        return [_with_body(r) for r in rows] if with_body else rows
+
+    def list_active_by_memory(
+        self,
+        memory_id: str,
+        limit: int = 20,
+        offset: int = 0,
+        unsummarized_only: bool = False,
+        with_body: bool = False,
+        oldest_first: bool = False,
+    ) -> List[Row]:
+        """
+        按时间倒序列出未被逻辑删除的上下文：
+        - 用 NOT EXISTS 对 mem_deleted(memory_id, key) 做反连接，一次查询完成过滤
+        - unsummarized_only=True 时只取 is_summarized = 0 的消息（摘要窗口 / 最近消息）
+        - oldest_first=True 时改为时间正序（摘要窗口从最早的未摘要消息开始取）
+        """
+        cols = ", ".join(f"c.{c.strip()}" for c in COLUMNS.split(","))
+        if with_body:
+            cols += ", c.body_blob, c.body_codec"
+        summarized_clause = "AND c.is_summarized = 0" if unsummarized_only else ""
+        order = "ASC" if oldest_first else "DESC"
+        sql = f"""
+        SELECT {cols} FROM mem_contexts AS c
+         WHERE c.memory_id = ?
+           {summarized_clause}
+           AND NOT EXISTS (
+                 SELECT 1 FROM mem_deleted AS d
+                  WHERE d.memory_id = c.memory_id
+                    AND d.key = c.url
+               )
+         ORDER BY c.created_at {order}, c.rowid {order}
+         LIMIT ? OFFSET ?
+        """
+        rows = self.conn.query_all(sql, (memory_id, limit, offset))
+        return [_with_body(r) for r in rows] if with_body else rows
 
     def list_by_app(self, app: str, limit: int = 20, offset: int = 0) -> List[Row]:
-        sql = """
-        SELECT * FROM mem_contexts
+        sql = f"""
+        SELECT {COLUMNS} FROM mem_contexts
          WHERE app = ?
          ORDER BY created_at DESC
          LIMIT ? OFFSET ?
@@ -54,33 +113,37 @@ class MemContextsStore:
         url: str,
         content_sha256: str,
         description: Optional[str] = None,
+        body: Optional[str] = None,
     ) -> Row:
         """
         插入一条上下文：
         - 若 content_sha256 已存在（你表上是 UNIQUE），则返回已有记录（幂等）
         - 否则插入新纪录
+        - body 不超过内联阈值时压缩后一并写入，读路径可免去 MinIO 往返
         """
-        try:
-            self.conn.execute(
-                """
-                INSERT INTO mem_contexts(uid, memory_id, app, description, url, content_sha256)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (uid, memory_id, app, description, url, content_sha256),
-            )
-        except sqlite3.IntegrityError:
-            # 命中 UNIQUE(content_sha256)，返回已有记录
-            existed = self.get_by_hash(content_sha256)
-            if existed:
-                return existed
-            # 也可能是主键 uid 冲突，这里兜底取 uid
-            existed = self.get_by_uid(uid)
-            if existed:
-                return existed
-            raise  # 其它约束错误，继续抛出
-
-        # 返回刚插入的完整行
-        return self.get_by_uid(uid)  # type: ignore[return-value]
+        body_blob, body_codec = encode_body(body, self.inline_max)
+        # 单条语句完成“插入 + 取回”；冲突时 RETURNING 为空，再取已有记录
+        rows = self.conn.execute_returning(
+            f"""
+            INSERT INTO mem_contexts(uid, memory_id, app, description, url, content_sha256, body_blob, body_codec)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+            RETURNING {COLUMNS}
+            """,
+            (uid, memory_id, app, description, url, content_sha256, body_blob, body_codec),
+        )
+        if rows:
+            return rows[0]
+
+        # 命中 UNIQUE(content_sha256)，返回已有记录
+        existed = self.get_by_hash(content_sha256)
+        if existed:
+            return existed
+        # 也可能是主键 uid 冲突，这里兜底取 uid
+        existed = self.get_by_uid(uid)
+        if existed:
+            return existed
+        raise RuntimeError(f"mem_contexts 插入失败: uid={uid}")
 
     # ---------- 计数与状态 ----------
     def bump_qa(self, uid: str, delta: int = 1) -> None:
@@ -126,6 +189,25 @@ class MemContextsStore:
             )
 
 
+    def mark_summarized_many(self, uids: List[str], summarized_at: Optional[str] = None) -> int:
+        """
+        一条 UPDATE 标记整个摘要窗口；uids 以 JSON 数组传入（json_each 展开），不受参数个数上限约束。
+        返回影响行数。
+        """
+        if not uids:
+            return 0
+        cur = self.conn.execute(
+            """
+            UPDATE mem_contexts
+               SET is_summarized = 1,
+                   summarized_at = COALESCE(?, datetime('now')),
+                   updated_at = datetime('now')
+             WHERE uid IN (SELECT value FROM json_each(?))
+            """,
+            (summarized_at, json.dumps(list(uids))),
+        )
+        return cur.rowcount
+
     def update_desc(self, uid: str, description: Optional[str]) -> None:
         self.conn.execute(
             """
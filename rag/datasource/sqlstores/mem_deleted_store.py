@@ -3,10 +3,10 @@
 MemDeletedStore: 管理逻辑删除的对话文件
 - mark_deleted(): 标记某个 key 已删除
 - list_deleted(): 按 memory_id 列出所有已删除对象
-- is_deleted(): 判断某个 key 是否被标记删除
+- is_deleted(): 判断某个 key 是否被标记删除（可按 memory_id 限定）
 """
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Optional
 from ..connections.sqlite_connection import SQLiteConnection
 
 Row = Dict[str, any]
@@ -27,9 +27,19 @@ class MemDeletedStore:
             (memory_id,),
         )
 
-    def is_deleted(self, key: str) -> bool:
-        row = self.conn.query_one(
-            "SELECT 1 FROM mem_deleted WHERE key = ?",
-            (key,),
-        )
+    def is_deleted(self, key: str, memory_id: Optional[str] = None) -> bool:
+        """
+        判断 key 是否被标记删除；传入 memory_id 时只看该记忆空间内的删除记录。
+        批量过滤请用 MemContextsStore.list_active_by_memory()。
+        """
+        if memory_id is None:
+            row = self.conn.query_one(
+                "SELECT 1 FROM mem_deleted WHERE key = ?",
+                (key,),
+            )
+        else:
+            row = self.conn.query_one(
+                "SELECT 1 FROM mem_deleted WHERE memory_id = ? AND key = ?",
+                (memory_id, key),
+            )
         return row is not None
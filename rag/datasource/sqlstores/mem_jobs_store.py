@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+MemJobsStore：基于 SQLite 的持久化任务队列（mem_jobs）
+- enqueue()：入队；同一 dedupe_key 已有排队中的任务、或同一 idempotency_key 已有未结束的任务时直接返回该任务
+- claim()：原子领取一个可执行任务（含租约过期的 running 任务；租约过期且次数已用尽的任务进入死信）
+- heartbeat() / save_checkpoint()：续租 / 保存分阶段进度（只允许当前持有者写入）
+- complete() / fail()：完成 / 失败（未超过 max_attempts 时退避后重新排队，否则进入死信 dead）；
+  传入 worker_id 时只有当前持有者能提交
+- requeue()：把死信任务重新排队（人工重放）
+- get() / list_by_memory() / list_by_status() / count_by_status()：状态查询
+
+语义为 at-least-once：worker 崩溃后租约过期，任务会被重新领取，处理函数需按 checkpoint 幂等重放。
+"""
+from __future__ import annotations
+import json
+import sqlite3
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+from ..connections.sqlite_connection import SQLiteConnection
+
+Row = Dict[str, Any]
+
+
+def _decode(row: Optional[Row]) -> Optional[Row]:
+    """payload_json / result_json / checkpoint_json 反序列化为 payload / result / checkpoint"""
+    if row is None:
+        return None
+    for src, dst in (("payload_json", "payload"), ("result_json", "result"), ("checkpoint_json", "checkpoint")):
+        raw = row.pop(src, None)
+        try:
+            row[dst] = json.loads(raw) if raw else None
+        except Exception:
+            row[dst] = None
+    return row
+
+
+class MemJobsStore:
+    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+        self.conn = conn or SQLiteConnection()
+
+    # ---------- 入队 ----------
+    def enqueue(
+        self,
+        kind: str,
+        memory_id: str,
+        app: Optional[str] = None,
+        payload: Optional[dict] = None,
+        dedupe_key: Optional[str] = None,
+        max_attempts: int = 3,
+        delay_s: float = 0.0,
+        idempotency_key: Optional[str] = None,
+        checkpoint: Optional[dict] = None,
+    ) -> Row:
+        """
+        入队一个任务：
+        - dedupe_key 相同且仍在排队（queued）时不重复入队，返回已有任务。
+          running 中的任务不参与去重：它可能已读过旧窗口，新触发需要再排一次。
+        - idempotency_key 相同且未结束（queued / running）时返回已有任务（客户端重试不会重复处理）；
+          已结束（done / failed / dead）的任务不参与去重，例如删除消息后重新 push、补偿写入都会新建任务
+        - checkpoint：初始进度（例如 push 已完成主记忆登记，只需补做后续阶段）
+        """
+        rows = self.conn.execute_returning(
+            """
+            INSERT INTO mem_jobs(job_id, kind, memory_id, app, dedupe_key, idempotency_key,
+                                 payload_json, checkpoint_json, max_attempts, available_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+            RETURNING *
+            """,
+            (
+                uuid.uuid4().hex,
+                kind,
+                memory_id,
+                app,
+                dedupe_key,
+                idempotency_key,
+                json.dumps(payload or {}, ensure_ascii=False),
+                json.dumps(checkpoint, ensure_ascii=False) if checkpoint else None,
+                max_attempts,
+                time.time() + delay_s,
+            ),
+        )
+        if rows:
+            return _decode(rows[0])
+        existed = None
+        if idempotency_key is not None:
+            existed = self.conn.query_one(
+                "SELECT * FROM mem_jobs WHERE idempotency_key = ? AND status IN ('queued', 'running')",
+                (idempotency_key,),
+            )
+        if existed is None and dedupe_key is not None:
+            existed = self.conn.query_one(
+                "SELECT * FROM mem_jobs WHERE dedupe_key = ? AND status = 'queued'", (dedupe_key,)
+            )
+        if existed is None:
+            raise RuntimeError(f"任务入队失败: kind={kind}, memory_id={memory_id}")
+        return _decode(existed)
+
+    # ---------- 领取 / 续租 ----------
+    def claim(self, worker_id: str, kinds: Iterable[str], lease_s: float = 300.0) -> Optional[Row]:
+        """
+        原子领取一个任务：排队中且已到可执行时间，或 running 但租约已过期（领取者崩溃）。
+        租约过期且 attempts 已达 max_attempts 的任务（反复让 worker 崩溃的毒任务）直接进入死信，不再领取。
+        """
+        now = time.time()
+        kinds_json = json.dumps(list(kinds))
+        self.conn.execute(
+            """
+            UPDATE mem_jobs
+               SET status       = 'dead',
+                   error        = COALESCE(error || '；', '') || '租约过期且重试次数已用尽',
+                   locked_until = NULL,
+                   finished_at  = datetime('now'),
+                   updated_at   = datetime('now')
+             WHERE kind IN (SELECT value FROM json_each(?))
+               AND status = 'running' AND locked_until < ? AND attempts >= max_attempts
+            """,
+            (kinds_json, now),
+        )
+        rows = self.conn.execute_returning(
+            """
+            UPDATE mem_jobs
+               SET status       = 'running',
+                   attempts     = attempts + 1,
+                   locked_by    = ?,
+                   locked_until = ?,
+                   started_at   = datetime('now'),
+                   updated_at   = datetime('now')
+             WHERE job_id = (
+                   SELECT job_id FROM mem_jobs
+                    WHERE kind IN (SELECT value FROM json_each(?))
+                      AND ((status = 'queued' AND available_at <= ?)
+                        OR (status = 'running' AND locked_until < ? AND attempts < max_attempts))
+                    ORDER BY available_at, created_at
+                    LIMIT 1
+                   )
+            RETURNING *
+            """,
+            (worker_id, now + lease_s, kinds_json, now, now),
+        )
+        return _decode(rows[0]) if rows else None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_s: float = 300.0) -> bool:
+        cur = self.conn.execute(
+            """
+            UPDATE mem_jobs
+               SET locked_until = ?, updated_at = datetime('now')
+             WHERE job_id = ? AND locked_by = ? AND status = 'running'
+            """,
+            (time.time() + lease_s, job_id, worker_id),
+        )
+        return cur.rowcount > 0
+
+    def save_checkpoint(
+        self,
+        job_id: str,
+        worker_id: str,
+        checkpoint: dict,
+        lease_s: Optional[float] = None,
+    ) -> bool:
+        """
+        保存分阶段进度（可在调用方的 transaction() 中与业务写入一起提交）；
+        只有当前持有者能写入，租约已被他人接管时返回 False。传入 lease_s 时顺带续租。
+        """
+        cur = self.conn.execute(
+            """
+            UPDATE mem_jobs
+               SET checkpoint_json = ?,
+                   locked_until    = COALESCE(?, locked_until),
+                   updated_at      = datetime('now')
+             WHERE job_id = ? AND locked_by = ? AND status = 'running'
+            """,
+            (
+                json.dumps(checkpoint, ensure_ascii=False),
+                time.time() + lease_s if lease_s is not None else None,
+                job_id,
+                worker_id,
+            ),
+        )
+        return cur.rowcount > 0
+
+    # ---------- 结束 ----------
+    def complete(self, job_id: str, result: Optional[dict] = None, worker_id: Optional[str] = None) -> bool:
+        """
+        标记完成；传入 worker_id 时只有当前持有者能提交（租约过期被接管后，旧 worker 的结果作废）
+        """
+        cur = self.conn.execute(
+            """
+            UPDATE mem_jobs
+               SET status       = 'done',
+                   result_json  = ?,
+                   error        = NULL,
+                   locked_until = NULL,
+                   finished_at  = datetime('now'),
+                   updated_at   = datetime('now')
+             WHERE job_id = ? AND (? IS NULL OR locked_by = ?)
+            """,
+            (json.dumps(result or {}, ensure_ascii=False), job_id, worker_id, worker_id),
+        )
+        return cur.rowcount > 0
+
+    def fail(
+        self,
+        job_id: str,
+        error: str,
+        retry_delay_s: float = 5.0,
+        permanent: bool = False,
+        worker_id: Optional[str] = None,
+    ) -> str:
+        """
+        记录失败：attempts < max_attempts 时退避后重新排队（retry_delay_s × attempts），
+        否则（或 permanent=True）进入死信 dead，等待人工 requeue()。
+        若同 dedupe_key 已有新任务在排队，本任务不再重排（由新任务接手），置为 failed。
+        传入 worker_id 时只有当前持有者能提交：租约已被他人接管则不做任何修改，返回 "lost"。
+        返回最终状态。
+        """
+        with self.conn.transaction():
+            row = self.conn.query_one(
+                "SELECT attempts, max_attempts, status, locked_by FROM mem_jobs WHERE job_id = ?", (job_id,)
+            )
+            if worker_id is not None and (row is None or row["status"] != "running" or row["locked_by"] != worker_id):
+                return "lost"
+            return self._fail(job_id, row, error, retry_delay_s, permanent)
+
+    def _fail(self, job_id: str, row: Optional[Row], error: str, retry_delay_s: float, permanent: bool) -> str:
+        if row and not permanent and row["attempts"] < row["max_attempts"]:
+            try:
+                self.conn.execute(
+                    """
+                    UPDATE mem_jobs
+                       SET status       = 'queued',
+                           error        = ?,
+                           available_at = ?,
+                           locked_by    = NULL,
+                           locked_until = NULL,
+                           updated_at   = datetime('now')
+                     WHERE job_id = ?
+                    """,
+                    (error, time.time() + retry_delay_s * row["attempts"], job_id),
+                )
+                return "queued"
+            except sqlite3.IntegrityError:
+                self._finish(job_id, "failed", f"{error}（已有同类任务排队，不再重试）")
+                return "failed"
+        self._finish(job_id, "dead", error)
+        return "dead"
+
+    def _finish(self, job_id: str, status: str, error: str) -> None:
+        self.conn.execute(
+            """
+            UPDATE mem_jobs
+               SET status       = ?,
+                   error        = ?,
+                   locked_until = NULL,
+                   finished_at  = datetime('now'),
+                   updated_at   = datetime('now')
+             WHERE job_id = ?
+            """,
+            (status, error, job_id),
+        )
+
+    def requeue(self, job_id: str, reset_attempts: bool = True) -> bool:
+        """
+        死信 / 失败任务重新排队（保留 checkpoint，重放时跳过已完成阶段）。
+        同 dedupe_key 已有排队任务时返回 False。
+        """
+        try:
+            cur = self.conn.execute(
+                """
+                UPDATE mem_jobs
+                   SET status       = 'queued',
+                       attempts     = CASE WHEN ? THEN 0 ELSE attempts END,
+                       available_at = ?,
+                       locked_by    = NULL,
+                       locked_until = NULL,
+                       finished_at  = NULL,
+                       updated_at   = datetime('now')
+                 WHERE job_id = ? AND status IN ('dead', 'failed')
+                """,
+                (1 if reset_attempts else 0, time.time(), job_id),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return cur.rowcount > 0
+
+    # ---------- 查询 ----------
+    def get(self, job_id: str) -> Optional[Row]:
+        return _decode(self.conn.query_one("SELECT * FROM mem_jobs WHERE job_id = ?", (job_id,)))
+
+    def list_by_memory(self, memory_id: str, limit: int = 20, offset: int = 0) -> List[Row]:
+        rows = self.conn.query_all(
+            """
+            SELECT * FROM mem_jobs
+             WHERE memory_id = ?
+             ORDER BY created_at DESC, rowid DESC
+             LIMIT ? OFFSET ?
+            """,
+            (memory_id, limit, offset),
+        )
+        return [_decode(r) for r in rows]
+
+    def list_by_status(self, status: str, kind: Optional[str] = None, limit: int = 50) -> List[Row]:
+        """按状态列出任务（如死信 dead），最近更新的在前"""
+        rows = self.conn.query_all(
+            """
+            SELECT * FROM mem_jobs
+             WHERE status = ? AND (? IS NULL OR kind = ?)
+             ORDER BY updated_at DESC, rowid DESC
+             LIMIT ?
+            """,
+            (status, kind, kind, limit),
+        )
+        return [_decode(r) for r in rows]
+
+    def count_by_status(self, kind: Optional[str] = None) -> Dict[str, int]:
+        """队列深度：{status: count}"""
+        if kind is None:
+            rows = self.conn.query_all("SELECT status, COUNT(*) AS n FROM mem_jobs GROUP BY status")
+        else:
+            rows = self.conn.query_all(
+                "SELECT status, COUNT(*) AS n FROM mem_jobs WHERE kind = ? GROUP BY status", (kind,)
+            )
+        return {r["status"]: r["n"] for r in rows}
+
+    def count_by_kind_status(self) -> Dict[Tuple[str, str], int]:
+        """按任务类型分组的队列深度：{(kind, status): count}"""
+        rows = self.conn.query_all("SELECT kind, status, COUNT(*) AS n FROM mem_jobs GROUP BY kind, status")
+        return {(r["kind"], r["status"]): r["n"] for r in rows}
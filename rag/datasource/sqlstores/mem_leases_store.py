@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+MemLeasesStore：基于 SQLite 的跨进程租约（mem_leases）
+- acquire()：抢占租约；已被他人持有且未过期时返回 False
+- renew()：持有者续期
+- release()：持有者释放
+- get()：查看当前持有者
+"""
+from __future__ import annotations
+import time
+from typing import Optional, Dict, Any
+
+from ..connections.sqlite_connection import SQLiteConnection
+
+Row = Dict[str, Any]
+
+
+class MemLeasesStore:
+    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+        self.conn = conn or SQLiteConnection()
+
+    def acquire(self, name: str, owner: str, ttl_s: float = 300.0) -> bool:
+        """
+        单条 upsert 完成“抢占”：不存在则插入；存在时仅当已过期或本就是自己持有才覆盖。
+        RETURNING 有行即抢占成功。
+        """
+        now = time.time()
+        rows = self.conn.execute_returning(
+            """
+            INSERT INTO mem_leases(name, owner, expires_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE
+               SET owner       = excluded.owner,
+                   expires_at  = excluded.expires_at,
+                   acquired_at = datetime('now')
+             WHERE mem_leases.expires_at < ? OR mem_leases.owner = excluded.owner
+            RETURNING owner
+            """,
+            (name, owner, now + ttl_s, now),
+        )
+        return bool(rows)
+
+    def renew(self, name: str, owner: str, ttl_s: float = 300.0) -> bool:
+        """持有者续期；租约已被他人接管（或已释放）时返回 False"""
+        cur = self.conn.execute(
+            "UPDATE mem_leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl_s, name, owner),
+        )
+        return cur.rowcount > 0
+
+    def release(self, name: str, owner: str) -> bool:
+        """只删除自己持有的租约；租约已过期被他人抢占时不误删"""
+        cur = self.conn.execute(
+            "DELETE FROM mem_leases WHERE name = ? AND owner = ?",
+            (name, owner),
+        )
+        return cur.rowcount > 0
+
+    def get(self, name: str) -> Optional[Row]:
+        return self.conn.query_one("SELECT * FROM mem_leases WHERE name = ?", (name,))
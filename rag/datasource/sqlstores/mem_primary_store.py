@@ -3,22 +3,43 @@
 MemPrimaryStore：管理主记忆的摘要进度
 - upsert()：初始化或更新一条 memory_id 的状态
 - bump_total()：累加总问答数
-- update_summary()：写入新的摘要（URL + version + 时间）
+- update_summary()：写入新的摘要（URL + version + 时间；可选内联摘要正文）
 - advance_index()：推进“已摘要到第几条 QA”
-- get()：按 memory_id 获取
+- get()：按 memory_id 获取（with_summary=True 时附带内联摘要正文）
+- get_context_version() / bump_context_version()：上下文版本（push / 删除 / 摘要时递增，快照校验用）
+- get_vector_version() / bump_vector_version()：辅助记忆版本（Weaviate 写入 / 删除成功后递增，进程内向量索引校验用）
 """
 from __future__ import annotations
 from typing import Optional, Dict, Any
 from ..connections.sqlite_connection import SQLiteConnection
+from rag.utils.inline_body import inline_max_bytes, encode_body, decode_body
 
 Row = Dict[str, Any]
 
+# 对外返回的列（不含 summary_blob）
+COLUMNS = (
+    "memory_id, summary_url, summary_version, recent_qa_count, total_qa_count, "
+    "last_summary_index, last_summary_at, context_version, vector_version, created_at, updated_at"
+)
+
+
 class MemPrimaryStore:
-    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+    def __init__(self, conn: SQLiteConnection | None = None, inline_max: Optional[int] = None) -> None:
+        """
+        :param inline_max: 内联摘要阈值（字节），None 时读取 RAG_INLINE_BODY_*，0 表示关闭
+        """
         self.conn = conn or SQLiteConnection()
+        self.inline_max = inline_max_bytes() if inline_max is None else inline_max
 
-    def get(self, memory_id: str) -> Optional[Row]:
-        return self.conn.query_one("SELECT * FROM mem_primary WHERE memory_id = ?", (memory_id,))
+    def get(self, memory_id: str, with_summary: bool = False) -> Optional[Row]:
+        """
+        with_summary=True 时行内附带 summary_text（未内联为 None）
+        """
+        cols = f"{COLUMNS}, summary_blob, summary_codec" if with_summary else COLUMNS
+        row = self.conn.query_one(f"SELECT {cols} FROM mem_primary WHERE memory_id = ?", (memory_id,))
+        if row and with_summary:
+            row["summary_text"] = decode_body(row.pop("summary_blob", None), row.pop("summary_codec", None))
+        return row
 
     def upsert(self, memory_id: str) -> None:
         """
@@ -34,37 +55,103 @@ class MemPrimaryStore:
             (memory_id,),
         )
 
-    def bump_total(self, memory_id: str, delta: int = 1) -> None:
+    def bump_total(self, memory_id: str, delta: int = 1) -> Optional[Row]:
         """
         累加总问答数；同时 recent_qa_count 也 +delta
+        返回更新后的进度行（RETURNING），调用方无需再读一次；memory_id 不存在时返回 None
         """
-        self.conn.execute(
-            """
+        rows = self.conn.execute_returning(
+            f"""
             UPDATE mem_primary
                SET total_qa_count = total_qa_count + ?,
                    recent_qa_count = recent_qa_count + ?,
+                   context_version = context_version + 1,
                    updated_at = datetime('now')
              WHERE memory_id = ?
+            RETURNING {COLUMNS}
             """,
             (delta, delta, memory_id),
         )
+        return rows[0] if rows else None
 
-    def update_summary(self, memory_id: str, summary_url: str) -> None:
+    def update_summary(
+        self,
+        memory_id: str,
+        summary_url: str,
+        summary_text: Optional[str] = None,
+        consumed: Optional[int] = None,
+    ) -> None:
         """
-        写入摘要文件 URL，并提升版本号
+        写入摘要文件 URL，并提升版本号；
+        summary_text 不超过内联阈值时压缩后一并写入（超过则清空旧的内联内容）
+        consumed：本次摘要消化的消息数；传入时 recent_qa_count 只减去这部分
+        （摘要期间新 push 的消息仍计入下一窗口），不传则清零
         """
+        summary_blob, summary_codec = encode_body(summary_text, self.inline_max)
         self.conn.execute(
             """
             UPDATE mem_primary
                SET summary_url = ?,
+                   summary_blob = ?,
+                   summary_codec = ?,
                    summary_version = summary_version + 1,
                    last_summary_at = datetime('now'),
-                   recent_qa_count = 0,
+                   recent_qa_count = CASE WHEN ? IS NULL THEN 0
+                                          ELSE MAX(recent_qa_count - ?, 0) END,
+                   context_version = context_version + 1,
+                   updated_at = datetime('now')
+             WHERE memory_id = ?
+            """,
+            (summary_url, summary_blob, summary_codec, consumed, consumed, memory_id),
+        )
+
+    def get_context_version(self, memory_id: str) -> Optional[int]:
+        """上下文版本号（主键单行读取）；memory_id 不存在时返回 None"""
+        row = self.conn.query_one(
+            "SELECT context_version FROM mem_primary WHERE memory_id = ?", (memory_id,)
+        )
+        return row["context_version"] if row else None
+
+    def get_vector_version(self, memory_id: str) -> Optional[int]:
+        """辅助记忆版本号；memory_id 不存在时返回 None"""
+        row = self.conn.query_one(
+            "SELECT vector_version FROM mem_primary WHERE memory_id = ?", (memory_id,)
+        )
+        return row["vector_version"] if row else None
+
+    def bump_context_version(self, memory_id: str) -> Optional[int]:
+        """
+        仅提升上下文版本（删除消息等不改变计数的操作），返回新版本号
+        """
+        rows = self.conn.execute_returning(
+            """
+            UPDATE mem_primary
+               SET context_version = context_version + 1,
+                   updated_at = datetime('now')
+             WHERE memory_id = ?
+            RETURNING context_version
+            """,
+            (memory_id,),
+        )
+        return rows[0]["context_version"] if rows else None
+
+    def bump_vector_version(self, memory_id: str) -> Optional[int]:
+        """
+        提升辅助记忆版本，返回新版本号；memory_id 不存在时返回 None
+        须在向量写入 / 删除已落到 Weaviate 之后调用：提前递增时，其他进程可能在这段窗口内
+        按新版本号缓存到不含这批向量的索引，且直到下一次写入前都不会失效
+        """
+        rows = self.conn.execute_returning(
+            """
+            UPDATE mem_primary
+               SET vector_version = vector_version + 1,
                    updated_at = datetime('now')
              WHERE memory_id = ?
+            RETURNING vector_version
             """,
-            (summary_url, memory_id),
+            (memory_id,),
         )
+        return rows[0]["vector_version"] if rows else None
 
     def advance_index(self, memory_id: str, new_index: int) -> None:
         """
@@ -3,21 +3,98 @@
 MemRegistryStore: 管理 mem_registry（记忆注册表）
 - upsert()：注册/更新 memory_id
 - get()：按 memory_id 获取
+- get_params()：读取解析后的 MemoryParams（进程内 LRU 缓存 + 版本号校验）
 - list_by_app()：按 app 列出
 - set_status()：修改状态（active/archived/disabled）
 - update_params()：更新参数 JSON
+
+参数缓存：
+- upsert/update_params 会使本进程缓存失效，并把 params_version +1
+- 其它进程的缓存项超过 RAG_PARAMS_CACHE_REVALIDATE_S 秒后，用 params_version 校验一次
 """
 from __future__ import annotations
-from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Optional, Dict, Any, List, Tuple
 import json
+import os
+import threading
+import time
 
 from ..connections.sqlite_connection import SQLiteConnection
 
 Row = Dict[str, Any]
 
+
+@dataclass(frozen=True)
+class MemoryParams:
+    """mem_registry.params_json 的类型化视图；未知字段保留在 extra 中"""
+    summary_every_n: int = 5
+    max_summary_tokens: int = 512
+    summary_rollup_n: int = 4          # 同层攒满 n 条摘要后合并为上一层
+    summary_language: str = "zh"
+    aux_top_k: int = 5
+    aux_score_threshold: Optional[float] = None
+    embedding_model: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "MemoryParams":
+        data = dict(data or {})
+        defaults = cls()
+        kwargs: Dict[str, Any] = {}
+        for f in fields(cls):
+            if f.name == "extra" or f.name not in data:
+                continue
+            value = data.pop(f.name)
+            default = getattr(defaults, f.name)
+            try:
+                if value is None:
+                    kwargs[f.name] = None if default is None else default
+                elif f.name == "aux_score_threshold":
+                    kwargs[f.name] = float(value)
+                elif isinstance(default, int):
+                    kwargs[f.name] = int(value)
+                else:
+                    kwargs[f.name] = str(value)
+            except (TypeError, ValueError):
+                kwargs[f.name] = default
+        return cls(extra=data, **kwargs)
+
+    @classmethod
+    def from_json(cls, params_json: Optional[str]) -> "MemoryParams":
+        try:
+            data = json.loads(params_json) if params_json else {}
+        except Exception:
+            data = {}
+        return cls.from_dict(data if isinstance(data, dict) else {})
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """兼容 dict 风格读取（先查类型化字段，再查 extra）"""
+        if key != "extra" and key in self.__dataclass_fields__:
+            return getattr(self, key)
+        return self.extra.get(key, default)
+
+
 class MemRegistryStore:
-    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+    def __init__(
+        self,
+        conn: SQLiteConnection | None = None,
+        cache_size: Optional[int] = None,
+        revalidate_s: Optional[float] = None,
+    ) -> None:
+        """
+        :param cache_size: 参数缓存条数上限，默认 RAG_PARAMS_CACHE_SIZE（1024），0 表示不缓存
+        :param revalidate_s: 缓存项多久后向 SQLite 校验版本号，默认 RAG_PARAMS_CACHE_REVALIDATE_S（5）
+        """
         self.conn = conn or SQLiteConnection()
+        self.cache_size = int(os.getenv("RAG_PARAMS_CACHE_SIZE", "1024")) if cache_size is None else cache_size
+        self.revalidate_s = (
+            float(os.getenv("RAG_PARAMS_CACHE_REVALIDATE_S", "5")) if revalidate_s is None else revalidate_s
+        )
+        # memory_id -> (params, params_version, 上次校验时间)
+        self._params_cache: "OrderedDict[str, Tuple[MemoryParams, int, float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def upsert(
         self,
@@ -34,19 +111,71 @@ class MemRegistryStore:
             INSERT INTO mem_registry(memory_id, app, name, owner, params_json, status)
             VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(memory_id) DO UPDATE SET
-              app         = excluded.app,
-              name        = excluded.name,
-              owner       = excluded.owner,
-              params_json = excluded.params_json,
-              status      = excluded.status,
-              updated_at  = datetime('now')
+              app            = excluded.app,
+              name           = excluded.name,
+              owner          = excluded.owner,
+              params_json    = excluded.params_json,
+              params_version = mem_registry.params_version + 1,
+              status         = excluded.status,
+              updated_at     = datetime('now')
             """,
             (memory_id, app, name, owner, params_json, status),
         )
+        self.invalidate_params(memory_id)
 
     def get(self, memory_id: str) -> Optional[Row]:
         return self.conn.query_one("SELECT * FROM mem_registry WHERE memory_id = ?", (memory_id,))
 
+    # ---------- 参数（缓存） ----------
+    def get_params(self, memory_id: str) -> Optional[MemoryParams]:
+        """
+        返回解析后的参数；memory_id 未注册时返回 None。
+        命中缓存且未到校验周期时不访问 SQLite；到期后只读一个版本号，版本未变则继续使用缓存。
+        """
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._params_cache.get(memory_id)
+        if entry is not None:
+            params, version, checked_at = entry
+            if now - checked_at < self.revalidate_s:
+                with self._cache_lock:
+                    if memory_id in self._params_cache:
+                        self._params_cache.move_to_end(memory_id)
+                return params
+            row = self.conn.query_one(
+                "SELECT params_version FROM mem_registry WHERE memory_id = ?", (memory_id,)
+            )
+            if row is not None and row["params_version"] == version:
+                self._cache_put(memory_id, params, version, now)
+                return params
+
+        row = self.conn.query_one(
+            "SELECT params_json, params_version FROM mem_registry WHERE memory_id = ?", (memory_id,)
+        )
+        if row is None:
+            self.invalidate_params(memory_id)
+            return None
+        params = MemoryParams.from_json(row.get("params_json"))
+        self._cache_put(memory_id, params, row["params_version"], now)
+        return params
+
+    def invalidate_params(self, memory_id: Optional[str] = None) -> None:
+        """使本进程参数缓存失效；memory_id 为 None 时清空"""
+        with self._cache_lock:
+            if memory_id is None:
+                self._params_cache.clear()
+            else:
+                self._params_cache.pop(memory_id, None)
+
+    def _cache_put(self, memory_id: str, params: MemoryParams, version: int, checked_at: float) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._params_cache[memory_id] = (params, version, checked_at)
+            self._params_cache.move_to_end(memory_id)
+            while len(self._params_cache) > self.cache_size:
+                self._params_cache.popitem(last=False)
+
     def list_by_app(self, app: str, limit: int = 50, offset: int = 0) -> List[Row]:
         return self.conn.query_all(
             """
@@ -74,9 +203,11 @@ class MemRegistryStore:
         self.conn.execute(
             """
             UPDATE mem_registry
-               SET params_json = ?,
-                   updated_at   = datetime('now')
+               SET params_json    = ?,
+                   params_version = params_version + 1,
+                   updated_at     = datetime('now')
              WHERE memory_id = ?
             """,
             (params_json, memory_id),
         )
+        self.invalidate_params(memory_id)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+MemSummariesStore：分层摘要（mem_summaries）
+- create()：写入一条摘要（叶子或合并摘要；可选内联正文）
+- list_active()：未被合并的摘要（上下文用），按覆盖区间从新到旧
+- list_unrolled()：某一层待合并的摘要，按时间从旧到新
+- mark_rolled_up()：把若干摘要标记为已合并进 parent_id
+- count_by_memory()：摘要条数（判断是否需要从 mem_primary 迁移旧摘要）
+"""
+from __future__ import annotations
+import json
+import uuid
+from typing import Optional, Dict, Any, List
+
+from ..connections.sqlite_connection import SQLiteConnection
+from rag.utils.inline_body import inline_max_bytes, encode_body, decode_body
+
+Row = Dict[str, Any]
+
+# 对外返回的列（不含 summary_blob）
+COLUMNS = (
+    "summary_id, memory_id, level, url, start_index, end_index, "
+    "rolled_up, parent_id, created_at"
+)
+
+
+def _with_text(row: Row) -> Row:
+    row["summary_text"] = decode_body(row.pop("summary_blob", None), row.pop("summary_codec", None))
+    return row
+
+
+class MemSummariesStore:
+    def __init__(self, conn: SQLiteConnection | None = None, inline_max: Optional[int] = None) -> None:
+        """
+        :param inline_max: 内联摘要阈值（字节），None 时读取 RAG_INLINE_BODY_*，0 表示关闭
+        """
+        self.conn = conn or SQLiteConnection()
+        self.inline_max = inline_max_bytes() if inline_max is None else inline_max
+
+    def create(
+        self,
+        memory_id: str,
+        url: str,
+        level: int = 0,
+        start_index: int = 0,
+        end_index: int = 0,
+        summary_text: Optional[str] = None,
+    ) -> Row:
+        blob, codec = encode_body(summary_text, self.inline_max)
+        rows = self.conn.execute_returning(
+            f"""
+            INSERT INTO mem_summaries(summary_id, memory_id, level, url, summary_blob, summary_codec,
+                                      start_index, end_index)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING {COLUMNS}
+            """,
+            (uuid.uuid4().hex, memory_id, level, url, blob, codec, start_index, end_index),
+        )
+        return rows[0]
+
+    def list_active(self, memory_id: str, limit: Optional[int] = None, with_text: bool = False) -> List[Row]:
+        """
+        未合并的摘要，按覆盖区间从新到旧；limit=None 返回全部
+        （活跃摘要数受 rollup 约束：每层最多 summary_rollup_n - 1 条）
+        """
+        cols = f"{COLUMNS}, summary_blob, summary_codec" if with_text else COLUMNS
+        rows = self.conn.query_all(
+            f"""
+            SELECT {cols} FROM mem_summaries
+             WHERE memory_id = ? AND rolled_up = 0
+             ORDER BY end_index DESC, level ASC, rowid DESC
+             LIMIT ?
+            """,
+            (memory_id, -1 if limit is None else limit),
+        )
+        return [_with_text(r) for r in rows] if with_text else rows
+
+    def list_unrolled(self, memory_id: str, level: int, with_text: bool = False) -> List[Row]:
+        cols = f"{COLUMNS}, summary_blob, summary_codec" if with_text else COLUMNS
+        rows = self.conn.query_all(
+            f"""
+            SELECT {cols} FROM mem_summaries
+             WHERE memory_id = ? AND rolled_up = 0 AND level = ?
+             ORDER BY end_index ASC, rowid ASC
+            """,
+            (memory_id, level),
+        )
+        return [_with_text(r) for r in rows] if with_text else rows
+
+    def mark_rolled_up(self, summary_ids: List[str], parent_id: str) -> int:
+        if not summary_ids:
+            return 0
+        cur = self.conn.execute(
+            """
+            UPDATE mem_summaries
+               SET rolled_up = 1, parent_id = ?
+             WHERE summary_id IN (SELECT value FROM json_each(?))
+            """,
+            (parent_id, json.dumps(list(summary_ids))),
+        )
+        return cur.rowcount
+
+    def count_by_memory(self, memory_id: str) -> int:
+        row = self.conn.query_one(
+            "SELECT COUNT(*) AS n FROM mem_summaries WHERE memory_id = ?", (memory_id,)
+        )
+        return row["n"] if row else 0
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+MemSummaryChunksStore：map-reduce 摘要的分块缓存（mem_summary_chunks）
+- get_many()：按分块哈希批量读取已有的部分摘要
+- put()：写入（同一哈希已存在时保留先写入的结果）
+- delete_older_than()：清理长期未再生成的旧条目
+"""
+from __future__ import annotations
+import json
+from typing import Dict, Iterable
+
+from ..connections.sqlite_connection import SQLiteConnection
+
+
+class MemSummaryChunksStore:
+    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+        self.conn = conn or SQLiteConnection()
+
+    def get_many(self, chunk_hashes: Iterable[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(chunk_hashes))
+        if not keys:
+            return {}
+        rows = self.conn.query_all(
+            """
+            SELECT chunk_hash, summary_text FROM mem_summary_chunks
+             WHERE chunk_hash IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(keys, ensure_ascii=False),),
+        )
+        return {r["chunk_hash"]: r["summary_text"] for r in rows}
+
+    def put(self, chunk_hash: str, summary_text: str) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO mem_summary_chunks(chunk_hash, summary_text)
+            VALUES (?, ?)
+            ON CONFLICT(chunk_hash) DO NOTHING
+            """,
+            (chunk_hash, summary_text),
+        )
+
+    def delete_older_than(self, days: int) -> int:
+        cur = self.conn.execute(
+            "DELETE FROM mem_summary_chunks WHERE created_at < datetime('now', ?)",
+            (f"-{int(days)} days",),
+        )
+        return cur.rowcount
+
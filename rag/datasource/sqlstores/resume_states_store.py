@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+ResumeStatesStore：简历解析状态（resume_states）
+- get()：按 url 读取（调用方比对 etag）
+- upsert()：同一 url 重新解析后整体覆盖
+- delete()
+"""
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional
+
+from ..connections.sqlite_connection import SQLiteConnection
+
+Row = Dict[str, Any]
+
+
+class ResumeStatesStore:
+    COLUMNS = "url, etag, state_json, embedding, embed_model, updated_at"
+
+    def __init__(self, conn: SQLiteConnection | None = None) -> None:
+        self.conn = conn or SQLiteConnection()
+
+    def get(self, url: str) -> Optional[Row]:
+        """返回 {url, etag, state, embedding, embed_model, updated_at}；不存在返回 None"""
+        row = self.conn.query_one(f"SELECT {self.COLUMNS} FROM resume_states WHERE url = ?", (url,))
+        if row is None:
+            return None
+        row["state"] = json.loads(row.pop("state_json"))
+        row["embedding"] = json.loads(row["embedding"]) if row["embedding"] else None
+        return row
+
+    def upsert(
+        self,
+        url: str,
+        etag: str,
+        state: Dict[str, Any],
+        embedding: Optional[List[float]] = None,
+        embed_model: Optional[str] = None,
+    ) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO resume_states(url, etag, state_json, embedding, embed_model)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+              etag = excluded.etag,
+              state_json = excluded.state_json,
+              embedding = excluded.embedding,
+              embed_model = excluded.embed_model,
+              updated_at = datetime('now')
+            """,
+            (
+                url,
+                etag,
+                json.dumps(state, ensure_ascii=False),
+                json.dumps(embedding) if embedding is not None else None,
+                embed_model,
+            ),
+        )
+
+    def delete(self, url: str) -> bool:
+        cur = self.conn.execute("DELETE FROM resume_states WHERE url = ?", (url,))
+        return cur.rowcount > 0
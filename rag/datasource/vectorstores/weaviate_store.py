@@ -2,7 +2,7 @@
 """
 WeaviateStore (v4 专用)
 - BYOV（自带向量）
-- 支持 add_texts / batch_upsert / search / query_by_text / replace_one / delete / list_collections
+- 支持 add_texts / batch_upsert / search / query_by_text / fetch_with_vectors / replace_one / delete / list_collections
 - 封装 app/memory_id 元数据，方便做过滤
 """
 
@@ -17,6 +17,8 @@ import weaviate.classes.query as wq
 from weaviate.exceptions import UnexpectedStatusCodeError
 from weaviate.classes.query import Filter
 from rag.datasource.connections.weaviate_connection import WeaviateConnection
+from rag.utils import deadline
+from rag.utils.tracing import span
 
 
 def _norm_class(name: str) -> str:
@@ -37,6 +39,13 @@ def _env_int(key: str, default: Optional[int]) -> Optional[int]:
         return default
 
 
+def default_vector(vec):
+    """v4 返回 {"default": [...]}（命名向量），统一取默认向量"""
+    if isinstance(vec, dict):
+        return vec.get("default") or next(iter(vec.values()), None)
+    return vec
+
+
 class WeaviateStore:
     def __init__(
         self,
@@ -151,7 +160,7 @@ class WeaviateStore:
         col = self.client.collections.get(col_name)
 
         ids: List[str] = []
-        with col.batch.dynamic() as batch:
+        with span("weaviate.batch", collection=col_name, objects=len(texts)), col.batch.dynamic() as batch:
             for t, v, m in zip(texts, vectors, metadatas):
                 #  属性里同时写入 url/role，方便过滤删除与直接读取
                 props = {
@@ -210,7 +219,11 @@ class WeaviateStore:
     def search(self, query_vector: List[float], top_k: int = 8,
                collection: Optional[str] = None,
                filters: Optional[dict] = None,  # 例如 {"memory_id": "...", "app": "..."}
-               return_meta: bool = True,) -> List[Dict[str, Any]]:
+               return_meta: bool = True,
+               include_vector: bool = False,) -> List[Dict[str, Any]]:
+        """
+        向量检索，返回 [{"properties", "score"}]；include_vector=True 时附带 "vector"（供 MMR / 去重使用）
+        """
         if self.embedding_dim and len(query_vector) != self.embedding_dim:
             raise ValueError(f"查询向量维度={len(query_vector)} 与 EMBEDDING_DIM={self.embedding_dim} 不一致")
 
@@ -226,12 +239,16 @@ class WeaviateStore:
                 clauses.append(Filter.by_property(k).equal(v))
             where = Filter.all_of(clauses)
 
-        res = col.query.near_vector(
-            near_vector=query_vector,
-            limit=top_k,
-            return_metadata=wq.MetadataQuery(distance=True),
-            filters=where,
-        )
+        deadline.check("weaviate.search")
+        with span("weaviate.search", collection=col_name, top_k=top_k) as s:
+            res = col.query.near_vector(
+                near_vector=query_vector,
+                limit=top_k,
+                return_metadata=wq.MetadataQuery(distance=True),
+                filters=where,
+                include_vector=include_vector,
+            )
+            s.set(hits=len(res.objects or []))
         hits = []
         for o in res.objects or []:
             props = o.properties or {}
@@ -239,7 +256,10 @@ class WeaviateStore:
             dist = getattr(o.metadata, "distance", None)
             # 统一到 score：越大越相关
             score = 1 / (1 + dist) if dist is not None else 0.0
-            hits.append({"properties": props, "score": score})
+            hit = {"properties": props, "score": score}
+            if include_vector:
+                hit["vector"] = default_vector(o.vector)
+            hits.append(hit)
         return hits
 
     def query_by_text(
@@ -286,6 +306,35 @@ class WeaviateStore:
             for o in (res.objects or [])
         ]
 
+    def fetch_with_vectors(
+        self,
+        collection: Optional[str] = None,
+        filters: Optional[dict] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        按过滤条件拉取对象及其向量（不做相似度排序），供进程内小索引加载使用
+        返回 [{"id", "properties", "vector"}]
+        """
+        col_name = _norm_class(collection or self.collection)
+        col = self.client.collections.get(col_name)
+
+        where = None
+        if filters:
+            where = Filter.all_of([Filter.by_property(k).equal(v) for k, v in filters.items()])
+
+        deadline.check("weaviate.fetch")
+        with span("weaviate.fetch", collection=col_name, limit=limit) as s:
+            res = col.query.fetch_objects(filters=where, limit=limit, include_vector=True)
+            s.set(objects=len(res.objects or []))
+        out = []
+        for o in res.objects or []:
+            vec = default_vector(o.vector)
+            if vec is None:
+                continue
+            out.append({"id": str(o.uuid), "properties": o.properties or {}, "vector": vec})
+        return out
+
     # ---------- 删除 ----------
     def delete(self, object_id: str) -> bool:
         """v4 delete 幂等，总是返回 True"""
@@ -1,10 +1,12 @@
 # rag/llm/embeddings/openai_embedding.py
 import os
-import time
 from typing import List, Iterable
 
 import httpx
 
+from rag.utils import deadline
+from rag.utils.tracing import span
+
 DEFAULT_EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 OPENAI_API_BASE = os.getenv("EMBED_API_BASE", "https://api.openai.com/v1")
 OPENAI_API_KEY = os.getenv("EMBED_API_KEY", "")
@@ -15,6 +17,11 @@ class OpenAIEmbedder:
             raise RuntimeError("API_KEY 未设置")
         self.model = model
         self.timeout = timeout
+        # 复用连接池（httpx.Client 线程安全）
+        self._http = httpx.Client(base_url=OPENAI_API_BASE, timeout=self.timeout)
+
+    def close(self) -> None:
+        self._http.close()
 
     def embed_query(self, text: str) -> List[float]:
         return self._embed_batch([text])[0]
@@ -26,15 +33,18 @@ class OpenAIEmbedder:
     def _embed_batch(self, inputs: List[str]) -> List[List[float]]:
         payload = {"model": self.model, "input": inputs}
         headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-        with httpx.Client(base_url=OPENAI_API_BASE, timeout=self.timeout) as client:
+        with span("embedding", model=self.model, inputs=len(inputs)) as s:
             # /embeddings
-            for _ in range(3):
+            for attempt in range(3):
+                deadline.check("embedding")
+                s.set(attempts=attempt + 1)
                 try:
-                    r = client.post("/embeddings", json=payload, headers=headers)
+                    r = self._http.post("/embeddings", json=payload, headers=headers, timeout=deadline.timeout(self.timeout))
                     r.raise_for_status()
                     data = r.json()
+                    s.set(prompt_tokens=(data.get("usage") or {}).get("prompt_tokens", 0))
                     return [item["embedding"] for item in data["data"]]
                 except Exception as e:
-                    time.sleep(1.2)
                     last_err = e
+                    deadline.backoff(1.2, "embedding")
             raise RuntimeError(f"Embedding 失败: {last_err}")
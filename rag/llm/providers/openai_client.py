@@ -3,14 +3,17 @@
 极简 OpenAI 风格 LLM 封装（/v1/chat/completions）
 - 适配标准 OpenAI 与兼容网关（如火山方舟 Ark 的 OpenAI 兼容端）
 - 仅实现同步非流式调用（简单、稳定、好调试）
+- 实例内复用一个 httpx.Client（连接池，线程安全），应作为长生命周期组件共享（见 rag/api/container.py）
 """
 
 import os
-import time
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import httpx
 
+from rag.utils import deadline
+from rag.utils.tracing import span
+
 
 def _env(key: str, default: Optional[str] = None) -> Optional[str]:
     v = os.getenv(key)
@@ -42,6 +45,10 @@ class OpenAIClient:
             raise RuntimeError("OPENAI_API_KEY 未设置")
         self.timeout = timeout
         self.max_retries = max_retries
+        self._http = httpx.Client(base_url=self.api_base, timeout=self.timeout)
+
+    def close(self) -> None:
+        self._http.close()
 
     # --------------- Public APIs ---------------
 
@@ -99,22 +106,31 @@ class OpenAIClient:
 
         # 简单重试（指数退避）
         last_err: Optional[Exception] = None
-        for attempt in range(self.max_retries):
-            try:
-                with httpx.Client(base_url=self.api_base, timeout=self.timeout) as client:
-                    r = client.post("/chat/completions", headers=headers, json=payload)
+        with span("llm.chat", model=self.model, max_tokens=max_tokens) as s:
+            for attempt in range(self.max_retries):
+                deadline.check("llm.chat")
+                s.set(attempts=attempt + 1)
+                try:
+                    r = self._http.post(
+                        "/chat/completions", headers=headers, json=payload, timeout=deadline.timeout(self.timeout)
+                    )
                     r.raise_for_status()
                     data = r.json()
-                text = (
-                    data["choices"][0]["message"]["content"]
-                    if data.get("choices")
-                    else ""
-                )
-                return text, data
-            except Exception as e:
-                last_err = e
-                # 429/5xx 等退避；第 n 次退 n*0.8s
-                time.sleep(0.8 * (attempt + 1))
+                    text = (
+                        data["choices"][0]["message"]["content"]
+                        if data.get("choices")
+                        else ""
+                    )
+                    usage = data.get("usage") or {}
+                    s.set(
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0),
+                    )
+                    return text, data
+                except Exception as e:
+                    last_err = e
+                    # 429/5xx 等退避；第 n 次退 n*0.8s（不超过请求截止时间，已超时抛 DeadlineExceeded）
+                    deadline.backoff(0.8 * (attempt + 1), "llm.chat")
         raise RuntimeError(f"OpenAI chat 调用失败: {last_err}")
 
     def rag_answer(
@@ -0,0 +1,144 @@
+# rag/memory/answer_cache.py
+# -*- coding: utf-8 -*-
+"""
+AnswerCache: 每个 memory 的语义答案缓存（进程内，默认关闭）
+- 保存 (query 向量 → 答案)，同一 memory 内换个说法再问时，余弦相似度超过阈值直接返回上次的答案，
+  命中只需一次向量比较，省去检索与 LLM 调用
+- 以 mem_primary.context_version 校验：push / 摘要 / 删除都会提升版本，版本不一致整个 memory 的条目作废
+- 只在相同检索参数（params_key，如 recent_k / aux_top_k / max_tokens）下复用
+- 条目带 TTL；每个 memory 至多 max_per_memory 条（淘汰最旧），memory 之间按 LRU 淘汰
+
+环境变量：
+- RAG_ANSWER_CACHE_ENABLED：默认 false
+- RAG_ANSWER_CACHE_THRESHOLD：命中阈值（余弦），默认 0.95
+- RAG_ANSWER_CACHE_TTL_S：条目有效期（秒），默认 600
+- RAG_ANSWER_CACHE_MAX_PER_MEMORY：每个 memory 的条目上限，默认 32
+- RAG_ANSWER_CACHE_MAX_MEMORIES：缓存的 memory 数上限，默认 1024
+"""
+
+from __future__ import annotations
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from rag.utils.metrics import record_cache
+
+
+def _unit(vec: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+class _Entry:
+    __slots__ = ("vector", "params_key", "query", "answer", "created")
+
+    def __init__(self, vector: List[float], params_key: str, query: str, answer: str, created: float):
+        self.vector = vector
+        self.params_key = params_key
+        self.query = query
+        self.answer = answer
+        self.created = created
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        threshold: Optional[float] = None,
+        ttl_s: Optional[float] = None,
+        max_per_memory: Optional[int] = None,
+        max_memories: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """参数为 None 时读取对应环境变量"""
+        self.enabled = (
+            os.getenv("RAG_ANSWER_CACHE_ENABLED", "false").lower() == "true" if enabled is None else enabled
+        )
+        self.threshold = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")) if threshold is None else threshold
+        self.ttl_s = float(os.getenv("RAG_ANSWER_CACHE_TTL_S", "600")) if ttl_s is None else ttl_s
+        self.max_per_memory = (
+            int(os.getenv("RAG_ANSWER_CACHE_MAX_PER_MEMORY", "32")) if max_per_memory is None else max_per_memory
+        )
+        self.max_memories = (
+            int(os.getenv("RAG_ANSWER_CACHE_MAX_MEMORIES", "1024")) if max_memories is None else max_memories
+        )
+        self._clock = clock
+        # {memory_id: {"version": int, "entries": [_Entry, ...]}}（旧 → 新）
+        self._buckets: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- 读写 ----------
+    def get(
+        self,
+        memory_id: str,
+        version: Optional[int],
+        params_key: str,
+        vector: Sequence[float],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        返回最相似的有效条目 {"answer", "query", "similarity", "age_s"}；未命中返回 None
+        """
+        if not self.enabled or version is None:
+            return None
+        q = _unit(vector)
+        now = self._clock()
+        best, best_sim = None, self.threshold
+        with self._lock:
+            bucket = self._buckets.get(memory_id)
+            if bucket is not None and bucket["version"] != version:
+                del self._buckets[memory_id]
+                bucket = None
+            if bucket is not None:
+                bucket["entries"] = [e for e in bucket["entries"] if now - e.created <= self.ttl_s]
+                for e in bucket["entries"]:
+                    if e.params_key != params_key:
+                        continue
+                    sim = sum(a * b for a, b in zip(q, e.vector))
+                    if sim >= best_sim:
+                        best, best_sim = e, sim
+                self._buckets.move_to_end(memory_id)
+        record_cache("answer", best is not None)
+        if best is None:
+            return None
+        return {
+            "answer": best.answer,
+            "query": best.query,
+            "similarity": round(best_sim, 4),
+            "age_s": round(now - best.created, 1),
+        }
+
+    def put(
+        self,
+        memory_id: str,
+        version: Optional[int],
+        params_key: str,
+        vector: Sequence[float],
+        query: str,
+        answer: str,
+    ) -> None:
+        """version 为生成答案前读取的 context_version；生成期间版本已前移时该条目在下次 get 时作废"""
+        if not self.enabled or version is None or self.max_per_memory <= 0:
+            return
+        entry = _Entry(_unit(vector), params_key, query, answer, self._clock())
+        with self._lock:
+            bucket = self._buckets.get(memory_id)
+            if bucket is None or bucket["version"] != version:
+                bucket = self._buckets[memory_id] = {"version": version, "entries": []}
+            entries = bucket["entries"]
+            entries.append(entry)
+            del entries[:-self.max_per_memory]
+            self._buckets.move_to_end(memory_id)
+            while len(self._buckets) > self.max_memories:
+                self._buckets.popitem(last=False)
+
+    def invalidate(self, memory_id: str) -> None:
+        with self._lock:
+            self._buckets.pop(memory_id, None)
+
+
+def answer_params_key(**params: Any) -> str:
+    """检索 / 拼装参数组成的条目键（参数不同的答案不复用）"""
+    return "|".join(f"{k}={params[k]}" for k in sorted(params))
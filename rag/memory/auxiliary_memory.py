@@ -2,45 +2,75 @@
 # -*- coding: utf-8 -*-
 """
 AuxiliaryMemory: 辅助记忆模块
-- A1: add_message() 从 MinIO 读取 QA，逐条向量化并存入 Weaviate
-- A2: search() 输入 query，向量化后检索相似历史消息
+- A1: add_message() 读取 QA（或使用调用方已解析的消息），批量向量化并存入 Weaviate
+- A2: search() 输入 query，向量化后检索相似历史消息（小记忆走进程内 numpy 索引，见 local_index.py）
 - A3: delete_message() 删除某个 url 对应的所有 QA
 - A3: clear_memory() 清空整个 memory_id 的辅助记忆
-- A4: 配置化，从 mem_registry.params_json 读取默认参数
+- A4: 配置化，从 mem_registry 读取默认参数（MemoryParams，进程内缓存）
 """
 
 import json
-from typing import Optional, Dict, Any, List
+import os
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from rag.datasource.base import Datasource
+from rag.datasource.sqlstores.mem_registry_store import MemoryParams
 from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
+from rag.memory.local_index import LocalVectorIndex, local_index_available
+from rag.utils.messages import parse_messages
+from rag.utils.tracing import span, traced
+
+AUX_COLLECTION = "AuxiliaryMemory"
 
 
 class AuxiliaryMemory:
-    def __init__(self, ds: Datasource, embedder: Optional[OpenAIEmbedder] = None):
+    def __init__(
+        self,
+        ds: Datasource,
+        embedder: Optional[OpenAIEmbedder] = None,
+        embedder_factory: Optional[Callable[[str], Any]] = None,
+    ):
         """
         :param ds: Datasource 实例（聚合 weaviate, minio, registry）
-        :param embedder: embedding 模型实例（默认 OpenAIEmbedder）
+        :param embedder: embedding 模型实例（默认 OpenAIEmbedder），未配置 embedding_model 的 memory 使用
+        :param embedder_factory: 按模型名新建 embedder 的函数（memory 配置了其他 embedding_model 时首次使用调用），
+            默认 OpenAIEmbedder(model=...)
         """
         self.ds = ds
         self.embedder = embedder or OpenAIEmbedder()
+        # 每个模型一个 embedder（懒创建后复用）；共享实例的 model 不再被修改，并发请求互不干扰
+        self._embedder_factory = embedder_factory or (lambda model: OpenAIEmbedder(model=model))
+        self._embedders: Dict[str, Any] = {}
+        self._embedders_lock = threading.Lock()
+        # 单次 embedding 请求的最大条数（批量写入时分批）
+        self.embed_batch_size = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+        # 小记忆走进程内向量检索（需要 numpy；RAG_LOCAL_INDEX_ENABLED=false 关闭）
+        self.local: Optional[LocalVectorIndex] = LocalVectorIndex() if local_index_available() else None
 
         if getattr(self.ds, "weaviate", None) is None:
             raise RuntimeError("Datasource.weaviate 未启用，请配置 WEAVIATE_ENABLED")
 
     # ---------- 内部工具 ----------
-    def _get_params(self, memory_id: str) -> dict:
-        """从 mem_registry 读取配置参数"""
-        reg_row = self.ds.mem_registry.get(memory_id)
-        if not reg_row:
-            return {}
-
-        params = {}
-        if reg_row.get("params_json"):
-            try:
-                params = json.loads(reg_row["params_json"])
-            except Exception:
-                params = {}
-        return params
+    @staticmethod
+    def _local_key(memory_id: str, app: str) -> str:
+        return f"{app}/{memory_id}"
+
+    def _get_params(self, memory_id: str) -> MemoryParams:
+        """从 mem_registry 读取配置参数（缓存的类型化对象；未注册时返回默认值）"""
+        return self.ds.mem_registry.get_params(memory_id) or MemoryParams()
+
+    def _embedder_for(self, memory_id: str):
+        """该 memory 配置的 embedding 模型对应的 embedder；未配置或与默认相同时用共享实例"""
+        model = self._get_params(memory_id).embedding_model
+        if not model or model == getattr(self.embedder, "model", None):
+            return self.embedder
+        embedder = self._embedders.get(model)
+        if embedder is None:
+            with self._embedders_lock:
+                embedder = self._embedders.get(model)
+                if embedder is None:
+                    embedder = self._embedders[model] = self._embedder_factory(model)
+        return embedder
 
     # ---------- A1: 基础存储 ----------
     def add_message(
@@ -49,60 +79,101 @@ class AuxiliaryMemory:
         app: str,
         url: str,
         metadata: Optional[Dict[str, Any]] = None,
+        messages: Optional[List[Dict[str, Any]]] = None,
     ) -> List[str]:
         """
-        从 MinIO 读取 QA，逐条向量化并写入向量数据库
+        向量化一条对话中的各条 QA 并写入向量数据库
         :param memory_id: 记忆空间 ID
         :param app: 业务 app 名
         :param url: MinIO 对象 key（存放 QA JSON 或文本）
         :param metadata: 附加元信息
+        :param messages: 调用方已读取并解析好的消息（parse_messages 结果）；不传则从 MinIO 读取
         :return: 对象 ID 列表
         """
-        # 1) 从 MinIO 读取内容
-        raw_text = self.ds.minio.get_text(url)
-
-        # 2) 尝试解析 QA
-        try:
-            data = json.loads(raw_text)
-            if isinstance(data, list):
-                messages = data
-            elif isinstance(data, dict) and "qa" in data:
-                messages = data["qa"]
-            else:
-                messages = [{"role": "user", "content": raw_text}]
-        except Exception:
-            messages = [{"role": "user", "content": raw_text}]
-
-        texts, vectors, metas = [], [], []
-        for msg in messages:
-            content = msg.get("content", "")
-            role = msg.get("role", "user")
-            if not content.strip():
-                continue
+        # 未传入时从 MinIO 读取并解析
+        if messages is None:
+            messages = parse_messages(self.ds.minio.get_text(url))
+        return self.add_messages(memory_id, app, [(url, messages)], metadata=metadata)
+
+    def add_messages(
+        self,
+        memory_id: str,
+        app: str,
+        items: List[Tuple[str, List[Dict[str, Any]]]],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        """
+        批量写入多条对话：items 为 [(url, messages), ...]
+        - 所有 QA 按 embed_batch_size 分批向量化（通常一次请求）
+        - 一次 Weaviate batch 写入，成功后才提升 vector_version 并增量更新进程内小索引
+        """
+        texts, metas = [], []
+        for url, messages in items:
+            for msg in messages:
+                content = msg.get("content", "")
+                role = msg.get("role", "user")
+                if not content.strip():
+                    continue
+                texts.append(content)
+                meta = {"url": url, "role": role}
+                if metadata:
+                    meta.update(metadata)
+                metas.append(meta)
 
-            # 3) 向量化
-            vec = self.embedder.embed_query(content)
+        if not texts:
+            return []
 
-            # 4) 准备写入
-            texts.append(content)
-            vectors.append(vec)
-            meta = {"url": url, "role": role}
-            if metadata:
-                meta.update(metadata)
-            metas.append(meta)
+        # 1) 批量向量化（与 query 使用同一个模型）
+        embedder = self._embedder_for(memory_id)
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            vectors.extend(embedder.embed_documents(texts[i:i + self.embed_batch_size]))
 
-        # 5) 写入 Weaviate
+        # 2) 写入 Weaviate
         ids = self.ds.weaviate.add_texts(
             texts=texts,
             vectors=vectors,
             metadatas=metas,
             memory_id=memory_id,
             app=app,
-            collection="AuxiliaryMemory",
+            collection=AUX_COLLECTION,
         )
+        version = self.ds.mem_primary.bump_vector_version(memory_id)
+
+        # 3) 进程内小索引增量追加（属性结构与 Weaviate 中一致）
+        if self.local is not None:
+            props = [
+                {
+                    "text": t,
+                    "meta": json.dumps(m, ensure_ascii=False),
+                    "url": m.get("url"),
+                    "role": m.get("role"),
+                    "memory_id": memory_id,
+                    "app": app,
+                }
+                for t, m in zip(texts, metas)
+            ]
+            self.local.add(self._local_key(memory_id, app), vectors, props, version)
         return ids
 
     # ---------- A2: 相似检索 ----------
+    def embedding_model(self, memory_id: str) -> Optional[str]:
+        """该 memory 的 query 向量所用的 embedding 模型（与 embed_query 的选择一致）"""
+        return self._get_params(memory_id).embedding_model or getattr(self.embedder, "model", None)
+
+    def embed_query(self, memory_id: str, query: str) -> List[float]:
+        """按该 memory 配置的 embedding 模型向量化 query"""
+        return self._embedder_for(memory_id).embed_query(query)
+
+    def close(self) -> None:
+        """释放按模型新建的 embedder（共享实例由创建方负责）"""
+        with self._embedders_lock:
+            embedders, self._embedders = list(self._embedders.values()), {}
+        for embedder in embedders:
+            if hasattr(embedder, "close"):
+                embedder.close()
+
+    @traced("auxiliary.search")
     def search(
         self,
         memory_id: str,
@@ -110,34 +181,48 @@ class AuxiliaryMemory:
         query: str,
         top_k: Optional[int] = None,
         score_threshold: Optional[float] = None,
+        include_vector: bool = False,
+        query_vector: Optional[List[float]] = None,
     ):
         """
         在指定 memory_id 下检索与 query 最相关的历史消息。
         支持从 params_json 读取默认配置。
+        include_vector=True 时每条命中附带 "vector"（供 rag/core/selectors 去冗余）。
+        query_vector：调用方已算好的 query 向量（embed_query 的结果），传入时不再重复向量化。
         """
         # 1) 从 registry 读取配置
         params = self._get_params(memory_id)
         if top_k is None:
-            top_k = params.get("aux_top_k", 5)
+            top_k = params.aux_top_k
         if score_threshold is None:
-            score_threshold = params.get("aux_score_threshold")
-
-        embed_model = params.get("embedding_model")
-        if embed_model and getattr(self.embedder, "model", None) != embed_model:
-            # 动态切换 embedder 模型
-            self.embedder.model = embed_model
+            score_threshold = params.aux_score_threshold
 
         # 2) 向量化 query
-        q_vec = self.embedder.embed_query(query)
+        q_vec = query_vector if query_vector is not None else self.embed_query(memory_id, query)
 
-        # 3) 调用 weaviate 搜索
-        results = self.ds.weaviate.search(
-            collection="AuxiliaryMemory",
-            query_vector=q_vec,
-            top_k=top_k,
-            filters={"memory_id": memory_id, "app": app},
-        )
-        print("Weaviate results", results)
+        # 3) 小记忆：进程内矩阵检索；大记忆（或未启用）走 Weaviate
+        filters = {"memory_id": memory_id, "app": app}
+        results = None
+        if self.local is not None:
+            with span("auxiliary.local_index") as s:
+                entry = self.local.get(
+                    self._local_key(memory_id, app),
+                    self.ds.mem_primary.get_vector_version(memory_id),
+                    lambda limit: self.ds.weaviate.fetch_with_vectors(
+                        collection=AUX_COLLECTION, filters=filters, limit=limit
+                    ),
+                )
+                s.set(used=entry is not None)
+                if entry is not None:
+                    results = self.local.search(entry, q_vec, top_k, include_vector=include_vector)
+        if results is None:
+            results = self.ds.weaviate.search(
+                collection=AUX_COLLECTION,
+                query_vector=q_vec,
+                top_k=top_k,
+                filters=filters,
+                include_vector=include_vector,
+            )
 
         # 4) 格式化输出
         hits = []
@@ -159,12 +244,15 @@ class AuxiliaryMemory:
             url = props.get("url") or meta.get("url")
             role = props.get("role") or meta.get("role")
 
-            hits.append({
+            hit = {
                 "content": content,  # Weaviate 结果里的文本字段
                 "url": url,
                 "role": role,
                 "score": score,
-            })
+            }
+            if include_vector:
+                hit["vector"] = r.get("vector")
+            hits.append(hit)
         return hits
 
     # ---------- A3: 删除 ----------
@@ -173,9 +261,10 @@ class AuxiliaryMemory:
         从向量库中删除属于指定 memory_id + url 的所有 QA。
         """
         deleted = self.ds.weaviate.delete_by_filter(
-            collection="AuxiliaryMemory",
+            collection=AUX_COLLECTION,
             filters={"memory_id": memory_id, "app": app, "url": url},
         )
+        self._after_delete(memory_id, app)
         return deleted
 
     def clear_memory(self, memory_id: str, app: str) -> int:
@@ -183,7 +272,17 @@ class AuxiliaryMemory:
         清空某个 memory_id 下的所有辅助记忆。
         """
         deleted = self.ds.weaviate.delete_by_filter(
-            collection="AuxiliaryMemory",
+            collection=AUX_COLLECTION,
             filters={"memory_id": memory_id, "app": app},
         )
+        self._after_delete(memory_id, app)
         return deleted
+
+    def _after_delete(self, memory_id: str, app: str) -> None:
+        """
+        删除落到 Weaviate 之后：提升 vector_version（其他进程缓存的小索引据此失效），
+        并直接丢弃本进程的缓存
+        """
+        self.ds.mem_primary.bump_vector_version(memory_id)
+        if self.local is not None:
+            self.local.invalidate(self._local_key(memory_id, app))
@@ -0,0 +1,132 @@
+# rag/memory/context_snapshot.py
+# -*- coding: utf-8 -*-
+"""
+ContextSnapshotCache: 每个 memory 的上下文快照（摘要 + 最近消息正文）
+- 一级：进程内 LRU（RAG_CONTEXT_CACHE_SIZE，默认 1024，0 关闭）
+- 二级（可选）：mem_context_snapshots 表，同机多进程共享（RAG_CONTEXT_SNAPSHOT_SHARED=true）
+- 以 mem_primary.context_version 校验：push / 删除 / 摘要都会提升版本，版本不一致即视为失效
+- push_message 时增量更新（新消息插到最近列表头部），删除 / 摘要时整体失效
+
+查询路径命中快照后只需一次主键读取版本号 + 辅助向量检索。
+"""
+
+from __future__ import annotations
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from rag.datasource.sqlstores.mem_context_snapshots_store import MemContextSnapshotsStore
+
+Snapshot = Dict[str, Any]
+
+
+def snapshot_shape(summary_k: Optional[int], recent_k: int) -> str:
+    return f"s:{'all' if summary_k is None else summary_k}|r:{recent_k}"
+
+
+class ContextSnapshotCache:
+    def __init__(
+        self,
+        shared: Optional[MemContextSnapshotsStore] = None,
+        max_entries: Optional[int] = None,
+    ):
+        """
+        :param shared: 二级共享存储；None 表示只用进程内缓存
+        :param max_entries: 进程内最多缓存的快照数，None 时读取 RAG_CONTEXT_CACHE_SIZE
+        """
+        self.shared = shared
+        self.max_entries = (
+            int(os.getenv("RAG_CONTEXT_CACHE_SIZE", "1024")) if max_entries is None else max_entries
+        )
+        self._lru: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._shapes: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.shared is not None
+
+    # ---------- 读写 ----------
+    def get(self, memory_id: str, shape: str, version: int) -> Optional[Snapshot]:
+        key = (memory_id, shape)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and entry["version"] == version:
+                self._lru.move_to_end(key)
+                return copy.deepcopy(entry["snapshot"])
+
+        if self.shared is None:
+            return None
+        row = self.shared.get(memory_id, shape)
+        if row is None or row["version"] != version:
+            return None
+        self._put_local(memory_id, shape, version, row["snapshot"])
+        return copy.deepcopy(row["snapshot"])
+
+    def put(self, memory_id: str, shape: str, version: int, snapshot: Snapshot) -> None:
+        snapshot = copy.deepcopy(snapshot)
+        self._put_local(memory_id, shape, version, snapshot)
+        if self.shared is not None:
+            self.shared.put(memory_id, shape, version, snapshot)
+
+    def _put_local(self, memory_id: str, shape: str, version: int, snapshot: Snapshot) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (memory_id, shape)
+        with self._lock:
+            self._lru[key] = {"version": version, "snapshot": snapshot}
+            self._lru.move_to_end(key)
+            self._shapes.setdefault(memory_id, set()).add(shape)
+            while len(self._lru) > self.max_entries:
+                (old_mid, old_shape), _ = self._lru.popitem(last=False)
+                shapes = self._shapes.get(old_mid)
+                if shapes is not None:
+                    shapes.discard(old_shape)
+                    if not shapes:
+                        del self._shapes[old_mid]
+
+    # ---------- 增量更新 / 失效 ----------
+    def on_push(self, memory_id: str, url: str, body: Optional[str], version: int) -> None:
+        """
+        新消息写入后（version 为写入后的 context_version）：
+        快照恰好停在上一个版本时把新消息插到最近列表头部并前移版本，否则丢弃
+        """
+        updated = []
+        with self._lock:
+            for shape in list(self._shapes.get(memory_id, ())):
+                key = (memory_id, shape)
+                entry = self._lru.get(key)
+                snap = entry["snapshot"] if entry else None
+                recent_k = int(shape.rsplit("r:", 1)[1])
+                if (
+                    entry is None
+                    or body is None
+                    or entry["version"] != version - 1
+                    or url in snap["recent_urls"]
+                ):
+                    self._lru.pop(key, None)
+                    self._shapes[memory_id].discard(shape)
+                    continue
+                recent = ([url] + snap["recent_urls"])[:recent_k]
+                keep = set(recent) | set(snap["summary_urls"])
+                texts = {u: t for u, t in snap["texts"].items() if u in keep}
+                if url in keep:
+                    texts[url] = body
+                snap.update(recent_urls=recent, texts=texts)
+                entry["version"] = version
+                updated.append((shape, copy.deepcopy(snap)))
+            if not self._shapes.get(memory_id):
+                self._shapes.pop(memory_id, None)
+
+        if self.shared is not None:
+            for shape, snap in updated:
+                self.shared.put(memory_id, shape, version, snap)
+
+    def invalidate(self, memory_id: str) -> None:
+        with self._lock:
+            for shape in self._shapes.pop(memory_id, ()):
+                self._lru.pop((memory_id, shape), None)
+        if self.shared is not None:
+            self.shared.delete_by_memory(memory_id)
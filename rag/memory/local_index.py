@@ -0,0 +1,189 @@
+# rag/memory/local_index.py
+# -*- coding: utf-8 -*-
+"""
+LocalVectorIndex: 小记忆的进程内向量检索
+- 消息向量数 ≤ max_vectors（RAG_LOCAL_INDEX_MAX_VECTORS，默认 512）的 memory，
+  首次检索时从 Weaviate 拉取全部向量，缓存为归一化的 float32 矩阵，之后用一次矩阵乘完成检索
+- 超过阈值的 memory 只记一个“过大”标记，继续走 Weaviate
+- 以 mem_primary.vector_version 校验（向量写入 / 删除落到 Weaviate 后才递增，摘要不影响）：版本一致才复用；
+  push 时增量追加并前移版本，删除时整体失效
+- 锁外加载期间若有 add() / invalidate()（或已缓存更新的版本），加载结果只用于本次检索、不写回缓存，
+  避免慢加载覆盖掉并发写入之后的状态
+- 最多缓存 RAG_LOCAL_INDEX_MAX_MEMORIES（默认 256）个 memory，LRU 淘汰
+
+阈值可用 infra/scripts/bench_local_vector_search.py 测出的交叉点调整。
+打分与 Weaviate（cosine 距离）一致：score = 1 / (1 + (1 - cos))，score_threshold 两边通用。
+"""
+
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from rag.utils.metrics import record_cache
+
+try:
+    import numpy as np
+except ImportError:  # numpy 未安装时不启用本地索引
+    np = None
+
+Loader = Callable[[int], List[Dict[str, Any]]]
+
+
+def local_index_available() -> bool:
+    return np is not None and os.getenv("RAG_LOCAL_INDEX_ENABLED", "true").lower() == "true"
+
+
+class _Entry:
+    __slots__ = ("version", "large", "matrix", "props")
+
+    def __init__(self, version: Optional[int], large: bool = False, matrix=None, props=None):
+        self.version = version
+        self.large = large
+        self.matrix = matrix                    # (n, d) float32，行已归一化
+        self.props: List[Dict[str, Any]] = props or []
+
+
+def _normalize(vectors) -> "np.ndarray":
+    m = np.asarray(vectors, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class LocalVectorIndex:
+    def __init__(self, max_vectors: Optional[int] = None, max_memories: Optional[int] = None):
+        if np is None:
+            raise RuntimeError("LocalVectorIndex 需要 numpy")
+        self.max_vectors = (
+            int(os.getenv("RAG_LOCAL_INDEX_MAX_VECTORS", "512")) if max_vectors is None else max_vectors
+        )
+        self.max_memories = (
+            int(os.getenv("RAG_LOCAL_INDEX_MAX_MEMORIES", "256")) if max_memories is None else max_memories
+        )
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 正在锁外加载的 memory → 并发加载数；加载期间发生写入的 memory 记入 _stale
+        self._loading: Dict[str, int] = {}
+        self._stale: Set[str] = set()
+        self._lock = threading.Lock()
+
+    # ---------- 加载 ----------
+    def get(self, memory_id: str, version: Optional[int], loader: Loader) -> Optional[_Entry]:
+        """
+        返回可用于本地检索的条目；memory 过大时返回 None（调用方走 Weaviate）。
+        loader(limit) 返回 [{"properties", "vector"}]，最多 limit 条。
+        """
+        with self._lock:
+            entry = self._entries.get(memory_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(memory_id)
+                record_cache("local_index", True)
+                return None if entry.large else entry
+            self._loading[memory_id] = self._loading.get(memory_id, 0) + 1
+        record_cache("local_index", False)
+
+        # 锁外加载（网络 IO）
+        try:
+            objs = loader(self.max_vectors + 1)
+        except BaseException:
+            self._finish_load(memory_id, None)
+            raise
+        if len(objs) > self.max_vectors:
+            entry = _Entry(version, large=True)
+        elif objs:
+            entry = _Entry(
+                version,
+                matrix=_normalize([o["vector"] for o in objs]),
+                props=[o["properties"] for o in objs],
+            )
+        else:
+            entry = _Entry(version, matrix=None, props=[])
+        self._finish_load(memory_id, entry)
+        return None if entry.large else entry
+
+    def _finish_load(self, memory_id: str, entry: Optional[_Entry]) -> None:
+        """加载结束：加载期间无写入、且缓存中没有更新的版本时才写回"""
+        with self._lock:
+            left = self._loading.get(memory_id, 1) - 1
+            if left > 0:
+                self._loading[memory_id] = left
+                stale = memory_id in self._stale
+            else:
+                self._loading.pop(memory_id, None)
+                stale = memory_id in self._stale
+                self._stale.discard(memory_id)
+            if entry is None or stale:
+                return
+            current = self._entries.get(memory_id)
+            if current is not None and entry.version is not None and current.version is not None:
+                if current.version >= entry.version:
+                    return
+            self._entries[memory_id] = entry
+            self._entries.move_to_end(memory_id)
+            while len(self._entries) > self.max_memories:
+                self._entries.popitem(last=False)
+
+    # ---------- 增量更新 / 失效 ----------
+    def add(
+        self,
+        memory_id: str,
+        vectors: List[List[float]],
+        props: List[Dict[str, Any]],
+        version: Optional[int],
+    ) -> None:
+        """
+        写入 Weaviate 之后调用（version 为写入成功后递增得到的 vector_version）：
+        缓存恰好停在上一个版本时追加并前移版本，否则丢弃（下次检索重新加载）
+        """
+        with self._lock:
+            if memory_id in self._loading:
+                self._stale.add(memory_id)
+            entry = self._entries.get(memory_id)
+            if entry is None:
+                return
+            if version is None or entry.version != version - 1 or entry.large:
+                self._entries.pop(memory_id, None)
+                return
+            if len(entry.props) + len(props) > self.max_vectors:
+                self._entries[memory_id] = _Entry(version, large=True)
+                return
+            added = _normalize(vectors)
+            entry.matrix = added if entry.matrix is None else np.vstack([entry.matrix, added])
+            entry.props = entry.props + list(props)
+            entry.version = version
+
+    def invalidate(self, memory_id: str) -> None:
+        with self._lock:
+            if memory_id in self._loading:
+                self._stale.add(memory_id)
+            self._entries.pop(memory_id, None)
+
+    # ---------- 检索 ----------
+    @staticmethod
+    def search(
+        entry: _Entry,
+        query_vector: List[float],
+        top_k: int,
+        include_vector: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        返回与 WeaviateStore.search 相同结构：[{"properties", "score"}]，按 score 降序；
+        include_vector=True 时附带 "vector"（已归一化）
+        """
+        if entry.matrix is None or top_k <= 0:
+            return []
+        q = _normalize(query_vector)[0]
+        sims = entry.matrix @ q
+        k = min(top_k, sims.shape[0])
+        idx = np.argpartition(-sims, k - 1)[:k]
+        idx = idx[np.argsort(-sims[idx])]
+        hits = []
+        for i in idx:
+            hit = {"properties": entry.props[i], "score": float(1.0 / (2.0 - sims[i]))}
+            if include_vector:
+                hit["vector"] = entry.matrix[i]
+            hits.append(hit)
+        return hits
@@ -3,24 +3,82 @@
 """
 MemoryManager: 记忆协调层
 - 封装 PrimaryMemory + AuxiliaryMemory
-- 提供统一接口：create / push / delete / clear
+- 提供统一接口：create / push / push_batch / delete / clear
+- 摘要默认异步：push 达到阈值时只入队 summarize 任务（RAG_SUMMARY_MODE=queue），
+  由 rag/workers/ingest_worker.py 消费；RAG_SUMMARY_MODE=inline 时保持同步摘要
+- RAG_INGEST_MODE=queue 时 push 只入队 ingest 任务（幂等键 + checkpoint，可断点重放）
+- 辅助记忆检索默认多取候选后重排（rag/core/rerank.py，RAG_RERANK=none 关闭），
+  再做近重复抑制 / 每 url 上限 / MMR（rag/core/selectors.py，RAG_MMR_ENABLED=false 关闭）
+- answers：语义答案缓存（rag/memory/answer_cache.py，RAG_ANSWER_CACHE_ENABLED=true 开启），供 RAGPipeline.run 使用
+- get_context 遵守请求截止时间（rag/utils/deadline.py）：辅助检索 / 重排 / 正文补齐为可选阶段，
+  剩余时间不足时跳过或只等到预留线为止，记为降级
 """
 
-from typing import Optional, Dict, Any
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Optional, Dict, Any, List, Tuple
 from rag.datasource.base import Datasource
 from rag.llm.embeddings.openai_embedding import OpenAIEmbedder
+from rag.llm.providers.openai_client import OpenAIClient
 from rag.memory.primary_memory import PrimaryMemory
 from rag.memory.auxiliary_memory import AuxiliaryMemory
+from rag.memory.answer_cache import AnswerCache
+from rag.memory.context_snapshot import ContextSnapshotCache, snapshot_shape
+from rag.core.rerank import Reranker, get_reranker, rerank_candidates
+from rag.core.selectors import select, selectors_enabled
+from rag.utils import deadline
+from rag.utils.logging import get_logger
+from rag.utils.messages import parse_messages
+from rag.utils.metrics import record_cache
+from rag.utils.timing import StageTimer
+from rag.utils.tracing import span, wrap
+
+logger = get_logger(__name__)
+
+JOB_SUMMARIZE = "summarize"
+JOB_INGEST = "ingest"
 
 
 class MemoryManager:
-    def __init__(self, ds: Datasource, embedder: Optional[OpenAIEmbedder] = None):
+    def __init__(
+        self,
+        ds: Datasource,
+        embedder: Optional[OpenAIEmbedder] = None,
+        llm: Optional[OpenAIClient] = None,
+        summary_mode: Optional[str] = None,
+        reranker: Optional[Reranker] = None,
+    ):
         """
         :param ds: Datasource 实例
+        :param llm: 摘要用 LLM 客户端（共享实例）
+        :param summary_mode: queue / inline，默认读取 RAG_SUMMARY_MODE（queue）
+        :param reranker: 辅助记忆命中的重排器，默认按 RAG_RERANK 构建（none 时不重排）
         """
         self.ds = ds
-        self.primary = PrimaryMemory(ds)
+        self.reranker = reranker if reranker is not None else get_reranker()
+        self.primary = PrimaryMemory(ds, llm=llm)
         self.auxiliary = AuxiliaryMemory(ds, embedder=embedder)
+        self.summary_mode = (summary_mode or os.getenv("RAG_SUMMARY_MODE", "queue")).lower()
+        self.fetch_workers = int(os.getenv("RAG_PUSH_FETCH_WORKERS", "8"))
+        # sync：请求内完成写入；queue：push 只入队 ingest 任务，由 worker 分阶段执行
+        self.ingest_mode = os.getenv("RAG_INGEST_MODE", "sync").lower()
+        self.ingest_max_attempts = int(os.getenv("RAG_INGEST_MAX_ATTEMPTS", "5"))
+        # 上下文快照：进程内 LRU，可选 mem_context_snapshots 共享层
+        shared = os.getenv("RAG_CONTEXT_SNAPSHOT_SHARED", "false").lower() == "true"
+        self.snapshots = ContextSnapshotCache(shared=ds.mem_snapshots if shared else None)
+        # 语义答案缓存（RAG_ANSWER_CACHE_ENABLED=true 开启，由 RAGPipeline.run 使用）
+        self.answers = AnswerCache()
+        # get_context 并行检索用的共享线程池（辅助记忆检索）
+        self._pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_CONTEXT_WORKERS", "8")),
+            thread_name_prefix="memory-ctx",
+        )
+        # 正文补齐单独一个线程池：慢的辅助检索占满 _pool 时，MinIO 读取不必排在其后
+        self._fetch_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_CONTEXT_FETCH_WORKERS", "8")),
+            thread_name_prefix="memory-fetch",
+        )
 
     # ---------- 创建 ----------
     def create_memory(self, app: str, params: Optional[Dict[str, Any]] = None) -> str:
@@ -33,20 +91,226 @@ class MemoryManager:
     def push_message(self, memory_id: str, app: str, url: str, description: Optional[str] = None):
         """
         写入一条新消息：
+        - 从 MinIO 读取并解析一次正文，主记忆（内联）与辅助记忆（向量化）共用
         - 主记忆登记元信息
         - 辅助记忆向量化并入库
+        - 达到摘要阈值时入队 summarize 任务（返回行内带 summary_job_id）；inline 模式下同步摘要
+        主记忆已提交而辅助记忆失败时，不再直接报错：入队一个带 checkpoint 的 ingest 任务补做
+        剩余阶段（返回行内带 ingest_job_id），保证 SQLite 与 Weaviate 最终一致。
+        url 已登记过时与 push_messages 一致：不重复计数、不触发摘要；辅助记忆先删后写，不产生重复向量。
+        各阶段耗时以一条日志输出（push_message total=... fetch=... primary=... auxiliary=...）
         """
+        timer = StageTimer("push_message")
+        row = None
         try:
-            # 主记忆写入
-            row = self.primary.push(memory_id=memory_id, app=app, url=url, description=description)
-            summarize_url = self.primary.maybe_summarize(memory_id=memory_id,app=app)
-            # print(summarize_url)
-            # 辅助记忆写入
-            self.auxiliary.add_message(memory_id=memory_id, app=app, url=url)
+            # 读取 + 解析（仅一次）
+            with timer.stage("fetch"):
+                raw_text = self.ds.minio.get_text(url)
+                messages = parse_messages(raw_text)
+
+            # 主记忆写入（上下文快照增量追加这条消息）
+            with timer.stage("primary"):
+                row, progress = self.ingest_primary(memory_id, app, url, description, raw_text)
+            if progress is not None:
+                with timer.stage("summary"):
+                    summary_job_id = self.ingest_summary(memory_id, app, progress, bodies={url: raw_text})
+                    if summary_job_id:
+                        row["summary_job_id"] = summary_job_id
+            # 辅助记忆写入（重复 push 时替换已有向量）
+            with timer.stage("auxiliary"):
+                self.ingest_auxiliary(memory_id, app, url, messages, replace=progress is None)
             return row
         except Exception as e:
-            # TODO: 可扩展回滚逻辑（例如删除主记忆记录）
-            raise RuntimeError(f"push_message 失败: {e}")
+            if row is None:
+                raise RuntimeError(f"push_message 失败: {e}")
+            # 主记忆已生效：交给 ingest worker 重放辅助记忆阶段
+            job = self.enqueue_ingest(
+                memory_id, app, url, description,
+                checkpoint={
+                    "stages": ["primary", "summary"],
+                    "uid": row.get("uid"),
+                },
+            )
+            logger.warning("push_message 部分失败，已入队补偿任务 %s: %s", job["job_id"], e)
+            row["ingest_job_id"] = job["job_id"]
+            return row
+        finally:
+            timer.log(logger, memory_id=memory_id)
+
+    # ---------- 写入阶段（push_message 与 ingest worker 共用） ----------
+    def ingest_primary(
+        self,
+        memory_id: str,
+        app: str,
+        url: str,
+        description: Optional[str],
+        body: Optional[str],
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """主记忆登记 + 计数（单事务），并增量更新上下文快照"""
+        row, progress = self.primary.push_with_progress(
+            memory_id=memory_id, app=app, url=url, description=description, body=body
+        )
+        if progress:
+            self.snapshots.on_push(memory_id, url, body, progress["context_version"])
+        return row, progress
+
+    def ingest_summary(
+        self,
+        memory_id: str,
+        app: str,
+        progress: Optional[Dict[str, Any]],
+        bodies: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        """
+        达到阈值时摘要（queue 模式入队，返回任务 ID；inline 模式同步执行）
+        :param bodies: 本次写入已读取的正文 {url: body}；inline 模式下交给摘要复用，不再重读 MinIO。
+            queue 模式的摘要任务稍后在 worker 中执行，正文取自内联存储（RAG_INLINE_BODY_*），
+            未内联的消息仍会从 MinIO 读取一次
+        """
+        if self.summary_mode == "inline":
+            if self.primary.maybe_summarize(memory_id=memory_id, app=app, progress=progress, bodies=bodies):
+                self.snapshots.invalidate(memory_id)
+            return None
+        job = self.request_summary(memory_id=memory_id, app=app, progress=progress)
+        return job["job_id"] if job else None
+
+    def ingest_auxiliary(
+        self,
+        memory_id: str,
+        app: str,
+        url: str,
+        messages: List[Dict[str, Any]],
+        replace: bool = False,
+    ) -> List[str]:
+        """
+        辅助记忆向量化入库；replace=True 时先删除该 url 已有的向量（重放时保证不重复）
+        vector_version 在写入 Weaviate 成功后才递增（见 AuxiliaryMemory.add_messages），
+        辅助阶段由 ingest worker 执行时，API 进程不会按新版本缓存到缺少这批向量的小索引
+        """
+        if replace:
+            self.auxiliary.delete_message(memory_id=memory_id, app=app, url=url)
+        return self.auxiliary.add_message(
+            memory_id=memory_id, app=app, url=url, messages=messages
+        )
+
+    def enqueue_ingest(
+        self,
+        memory_id: str,
+        app: str,
+        url: str,
+        description: Optional[str] = None,
+        checkpoint: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        入队一个 ingest 任务（RAG_INGEST_MODE=queue 的 push，或部分失败后的补偿）。
+        幂等键由 memory_id + url 决定：同一条消息无论重试多少次只有一个任务。
+        """
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.ds.mem_jobs.enqueue(
+            JOB_INGEST,
+            memory_id=memory_id,
+            app=app,
+            payload={"url": url, "description": description},
+            idempotency_key=f"{JOB_INGEST}:{memory_id}:{url_hash}",
+            max_attempts=self.ingest_max_attempts,
+            checkpoint=checkpoint,
+        )
+
+    def push_messages(
+        self,
+        memory_id: str,
+        app: str,
+        items: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        批量写入多条消息（导入历史 / 回放对话）：
+        - MinIO 并发读取（RAG_PUSH_FETCH_WORKERS，默认 8），每条只读取解析一次
+        - 主记忆一个事务完成全部登记与计数
+        - 辅助记忆批量向量化 + 一次 Weaviate batch
+        - 最后至多触发一次摘要
+        - 按 url 幂等：批内重复或此前已登记的 url 不重复计数，也不重复向量化 / 写入 Weaviate
+        :param items: [{"url": ..., "description": ...}, ...]
+        :return: {"rows": [...], "inserted": 新登记条数, "summary_job_id": ...}
+        """
+        timer = StageTimer("push_messages")
+        try:
+            # 批内重复的 url 只读取一次（保留首次出现的 description）
+            unique: Dict[str, Dict[str, Any]] = {}
+            for it in items:
+                unique.setdefault(it["url"], it)
+            urls = list(unique)
+            with timer.stage("fetch"):
+                workers = max(1, min(self.fetch_workers, len(urls)))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    raws = dict(zip(urls, pool.map(self.ds.minio.get_text, urls)))
+
+            with timer.stage("primary"):
+                rows, created, progress = self.primary.push_many(
+                    memory_id,
+                    app,
+                    [
+                        {"url": url, "description": unique[url].get("description"), "body": raws[url]}
+                        for url in urls
+                    ],
+                )
+
+            result: Dict[str, Any] = {"rows": rows, "inserted": len(created), "summary_job_id": None}
+            if not created:
+                return result
+
+            self.snapshots.invalidate(memory_id)
+
+            with timer.stage("summary"):
+                result["summary_job_id"] = self.ingest_summary(
+                    memory_id, app, progress, bodies={row["url"]: raws[row["url"]] for row in created}
+                )
+
+            with timer.stage("auxiliary"):
+                # 只向量化本次新登记的消息
+                self.auxiliary.add_messages(
+                    memory_id,
+                    app,
+                    [(row["url"], parse_messages(raws[row["url"]])) for row in created],
+                )
+            return result
+        except Exception as e:
+            raise RuntimeError(f"push_messages 失败: {e}")
+        finally:
+            timer.log(logger, memory_id=memory_id, count=len(items))
+
+    # ---------- 摘要任务 ----------
+    def request_summary(
+        self,
+        memory_id: str,
+        app: str,
+        progress: Optional[Dict[str, Any]] = None,
+        force: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        达到阈值（或 force=True）时入队一个 summarize 任务；同一 memory 排队中的任务会被复用。
+        :return: 任务行；未达阈值返回 None
+        """
+        if not force and not self.primary.should_summarize(memory_id, progress):
+            return None
+        return self.ds.mem_jobs.enqueue(
+            JOB_SUMMARIZE,
+            memory_id=memory_id,
+            app=app,
+            dedupe_key=f"{JOB_SUMMARIZE}:{memory_id}",
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.ds.mem_jobs.get(job_id)
+
+    def list_jobs(self, memory_id: str, limit: int = 20) -> list:
+        return self.ds.mem_jobs.list_by_memory(memory_id, limit=limit)
+
+    def list_jobs_by_status(self, status: str, kind: Optional[str] = None, limit: int = 50) -> list:
+        return self.ds.mem_jobs.list_by_status(status, kind=kind, limit=limit)
+
+    def requeue_job(self, job_id: str) -> bool:
+        """死信 / 失败任务重新排队，保留 checkpoint"""
+        return self.ds.mem_jobs.requeue(job_id)
 
     # ---------- 删除 ----------
     def delete_message(self, memory_id: str, app: str, url: str):
@@ -56,6 +320,8 @@ class MemoryManager:
         - 辅助记忆物理删除
         """
         self.primary.delete_message(memory_id=memory_id, url=url)
+        self.snapshots.invalidate(memory_id)
+        self.answers.invalidate(memory_id)
         self.auxiliary.delete_message(memory_id=memory_id, app=app, url=url)
 
     # ---------- 清空 ----------
@@ -66,55 +332,200 @@ class MemoryManager:
         - 辅助记忆：物理删除全部
         """
         self.auxiliary.clear_memory(memory_id=memory_id, app=app)
+        # 清空辅助记忆不提升 context_version，答案缓存需显式作废
+        self.answers.invalidate(memory_id)
         # 主记忆暂时没有 clear_all，可按需实现
 
+    def close(self) -> None:
+        """释放 get_context 线程池与按模型新建的 embedder（应用关闭时调用）"""
+        self._pool.shutdown(wait=False)
+        self._fetch_pool.shutdown(wait=False)
+        self.auxiliary.close()
+
+    def embedding_model(self, memory_id: str) -> Optional[str]:
+        """embed_query 使用的 embedding 模型（知识库据此判断能否复用同一个 query 向量）"""
+        return self.auxiliary.embedding_model(memory_id)
+
+    def embed_query(self, memory_id: str, query: str) -> List[float]:
+        """按该 memory 的 embedding 模型向量化 query（结果可通过 get_context(query_vector=...) 复用）"""
+        return self.auxiliary.embed_query(memory_id, query)
+
     def get_context(
         self,
         memory_id: str,
         app: str,
         query: str,
-        summary_k: int = 1,
+        summary_k: Optional[int] = None,
         recent_k: int = 6,
         aux_top_k: int = 5,
         aux_threshold: float = None,
+        fetch_bodies: bool = True,
+        query_vector: Optional[List[float]] = None,
     ) -> Dict[str, Any]:
         """
         融合主记忆和辅助记忆，返回上下文给 pipeline 使用。
+        辅助检索与主记忆读取（含正文）并行执行；主记忆部分优先命中上下文快照。
 
         :param memory_id: 记忆空间 ID
         :param app: 业务 app 名
         :param query: 当前查询文本
-        :param summary_k: 主记忆摘要数量（默认 1）
+        :param summary_k: 主记忆摘要数量（默认 None：全部活跃的分层摘要；旧版默认 1，
+            见 PrimaryMemory.get_context）
         :param recent_k: 主记忆最近消息数量
         :param aux_top_k: 辅助记忆召回条数
         :param aux_threshold: 辅助记忆得分阈值
+        :param fetch_bodies: 是否同时补齐摘要/最近消息的正文（texts 覆盖全部可读取的 url）
+        :param query_vector: 已算好的 query 向量（embed_query），传入时辅助检索不再向量化
         :return: {
             "summary_urls": [...],
             "recent_urls": [...],
+            "texts": {url: 正文},   # 内联正文 + 并发读取的 MinIO 正文（读取失败的 url 不在其中）
             "retrieved": [
                 {"content": ..., "url": ..., "role": ..., "score": ...}
             ]
         }
         """
-        # 1) 主记忆：摘要 + 最近消息
-        pri_ctx = self.primary.get_context(
-            memory_id=memory_id,
-            summary_k=summary_k,
-            recent_k=recent_k,
-        )
+        with span("memory.get_context", memory_id=memory_id) as s:
+            return self._get_context(
+                s, memory_id, app, query, summary_k, recent_k, aux_top_k, aux_threshold, fetch_bodies, query_vector
+            )
 
-        # 2) 辅助记忆：语义检索
-        aux_hits = self.auxiliary.search(
-            memory_id=memory_id,
-            app=app,
-            query=query,
-            top_k=aux_top_k,
-            score_threshold=aux_threshold,
-        )
+    def _get_context(
+        self,
+        s,
+        memory_id: str,
+        app: str,
+        query: str,
+        summary_k: Optional[int],
+        recent_k: int,
+        aux_top_k: int,
+        aux_threshold: Optional[float],
+        fetch_bodies: bool,
+        query_vector: Optional[List[float]],
+    ) -> Dict[str, Any]:
+        # 1) 辅助记忆（embedding + Weaviate）放到后台线程，与主记忆读路径并行（剩余时间不足时跳过）
+        aux_future = None
+        if deadline.allow("auxiliary"):
+            aux_future = self._pool.submit(
+                wrap(self._search_auxiliary),
+                memory_id=memory_id,
+                app=app,
+                query=query,
+                top_k=aux_top_k,
+                score_threshold=aux_threshold,
+                query_vector=query_vector,
+            )
+
+        # 2) 主记忆：优先命中上下文快照（只读一次版本号）
+        pri_ctx = None
+        shape = snapshot_shape(summary_k, recent_k)
+        version = self.ds.mem_primary.get_context_version(memory_id) if self.snapshots.enabled else None
+        if fetch_bodies and version is not None:
+            pri_ctx = self.snapshots.get(memory_id, shape, version)
+            record_cache("context_snapshot", pri_ctx is not None)
+        s.set(snapshot_hit=pri_ctx is not None)
+
+        # 未命中：摘要 + 最近消息（SQLite），未内联的正文并发从 MinIO 补齐
+        if pri_ctx is None:
+            pri_ctx = self.primary.get_context(
+                memory_id=memory_id,
+                summary_k=summary_k,
+                recent_k=recent_k,
+            )
+            texts = pri_ctx.setdefault("texts", {})
+            if fetch_bodies:
+                urls = pri_ctx.get("summary_urls", []) + pri_ctx.get("recent_urls", [])
+                texts.update(self._fetch_missing(urls, texts))
+                # 正文齐全才缓存，读取失败的留到下次重试
+                if version is not None and all(u in texts for u in urls):
+                    self.snapshots.put(memory_id, shape, version, pri_ctx)
+        texts = pri_ctx.get("texts", {})
 
-        # 3) 融合
+        # 3) 融合（关键路径 ≈ max(embed+search, sqlite+minio)）；辅助检索最多等到截止时间的预留线
+        retrieved = []
+        if aux_future is not None:
+            with span("memory.wait_auxiliary"):
+                try:
+                    retrieved = aux_future.result(timeout=deadline.wait_s())
+                except (FutureTimeout, deadline.DeadlineExceeded):
+                    # 还在排队的任务直接取消，已开始的任务在各依赖调用前检查截止时间后尽快退出
+                    aux_future.cancel()
+                    deadline.degrade("auxiliary", "timeout")
         return {
             "summary_urls": pri_ctx.get("summary_urls", []),
             "recent_urls": pri_ctx.get("recent_urls", []),
-            "retrieved": aux_hits,
+            "texts": texts,
+            "retrieved": retrieved,
         }
+
+    def _search_auxiliary(
+        self,
+        memory_id: str,
+        app: str,
+        query: str,
+        top_k: Optional[int],
+        score_threshold: Optional[float],
+        query_vector: Optional[List[float]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        辅助记忆检索：启用重排 / 选择器时先多取候选（RAG_RERANK_CANDIDATES），
+        重排后再去冗余（近重复、每 url 上限、MMR），最终截取 top_k
+        """
+        if not deadline.allow("auxiliary"):   # 排队期间已到预留线：不再发起检索
+            return []
+        use_rerank = self.reranker is not None and bool(query)
+        use_select = selectors_enabled()
+        if not use_rerank and not use_select:
+            return self.auxiliary.search(
+                memory_id=memory_id,
+                app=app,
+                query=query,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                query_vector=query_vector,
+            )
+        if top_k is None:
+            top_k = self.auxiliary._get_params(memory_id).aux_top_k
+        hits = self.auxiliary.search(
+            memory_id=memory_id,
+            app=app,
+            query=query,
+            top_k=rerank_candidates(top_k),
+            score_threshold=score_threshold,
+            include_vector=use_select,
+            query_vector=query_vector,
+        )
+        if use_rerank and not deadline.allow("rerank"):
+            use_rerank = False
+        if use_rerank:
+            with span("rerank", candidates=len(hits)):
+                hits = self.reranker.rerank(query, hits)
+        if use_select:
+            # 重排超出预算时保持原顺序（无 rerank_score），按检索得分选择
+            score_key = "rerank_score" if hits and "rerank_score" in hits[0] else "score"
+            with span("select", candidates=len(hits)):
+                return select(hits, top_k, score_key=score_key)
+        return hits[:top_k]
+
+    def _fetch_missing(self, urls: List[str], known: Dict[str, str]) -> Dict[str, str]:
+        """并发读取 known 中没有的正文；读取失败的 url 不写入，由调用方回落处理"""
+        missing = [u for u in dict.fromkeys(urls) if u not in known]
+        if not missing or self.ds.minio is None:
+            return {}
+
+        def _get(url: str) -> Optional[str]:
+            if not deadline.allow("fetch_bodies"):   # 排队期间已到预留线：不再读取
+                return None
+            try:
+                return self.ds.minio.get_text(url)
+            except Exception:
+                return None
+
+        with span("memory.fetch_bodies", urls=len(missing)):
+            futures = {u: self._fetch_pool.submit(wrap(_get), u) for u in missing}
+            done, pending = wait(futures.values(), timeout=deadline.wait_s())
+        if pending:
+            for f in pending:
+                f.cancel()
+            deadline.degrade("fetch_bodies", "timeout")
+        return {u: f.result() for u, f in futures.items() if f in done and f.result() is not None}
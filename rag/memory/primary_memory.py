@@ -4,23 +4,101 @@
 PrimaryMemory: 主记忆高层接口
 - create_memory(): 初始化记忆空间
 - push(): 登记一条新的上下文消息
+- push_many(): 批量登记（单事务）
 """
 
 import hashlib
+import os
+import socket
+import threading
 import time
 import uuid
-from typing import Optional, Dict, Any
+import weakref
+from typing import Optional, Dict, Any, List, Tuple
 
+from rag.core.summarizer import MapReduceSummarizer
 from rag.datasource.base import Datasource
 from rag.llm.providers.openai_client import OpenAIClient
+from rag.utils.logging import get_logger
+from rag.utils.tracing import traced
+
+logger = get_logger(__name__)
+
+
+class SummaryLease:
+    """
+    摘要期间定时续租 mem_leases 租约（与 ingest worker 的 Heartbeat 同一思路）。
+    续租失败（租约已过期并被他人接管）时 lost 置位并停止；写入前调用 renew() 做最终校验。
+    """
+
+    def __init__(self, leases, name: str, owner: str, ttl_s: float, interval_s: float):
+        self.leases = leases
+        self.name = name
+        self.owner = owner
+        self.ttl_s = ttl_s
+        self.interval_s = interval_s
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"summary-lease-{name[-12:]}", daemon=True)
+
+    def renew(self) -> bool:
+        """续租一次；失败时 lost 置位，之后一直返回 False"""
+        if self.lost.is_set():
+            return False
+        if not self.leases.renew(self.name, self.owner, ttl_s=self.ttl_s):
+            logger.warning("summary lease lost: %s", self.name)
+            self.lost.set()
+            return False
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                if not self.renew():
+                    return
+            except Exception as e:  # 数据库暂时不可用：下一轮再试
+                logger.warning("summary lease renew error: %s %s", self.name, e)
+
+    def __enter__(self) -> "SummaryLease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
 
 
 class PrimaryMemory:
-    def __init__(self, ds: Datasource):
+    # 进程内每个 memory_id 一把摘要锁（类级别共享，多个实例之间同样互斥）；
+    # 弱引用：没有调用方持有时条目自动移除，字典大小只与正在摘要的 memory 数有关
+    _summary_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+    _summary_locks_guard = threading.Lock()
+
+    def __init__(self, ds: Datasource, llm: Optional[OpenAIClient] = None):
         """
         :param ds: Datasource 实例，聚合了 mem_registry/mem_primary/mem_contexts/minio 等
+        :param llm: 摘要用 LLM 客户端；不传则首次摘要时创建一次并复用
         """
         self.ds = ds
+        self._llm = llm
+        self._summarizer: Optional[MapReduceSummarizer] = None
+        self.summary_lease_s = float(os.getenv("RAG_SUMMARY_LEASE_S", "300"))
+        # 摘要期间的续租间隔，默认租约时长的 1/3
+        renew_s = os.getenv("RAG_SUMMARY_LEASE_RENEW_S")
+        self.summary_lease_renew_s = float(renew_s) if renew_s else self.summary_lease_s / 3.0
+
+    @property
+    def llm(self) -> OpenAIClient:
+        if self._llm is None:
+            self._llm = OpenAIClient()
+        return self._llm
+
+    @property
+    def summarizer(self) -> MapReduceSummarizer:
+        """长输入走分块并行摘要，分块结果缓存在 mem_summary_chunks"""
+        if self._summarizer is None:
+            self._summarizer = MapReduceSummarizer(self.llm, cache=getattr(self.ds, "mem_summary_chunks", None))
+        return self._summarizer
 
     # ---------- 第 1 步：初始化 ----------
     def create_memory(self, app: str, params: Optional[Dict[str, Any]] = None) -> str:
@@ -45,165 +123,383 @@ class PrimaryMemory:
         url: str,
         description: Optional[str] = None,
         ts: Optional[float] = None,
+        body: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         登记一条新的上下文消息（正文已由业务层写入 MinIO，只传 URL）
         - uid: uuid唯一记录上下文
         - content_sha256: 基于 url 的 hash，用于幂等
-        - 记录写入 mem_contexts
+        - 记录写入 mem_contexts（开启内联时小正文一并写入）
         - 计数器 bump_total
         """
+        row, _progress = self.push_with_progress(
+            memory_id=memory_id, app=app, url=url, description=description, ts=ts, body=body
+        )
+        return row
+
+    def push_with_progress(
+        self,
+        memory_id: str,
+        app: str,
+        url: str,
+        description: Optional[str] = None,
+        ts: Optional[float] = None,
+        body: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        同 push()，额外返回更新后的 mem_primary 进度行（供 maybe_summarize 直接判断阈值）。
+        登记与计数在同一个事务里，一次 push 只提交一次。
+        与 push_many() 一样按 url 幂等：url 已登记过时返回已有记录，不计数、不提升版本，进度行为 None。
+        """
         ts = ts or time.time()
         uid = str(uuid.uuid4())[:16]
         content_sha256 = hashlib.sha256(url.encode("utf-8")).hexdigest()
 
-        row = self.ds.mem_contexts.create(
-            uid=uid,
-            memory_id=memory_id,
-            app=app,
-            url=url,
-            content_sha256=content_sha256,
-            description=description,
-        )
+        # 开启内联但调用方未带正文时，从 MinIO 补读一次
+        if body is None and self.ds.mem_contexts.inline_max > 0 and self.ds.minio is not None:
+            try:
+                body = self.ds.minio.get_text(url)
+            except Exception:
+                body = None
 
-        # 更新计数器
-        self.ds.mem_primary.bump_total(memory_id, delta=1)
+        with self.ds.sqlite_conn.transaction():
+            row = self.ds.mem_contexts.create(
+                uid=uid,
+                memory_id=memory_id,
+                app=app,
+                url=url,
+                content_sha256=content_sha256,
+                description=description,
+                body=body,
+            )
 
-        return row
+            # 更新计数器（RETURNING 带回最新进度）；create() 冲突时返回已有记录，uid 不是本次生成的
+            progress = self.ds.mem_primary.bump_total(memory_id, delta=1) if row.get("uid") == uid else None
+
+        return row, progress
+
+    def push_many(
+        self,
+        memory_id: str,
+        app: str,
+        items: List[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        批量登记：items 为 [{"url", "description", "body"}, ...]（body 可选，已由调用方读取）
+        所有登记与一次计数更新在同一个事务里提交。
+        与 push() 一样按 url 幂等：批内重复的 url 只登记一次，已登记过的 url 返回已有记录且不计数。
+        :return: (rows 每个不同 url 一行, created 本次新登记的行, 更新后的进度行；无新登记时为 None)
+        """
+        rows: List[Dict[str, Any]] = []
+        created: List[Dict[str, Any]] = []
+        seen = set()
+        with self.ds.sqlite_conn.transaction():
+            for item in items:
+                url = item["url"]
+                if url in seen:
+                    continue
+                seen.add(url)
+                uid = str(uuid.uuid4())[:16]
+                row = self.ds.mem_contexts.create(
+                    uid=uid,
+                    memory_id=memory_id,
+                    app=app,
+                    url=url,
+                    content_sha256=hashlib.sha256(url.encode("utf-8")).hexdigest(),
+                    description=item.get("description"),
+                    body=item.get("body"),
+                )
+                rows.append(row)
+                # create() 冲突时返回已有记录，uid 不是本次生成的
+                if row.get("uid") == uid:
+                    created.append(row)
+            progress = self.ds.mem_primary.bump_total(memory_id, delta=len(created)) if created else None
+        return rows, created, progress
 
     # ---------- 第 3 步：summarize ----------
-    def maybe_summarize(self, memory_id: str, app: str) -> Optional[str]:
+    def should_summarize(self, memory_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        是否达到摘要阈值（recent_qa_count ≥ summary_every_n）；只读缓存参数 + 进度行，不调用 LLM
+        """
+        params = self.ds.mem_registry.get_params(memory_id)
+        if params is None:
+            return False
+        if progress is None:
+            progress = self.ds.mem_primary.get(memory_id)
+        return bool(progress) and progress.get("recent_qa_count", 0) >= params.summary_every_n
+
+    @classmethod
+    def _summary_lock(cls, memory_id: str) -> threading.Lock:
+        with cls._summary_locks_guard:
+            lock = cls._summary_locks.get(memory_id)
+            if lock is None:
+                lock = cls._summary_locks[memory_id] = threading.Lock()
+            return lock
+
+    def maybe_summarize(
+        self,
+        memory_id: str,
+        app: str,
+        progress: Optional[Dict[str, Any]] = None,
+        bodies: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
         """
         当 recent_qa_count ≥ summary_every_n 时触发摘要。
         新的摘要会覆盖之前的摘要 + 新增的消息，保证主记忆中始终只有一份最新摘要。
+
+        单飞：同一 memory 同时只有一个摘要在执行——
+        进程内用 per-memory 锁，跨进程/多 worker 用 mem_leases 租约（RAG_SUMMARY_LEASE_S 后过期可抢占）。
+        摘要期间每 RAG_SUMMARY_LEASE_RENEW_S（默认租约时长的 1/3）续租一次；续租失败说明租约已被接管，
+        不再写入（每次写入的事务内也会先续租校验）。
+        拿不到锁或租约的后来者直接返回 None，不等待、不重复调用 LLM。
+
+        :param progress: push_with_progress() 返回的进度行；未达阈值时可免去一次 mem_primary 读取
+        :param bodies: 调用方已读取的正文 {url: body}（如本次 push 的消息），摘要时不再从 MinIO 重读；
+            窗口内其余消息优先用内联正文，既未内联也不在 bodies 中的才读取 MinIO
         """
 
-        # 1) 读取 registry 配置
-        reg_row = self.ds.mem_registry.get(memory_id)
-        if not reg_row:
+        # 1) 读取 registry 配置（缓存的类型化参数）
+        params = self.ds.mem_registry.get_params(memory_id)
+        if params is None:
             raise ValueError(f"Memory {memory_id} not found in registry")
 
-        import json
-        params = {}
-        if reg_row.get("params_json"):
+        if progress is not None and progress.get("recent_qa_count", 0) < params.summary_every_n:
+            return None
+
+        lock = self._summary_lock(memory_id)
+        if not lock.acquire(blocking=False):
+            return None
+        try:
+            name = f"summarize:{memory_id}"
+            owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+            if not self.ds.mem_leases.acquire(name, owner, ttl_s=self.summary_lease_s):
+                return None
             try:
-                params = json.loads(reg_row["params_json"])
-            except Exception:
-                params = {}
+                lease = SummaryLease(
+                    self.ds.mem_leases, name, owner, self.summary_lease_s, self.summary_lease_renew_s
+                )
+                with lease:
+                    return self._summarize_window(memory_id, app, params, bodies or {}, lease)
+            finally:
+                self.ds.mem_leases.release(name, owner)
+        finally:
+            lock.release()
+
+    def _summarize_window(
+        self, memory_id: str, app: str, params, bodies: Dict[str, str], lease: SummaryLease
+    ) -> Optional[str]:
+        """
+        持有锁与租约后执行：逐个窗口摘要，直到剩余未摘要消息不足阈值（或租约丢失），最后逐层合并。
+        push_messages 一次写入超过 2 × summary_every_n 条时会连续生成多个叶子摘要，较早的消息不会被跳过。
+        :return: 最后一个叶子摘要的 URL；未达阈值时返回 None
+        """
+        summary_url = None
+        while True:
+            leaf_url = self._summarize_leaf(memory_id, app, params, bodies, lease)
+            if leaf_url is None:
+                break
+            summary_url = leaf_url
+
+        # 6) 逐层合并（每层攒满 summary_rollup_n 条才调用一次 LLM）
+        if summary_url:
+            self._rollup(memory_id, app, params, lease)
+        return summary_url
 
-        threshold = params.get("summary_every_n", 5)
-        max_tokens = params.get("max_summary_tokens", 512)
-        summary_lang = params.get("summary_language", "zh")
+    def _summarize_leaf(
+        self, memory_id: str, app: str, params, bodies: Dict[str, str], lease: SummaryLease
+    ) -> Optional[str]:
+        """
+        摘要一个窗口（叶子摘要，level 0）：每次重新读取进度做判断，避免前一个持有者刚摘要完又摘要一遍。
+        窗口取最早的至多 2 × summary_every_n 条未摘要消息；索引与 recent_qa_count 只按实际摘要的条数推进，
+        不把旧摘要整体喂回 LLM，单个窗口的摘要成本与对话长度无关。
+        """
+        threshold = params.summary_every_n
+        if lease.lost.is_set():
+            return None
 
         # 2) 读取 primary 进度
-        pri_row = self.ds.mem_primary.get(memory_id)
+        pri_row = self.ds.mem_primary.get(memory_id, with_summary=True)
         if not pri_row:
             raise ValueError(f"Memory {memory_id} not found in primary")
 
-        recent_count = pri_row.get("recent_qa_count", 0)
-        if recent_count < threshold:
+        if pri_row.get("recent_qa_count", 0) < threshold:
             return None
 
-        # 3) 收集已有摘要 + 未摘要消息
-        texts = []
-
-        # 如果已有摘要，先加入旧摘要内容
-        if pri_row.get("summary_url"):
-            try:
-                old_summary = self.ds.minio.get_text(pri_row["summary_url"])
-                texts.append(old_summary)
-            except Exception:
-                texts.append("[读取旧摘要失败]")
-
-        # 找出新消息
-        contexts = self.ds.mem_contexts.list_by_memory(memory_id, limit=threshold * 2)
-        contexts = [c for c in contexts if not self.ds.mem_deleted.is_deleted(c["url"])]
-        window = [c for c in contexts if not c.get("is_summarized")]
-
-        if not window and not texts:
+        # 3) 找出最早的未摘要消息（未被逻辑删除，单条 SQL 完成过滤），时间正序
+        window = self.ds.mem_contexts.list_active_by_memory(
+            memory_id, limit=threshold * 2, unsummarized_only=True, with_body=True, oldest_first=True
+        )
+        if not window:
             return None
 
+        texts = []
         for ctx in window:
             url = ctx["url"]
+            body = ctx["body"] if ctx.get("body") is not None else bodies.get(url)
+            if body is not None:
+                texts.append(body)
+                continue
             try:
                 texts.append(self.ds.minio.get_text(url))
             except Exception:
                 texts.append(f"[读取失败: {url}]")
 
-        # 4) 调用 OpenAI summarizer
-        client = OpenAIClient()
-        system_prompt = "你是一个严谨的摘要助手。"
-        if summary_lang == "en":
-            system_prompt = "You are a precise summarization assistant."
+        # 4) 叶子摘要：只覆盖本窗口
+        summary_text = self._complete_summary(
+            "请对以下多轮对话做简洁的总结，保留重要事实、实体和关键决策，"
+            "忽略闲聊与重复内容。输出一段摘要。",
+            texts,
+            params,
+        )
+        summary_url = self._put_summary(app, memory_id, summary_text)
+
+        # 5) 写入摘要树 + 更新 PrimaryStore + 标记窗口消息：同一事务，一次提交
+        #    事务内先续租：租约已被接管时放弃本次结果（接管者会重新摘要同一窗口）
+        start_index = pri_row.get("last_summary_index", 0)
+        new_index = start_index + len(window)
+        with self.ds.sqlite_conn.transaction():
+            if not lease.renew():
+                return None
+            self._adopt_legacy_summary(memory_id, pri_row)
+            self.ds.mem_summaries.create(
+                memory_id,
+                summary_url,
+                level=0,
+                start_index=start_index,
+                end_index=new_index,
+                summary_text=summary_text,
+            )
+            self.ds.mem_primary.update_summary(
+                memory_id, summary_url, summary_text=summary_text, consumed=len(window)
+            )
+            self.ds.mem_primary.advance_index(memory_id, new_index)
+            self.ds.mem_contexts.mark_summarized_many([ctx["uid"] for ctx in window])
+        return summary_url
 
-        prompt = (
-                "请对以下多轮对话做简洁的总结，保留重要事实、实体和关键决策，"
-                "忽略闲聊与重复内容。输出一段摘要。\n\n"
-                + "\n\n---\n\n".join(texts)
+    def _adopt_legacy_summary(self, memory_id: str, pri_row: Dict[str, Any]) -> None:
+        """
+        老数据只有 mem_primary 上的滚动摘要：首次写摘要树时把它登记为一条 level 1 摘要，
+        覆盖 [0, last_summary_index)，保证历史不丢
+        """
+        if not pri_row.get("summary_url") or self.ds.mem_summaries.count_by_memory(memory_id):
+            return
+        self.ds.mem_summaries.create(
+            memory_id,
+            pri_row["summary_url"],
+            level=1,
+            start_index=0,
+            end_index=pri_row.get("last_summary_index", 0),
+            summary_text=pri_row.get("summary_text"),
         )
 
-        summary_text = client.complete(
-            prompt,
-            temperature=0.2,
-            top_p=1.0,
-            max_tokens=max_tokens,
+    def _rollup(self, memory_id: str, app: str, params, lease: SummaryLease) -> None:
+        rollup_n = max(2, params.summary_rollup_n)
+        level = 0
+        while not lease.lost.is_set():
+            group = self.ds.mem_summaries.list_unrolled(memory_id, level, with_text=True)
+            if len(group) < rollup_n:
+                return
+            group = group[:rollup_n]
+            texts = [self._summary_text(r) for r in group]
+            merged = self._complete_summary(
+                "以下是同一段对话按时间顺序的若干阶段摘要，请合并为一段连贯的摘要，"
+                "保留重要事实、实体和关键决策，去除重复。",
+                texts,
+                params,
+            )
+            url = self._put_summary(app, memory_id, merged)
+            with self.ds.sqlite_conn.transaction():
+                if not lease.renew():
+                    return
+                parent = self.ds.mem_summaries.create(
+                    memory_id,
+                    url,
+                    level=level + 1,
+                    start_index=group[0]["start_index"],
+                    end_index=group[-1]["end_index"],
+                    summary_text=merged,
+                )
+                self.ds.mem_summaries.mark_rolled_up([r["summary_id"] for r in group], parent["summary_id"])
+            level += 1
+
+    def _summary_text(self, row: Dict[str, Any]) -> str:
+        if row.get("summary_text") is not None:
+            return row["summary_text"]
+        try:
+            return self.ds.minio.get_text(row["url"])
+        except Exception:
+            return "[读取旧摘要失败]"
+
+    def _complete_summary(self, instruction: str, texts: list, params) -> str:
+        system_prompt = "你是一个严谨的摘要助手。"
+        if params.summary_language == "en":
+            system_prompt = "You are a precise summarization assistant."
+        return self.summarizer.summarize(
+            instruction,
+            texts,
+            max_tokens=params.max_summary_tokens,
             system=system_prompt,
+            language=params.summary_language,
         )
 
-        # 5) 写入新的摘要文件
+    def _put_summary(self, app: str, memory_id: str, summary_text: str) -> str:
         key = self.ds.minio.make_key(app, memory_id, ext="md")
         self.ds.minio.put_text(key, summary_text)
-        summary_url = key
-
-        # 6) 更新 PrimaryStore
-        self.ds.mem_primary.update_summary(memory_id, summary_url)
-        new_index = pri_row.get("total_qa_count", 0)
-        self.ds.mem_primary.advance_index(memory_id, new_index)
-
-        # 7) 标记窗口内的消息为已摘要
-        for ctx in window:
-            self.ds.mem_contexts.mark_summarized(ctx["uid"])
-
-        return summary_url
+        return key
 
     # ---------- 第 4 步：get_context ----------
+    @traced("primary.get_context")
     def get_context(
         self,
         memory_id: str,
-        summary_k: int = 1,
+        summary_k: Optional[int] = None,
         recent_k: int = 6,
     ) -> Dict[str, list]:
         """
-        目前只支持取 1 条最新摘要，未来扩展多摘要时才用 summary_k
-
         返回指定 memory 的上下文：
-        - 最近 summary_k 条摘要 URL（M1 简化为只取 1 条）
-        - 最近 recent_k 条未摘要消息 URL
+        - summary_urls：最近的 summary_k 条未合并摘要（按时间正序，旧 → 新）；
+          None 表示全部活跃摘要（每层至多 summary_rollup_n - 1 条，数量有界），可完整覆盖历史。
+          默认值由旧版的 1 改为 None：旧版只有一份滚动摘要，取 1 即覆盖全部历史；
+          分层摘要下取 1 只得到最近一个窗口的摘要，需要旧行为的调用方请显式传 summary_k=1
+        - recent_urls：最近 recent_k 条未摘要消息
+        - texts: {url: 正文}，仅包含已内联在 SQLite 中的正文，其余由调用方回落 MinIO
         """
-        result = {"summary_urls": [], "recent_urls": []}
-
-        # 1) 取摘要 URL
-        pri_row = self.ds.mem_primary.get(memory_id)
-
-        print("取摘要 URL", pri_row)
-        if pri_row and pri_row.get("summary_url"):
-            result["summary_urls"] = [pri_row["summary_url"]]
-
-        # 2) 取最近未摘要的消息
-        contexts = self.ds.mem_contexts.list_by_memory(memory_id, limit=recent_k * 2)
-        print("<UNK> contexts", contexts)
-        unsummarized = [c for c in contexts if not c.get("is_summarized")]
-        recent_urls = [c["url"] for c in unsummarized[:recent_k]]
+        result = {"summary_urls": [], "recent_urls": [], "texts": {}}
+
+        # 1) 取摘要树中的活跃摘要（连同内联正文）
+        summaries = self.ds.mem_summaries.list_active(memory_id, limit=summary_k, with_text=True)
+        if summaries:
+            for row in reversed(summaries):
+                result["summary_urls"].append(row["url"])
+                if row.get("summary_text") is not None:
+                    result["texts"][row["url"]] = row["summary_text"]
+        elif summary_k != 0:
+            # 老数据：只有 mem_primary 上的单份滚动摘要
+            pri_row = self.ds.mem_primary.get(memory_id, with_summary=True)
+            if pri_row and pri_row.get("summary_url"):
+                result["summary_urls"] = [pri_row["summary_url"]]
+                if pri_row.get("summary_text") is not None:
+                    result["texts"][pri_row["summary_url"]] = pri_row["summary_text"]
+
+        # 2) 取最近未摘要、未删除的消息（一次查询带回内联正文）
+        recent = self.ds.mem_contexts.list_active_by_memory(
+            memory_id, limit=recent_k, unsummarized_only=True, with_body=True
+        )
 
-        result["recent_urls"] = recent_urls
+        result["recent_urls"] = [c["url"] for c in recent]
+        for c in recent:
+            if c.get("body") is not None:
+                result["texts"][c["url"]] = c["body"]
         return result
 
     # ---------- M2: 删除接口 ----------
     def delete_message(self, memory_id: str, url: str) -> None:
         """
-        逻辑删除一条消息，不物理删除。
+        逻辑删除一条消息，不物理删除；同时提升上下文版本，使上下文快照失效。
         """
-        self.ds.mem_deleted.mark_deleted(memory_id, url)
+        with self.ds.sqlite_conn.transaction():
+            self.ds.mem_deleted.mark_deleted(memory_id, url)
+            self.ds.mem_primary.bump_context_version(memory_id)
 
     # ---------- M2: 并发安全（轻量 CAS 示例） ----------
     def safe_push(self, *args, retries: int = 3, **kwargs) -> Dict[str, Any]:
@@ -0,0 +1,158 @@
+# rag/utils/deadline.py
+# -*- coding: utf-8 -*-
+"""
+请求截止时间（deadline）与降级记录：
+    with start_deadline(3000):                  # 请求入口（API 中间件），预算 3 秒
+        if deadline.allow("auxiliary"):         # 可选阶段：剩余时间不够时跳过并记为降级
+            ...
+        fut.result(timeout=deadline.wait_s())   # 可选阶段最多等到「剩余 - 预留」
+        deadline.check("llm")                   # 必需阶段：已超时直接抛 DeadlineExceeded（API 返回 504）
+        httpx.post(..., timeout=deadline.timeout(60))
+
+- 截止时间存在 contextvars 中；线程池任务经 rag.utils.tracing.wrap 提交时一并传递
+- 可选阶段（辅助记忆检索、重排、知识库、JD 检索、正文补齐）剩余时间低于 RAG_DEADLINE_RESERVE_MS 时跳过，
+  等待时也只等到为必需阶段（LLM 生成）预留的时间为止；被跳过 / 截断的阶段记入 degraded()，
+  RAGPipeline 放进 context_used.degraded，API 响应头 X-Degraded 同步给出
+- HTTP 依赖（LLM / embedding）的单次请求超时取 min(客户端默认, 剩余时间)，重试退避用 backoff()
+  （已超时直接抛 DeadlineExceeded，退避时长不超过剩余时间）；
+  Weaviate / MinIO 客户端不支持逐次调用超时，调用前检查，已超时则不再发起
+- 未设置截止时间时所有函数都是空操作（allow 恒为 True、timeout 返回默认值）
+
+环境变量：
+- RAG_REQUEST_TIMEOUT_MS：默认请求预算（毫秒），默认 0（不设截止时间）
+- RAG_REQUEST_TIMEOUT_MAX_MS：请求头 X-Request-Timeout-Ms 可设置的上限，默认 60000
+- RAG_DEADLINE_RESERVE_MS：为必需阶段预留的时间，默认 1500
+"""
+
+from __future__ import annotations
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+HEADER = "X-Request-Timeout-Ms"
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求截止时间已过，必需阶段无法继续"""
+
+
+class Deadline:
+    __slots__ = ("budget_ms", "expires_at", "_degraded", "_lock")
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+        self._degraded: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def remaining_ms(self) -> float:
+        return (self.expires_at - time.monotonic()) * 1000.0
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def degrade(self, stage: str, reason: str) -> None:
+        with self._lock:
+            if not any(d["stage"] == stage for d in self._degraded):
+                self._degraded.append({"stage": stage, "reason": reason})
+
+    @property
+    def degraded(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._degraded)
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("rag_deadline", default=None)
+
+
+def reserve_ms() -> float:
+    return float(os.getenv("RAG_DEADLINE_RESERVE_MS", "1500"))
+
+
+def request_budget_ms(header_value: Optional[str] = None) -> Optional[float]:
+    """请求预算：请求头（不超过 RAG_REQUEST_TIMEOUT_MAX_MS）优先，否则 RAG_REQUEST_TIMEOUT_MS；<= 0 表示不设"""
+    budget = float(os.getenv("RAG_REQUEST_TIMEOUT_MS", "0"))
+    if header_value:
+        try:
+            budget = min(float(header_value), float(os.getenv("RAG_REQUEST_TIMEOUT_MAX_MS", "60000")))
+        except ValueError:
+            pass
+    return budget if budget > 0 else None
+
+
+@contextmanager
+def start_deadline(budget_ms: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """在当前上下文设置截止时间；budget_ms 为 None / <= 0 时不设置（yield None）"""
+    if budget_ms is None or budget_ms <= 0:
+        yield None
+        return
+    dl = Deadline(budget_ms)
+    token = _current.set(dl)
+    try:
+        yield dl
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check(op: str) -> None:
+    """必需阶段开始前调用：截止时间已过则抛 DeadlineExceeded"""
+    dl = _current.get()
+    if dl is not None and dl.expired:
+        raise DeadlineExceeded(f"request deadline ({dl.budget_ms:.0f}ms) exceeded before {op}")
+
+
+def backoff(seconds: float, op: str) -> None:
+    """重试前退避：截止时间已过则抛 DeadlineExceeded，否则最多睡到截止时间"""
+    dl = _current.get()
+    if dl is None:
+        time.sleep(seconds)
+        return
+    left = dl.remaining_ms() / 1000.0
+    if left <= 0:
+        raise DeadlineExceeded(f"request deadline ({dl.budget_ms:.0f}ms) exceeded during {op}")
+    time.sleep(min(seconds, left))
+
+
+def timeout(default: float) -> float:
+    """依赖调用的超时（秒）：min(default, 剩余时间)，至少 1ms"""
+    dl = _current.get()
+    if dl is None:
+        return default
+    return max(min(default, dl.remaining_ms() / 1000.0), 0.001)
+
+
+def allow(stage: str) -> bool:
+    """可选阶段是否执行：剩余时间不足预留值时跳过，并记为降级"""
+    dl = _current.get()
+    if dl is None or dl.remaining_ms() > reserve_ms():
+        return True
+    dl.degrade(stage, "skipped")
+    return False
+
+
+def wait_s() -> Optional[float]:
+    """可选阶段最多等待的秒数（剩余 - 预留，不小于 0）；未设截止时间返回 None（不限）"""
+    dl = _current.get()
+    if dl is None:
+        return None
+    return max((dl.remaining_ms() - reserve_ms()) / 1000.0, 0.0)
+
+
+def degrade(stage: str, reason: str) -> None:
+    """记录被跳过 / 截断的阶段（未设截止时间时忽略）"""
+    dl = _current.get()
+    if dl is not None:
+        dl.degrade(stage, reason)
+
+
+def degraded() -> List[Dict[str, Any]]:
+    dl = _current.get()
+    return dl.degraded if dl is not None else []
@@ -0,0 +1,53 @@
+# rag/utils/inline_body.py
+# -*- coding: utf-8 -*-
+"""
+小正文内联存储（SQLite 旁路 MinIO）
+- inline_max_bytes()：读取配置，返回内联阈值（0 表示关闭）
+- encode_body()：正文 ≤ 阈值时压缩为 (blob, codec)，否则返回 (None, None)
+- decode_body()：按 codec 还原正文
+
+配置（默认关闭）：
+- RAG_INLINE_BODY_ENABLED=true      开启内联
+- RAG_INLINE_BODY_MAX_BYTES=32768   原文 utf-8 字节数上限
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional, Tuple
+
+CODEC_ZLIB = "zlib"
+
+
+def inline_max_bytes() -> int:
+    if os.getenv("RAG_INLINE_BODY_ENABLED", "false").lower() != "true":
+        return 0
+    try:
+        return max(0, int(os.getenv("RAG_INLINE_BODY_MAX_BYTES", "32768")))
+    except ValueError:
+        return 0
+
+
+def encode_body(text: Optional[str], max_bytes: int) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    正文压缩；未开启 / 正文为空 / 超过阈值时返回 (None, None)，调用方回落到 MinIO。
+    """
+    if not text or max_bytes <= 0:
+        return None, None
+    raw = text.encode("utf-8")
+    if len(raw) > max_bytes:
+        return None, None
+    return zlib.compress(raw, 6), CODEC_ZLIB
+
+
+def decode_body(blob: Optional[bytes], codec: Optional[str]) -> Optional[str]:
+    """
+    还原正文；无内联内容或编码未知时返回 None。
+    """
+    if blob is None:
+        return None
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(blob).decode("utf-8")
+    if codec is None:
+        return bytes(blob).decode("utf-8")
+    return None
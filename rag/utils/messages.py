@@ -0,0 +1,26 @@
+# rag/utils/messages.py
+# -*- coding: utf-8 -*-
+"""
+对话对象解析：MinIO 中的一条消息可能是
+- JSON 数组：[{"role": ..., "content": ...}, ...]
+- JSON 对象：{"qa": [...]}
+- 其它任意文本：整体视为一条 user 消息
+
+写入路径只解析一次，主记忆（内联正文）与辅助记忆（向量化）共用结果。
+"""
+
+from __future__ import annotations
+import json
+from typing import Any, Dict, List
+
+
+def parse_messages(raw_text: str) -> List[Dict[str, Any]]:
+    try:
+        data = json.loads(raw_text)
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict) and "qa" in data:
+            return data["qa"]
+    except Exception:
+        pass
+    return [{"role": "user", "content": raw_text}]
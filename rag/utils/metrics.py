@@ -0,0 +1,235 @@
+# rag/utils/metrics.py
+# -*- coding: utf-8 -*-
+"""
+Prometheus 指标（文本暴露格式 0.0.4，无第三方依赖），由 GET /metrics 输出
+- rag_http_request_duration_seconds{method,route,status}：按路由模板统计的请求耗时（API 中间件记录）
+- rag_dependency_duration_seconds{dependency,operation}：MinIO get/put、Weaviate search/batch/fetch、
+  embedding、chat completion 的调用耗时；rag_dependency_errors_total 为失败次数
+- rag_llm_tokens_total{model,type}：prompt / completion / embedding token 数（取自响应 usage）
+- rag_cache_requests_total{cache,result}：各缓存的 hit / miss 次数，命中率在 PromQL 中计算：
+    sum by (cache) (rate(rag_cache_requests_total{result="hit"}[5m]))
+      / sum by (cache) (rate(rag_cache_requests_total[5m]))
+- rag_queue_jobs{kind,status}：mem_jobs 队列深度（抓取时查询）
+
+依赖耗时与 token 数不在各客户端里单独埋点，而是监听 rag/utils/tracing.py 的 span（install() 注册）。
+指标存于进程内；多 worker 进程部署时每个进程单独抓取。
+"""
+
+from __future__ import annotations
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from rag.utils import tracing
+from rag.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"duplicate metric: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in list(self._metrics):
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # {labels: [各桶计数（非累积）..., sum, count]}
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = next(i for i, b in enumerate(self.buckets) if value <= b)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels) -> int:
+        row = self._values.get(self._key(labels))
+        return int(row[-1]) if row else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = []
+        for key, row in items:
+            cumulative = 0.0
+            for b, n in zip(self.buckets, row):
+                cumulative += n
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_fmt(cumulative)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {_fmt(row[-1])}")
+        return out
+
+
+class CallbackGauge(_Metric):
+    """抓取时调用 fn() 取值：{(label 值...): value}"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fn: Optional[Callable[[], Dict[LabelKey, float]]] = None
+
+    def set_function(self, fn: Optional[Callable[[], Dict[LabelKey, float]]]) -> None:
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        if self._fn is None:
+            return []
+        try:
+            values = self._fn()
+        except Exception as e:
+            logger.warning("metric %s collect failed: %s", self.name, e)
+            return []
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(values.items())]
+
+
+# ===================== 指标定义 =====================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency by route template.", ["method", "route", "status"]
+)
+DEPENDENCY_SECONDS = Histogram(
+    "rag_dependency_duration_seconds", "Dependency call latency.", ["dependency", "operation"]
+)
+DEPENDENCY_ERRORS = Counter("rag_dependency_errors_total", "Failed dependency calls.", ["dependency", "operation"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens reported in LLM / embedding usage.", ["model", "type"])
+CACHE_REQUESTS = Counter("rag_cache_requests_total", "Cache lookups by result (hit / miss).", ["cache", "result"])
+QUEUE_JOBS = CallbackGauge("rag_queue_jobs", "Jobs in mem_jobs by kind and status.", ["kind", "status"])
+
+# span 名 → (dependency, operation)
+DEPENDENCY_SPANS: Dict[str, Tuple[str, str]] = {
+    "minio.get": ("minio", "get"),
+    "minio.put": ("minio", "put"),
+    "minio.stat": ("minio", "stat"),
+    "weaviate.search": ("weaviate", "search"),
+    "weaviate.batch": ("weaviate", "batch"),
+    "weaviate.fetch": ("weaviate", "fetch"),
+    "embedding": ("openai", "embedding"),
+    "llm.chat": ("openai", "chat"),
+}
+
+
+def record_cache(cache: str, hit: bool, n: int = 1) -> None:
+    if n > 0:
+        CACHE_REQUESTS.inc(n, cache=cache, result="hit" if hit else "miss")
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+
+
+def _on_span(s: tracing.Span) -> None:
+    dep = DEPENDENCY_SPANS.get(s.name)
+    if dep is None:
+        return
+    DEPENDENCY_SECONDS.observe(s.duration_ms / 1000.0, dependency=dep[0], operation=dep[1])
+    if s.error:
+        DEPENDENCY_ERRORS.inc(dependency=dep[0], operation=dep[1])
+    model = s.attrs.get("model", "")
+    if s.name == "llm.chat":
+        LLM_TOKENS.inc(s.attrs.get("prompt_tokens", 0), model=model, type="prompt")
+        LLM_TOKENS.inc(s.attrs.get("completion_tokens", 0), model=model, type="completion")
+    elif s.name == "embedding":
+        LLM_TOKENS.inc(s.attrs.get("prompt_tokens", 0), model=model, type="embedding")
+
+
+def install() -> None:
+    """开始按 span 记录依赖指标（可重复调用）"""
+    tracing.add_listener(_on_span)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,48 @@
+# rag/utils/timing.py
+# -*- coding: utf-8 -*-
+"""
+分阶段计时：
+    timer = StageTimer("push_message")
+    with timer.stage("fetch"):
+        ...
+    timer.log(logger, memory_id=...)
+
+stages 为 {阶段名: 毫秒}，同名阶段累加。
+处于 trace 中时，每个阶段同时记为一个 "{name}.{key}" span（见 rag/utils/tracing.py）。
+"""
+
+from __future__ import annotations
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from rag.utils.tracing import span
+
+
+class StageTimer:
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, key: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            with span(f"{self.name}.{key}"):
+                yield
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.stages[key] = round(self.stages.get(key, 0.0) + ms, 2)
+
+    @property
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def log(self, logger: logging.Logger, level: int = logging.INFO, **fields) -> None:
+        if not logger.isEnabledFor(level):
+            return
+        stages = " ".join(f"{k}={v}ms" for k, v in self.stages.items())
+        extra = " ".join(f"{k}={v}" for k, v in fields.items())
+        logger.log(level, "%s total=%sms %s %s", self.name, self.total_ms, stages, extra)
@@ -0,0 +1,295 @@
+# rag/utils/tracing.py
+# -*- coding: utf-8 -*-
+"""
+轻量级 span 追踪（无第三方依赖）：
+    with start_trace("POST /query"):            # 请求入口（API 中间件）
+        with span("minio.get", key=url) as s:   # 各层依赖调用
+            data = ...
+            s.add("bytes", len(data))
+
+- 当前 span 存在 contextvars 中，同一请求内的嵌套调用自动形成树；
+  未开启 trace 时 span() 只做一次 contextvar 读取，开销可忽略
+- 线程池中执行的任务用 wrap(fn) 绑定提交时的上下文（父 span、请求截止时间等 contextvars；
+  ThreadPoolExecutor 不会自动传递）
+- 每个 span 记录起止时间与属性；计数类属性（bytes / prompt_tokens / completion_tokens ...）用 add() 累加
+- 请求结束时根 span 交给导出器：
+  - RAG_TRACE_FILE=/path/traces.jsonl：每个请求一行 JSON（本地文件收集器）
+  - RAG_OTEL_ENABLED=true：按原始时间戳回放为 OpenTelemetry span（需要 opentelemetry-api，
+    tracer provider / exporter 由部署方配置，例如 opentelemetry-instrument 或 OTEL_* 环境变量）
+- RAGPipeline 在 debug=timing 时把当前 span 树放进 context_used.trace
+- add_listener(fn)：每个 span 结束时回调（如 rag/utils/metrics.py 按 span 记录依赖耗时 / token 数）；
+  注册了监听器时，trace 之外的 span 也会计时（不挂到任何树上，也不导出）
+"""
+
+from __future__ import annotations
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from rag.utils.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "root", "attrs", "children", "start", "end", "_t0", "_t1", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.root: "Span" = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.children: List["Span"] = []
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self._t0 = time.perf_counter()
+        self._t1: Optional[float] = None
+        self.error: Optional[str] = None
+
+    # ---------- 属性 ----------
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, key: str, n: float) -> "Span":
+        """计数类属性累加（字节数、token 数等）"""
+        self.attrs[key] = self.attrs.get(key, 0) + n
+        return self
+
+    def finish(self) -> None:
+        if self._t1 is None:
+            self._t1 = time.perf_counter()
+            self.end = time.time()
+
+    @property
+    def duration_ms(self) -> float:
+        t1 = self._t1 if self._t1 is not None else time.perf_counter()
+        return round((t1 - self._t0) * 1000, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"name": self.name, "duration_ms": self.duration_ms}
+        if self.attrs:
+            out["attrs"] = dict(self.attrs)
+        if self.error:
+            out["error"] = self.error
+        if self.children:
+            out["children"] = [c.to_dict() for c in list(self.children)]
+        return out
+
+
+class _NoopSpan:
+    """未开启 trace 时返回的空 span，接口与 Span 一致"""
+
+    def set(self, **attrs: Any) -> "_NoopSpan":
+        return self
+
+    def add(self, key: str, n: float) -> "_NoopSpan":
+        return self
+
+
+_NOOP = _NoopSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("rag_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+# ===================== 创建 span =====================
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Span]:
+    """开启一条 trace（根 span）；结束时交给导出器"""
+    root = Span(name, attrs=attrs)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        root.finish()
+        _current.reset(token)
+        _export(root)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Any]:
+    """在当前 trace 下开一个子 span；没有活动 trace 且没有监听器时为空操作"""
+    parent = _current.get()
+    if parent is None:
+        if not _listeners:
+            yield _NOOP
+            return
+        # trace 之外：只计时并通知监听器
+        s = Span(name, attrs=attrs)
+        try:
+            yield s
+        except BaseException as e:
+            s.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            s.finish()
+            _notify(s)
+        return
+    s = Span(name, parent, attrs)
+    parent.children.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.finish()
+        _current.reset(token)
+        _notify(s)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """装饰器：整个函数调用记为一个 span"""
+
+    def deco(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def wrap(fn: Callable) -> Callable:
+    """绑定调用方当前的 contextvars（span、rag/utils/deadline.py 的截止时间），供线程池任务使用（可并发调用）"""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # 每次调用用一份副本：同一个 Context 不能在多个线程里同时 run
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def trace_tree() -> Optional[Dict[str, Any]]:
+    """当前 trace 的 span 树（从根开始；进行中的 span 耗时按当前时刻计算）"""
+    s = _current.get()
+    if s is None:
+        return None
+    return s.root.to_dict()
+
+
+# ===================== 监听器 =====================
+
+_listeners: List[Callable[[Span], None]] = []
+
+
+def add_listener(fn: Callable[[Span], None]) -> None:
+    """注册 span 结束回调（重复注册同一函数只保留一个）"""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_listener(fn: Callable[[Span], None]) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _notify(s: Span) -> None:
+    for fn in list(_listeners):
+        try:
+            fn(s)
+        except Exception as e:
+            logger.warning("span listener failed: %s", e)
+
+
+# ===================== 导出 =====================
+
+class FileExporter:
+    """每个 trace 以一行 JSON 追加到文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+    def export(self, root: Span) -> None:
+        line = json.dumps(
+            {"trace_id": root.trace_id, "start": root.start, **root.to_dict()},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class OTelExporter:
+    """按原始起止时间把 span 树回放为 OpenTelemetry span"""
+
+    def __init__(self):
+        from opentelemetry import trace as otel_trace
+        self._otel = otel_trace
+        self.tracer = otel_trace.get_tracer("yeying-rag")
+
+    def export(self, root: Span) -> None:
+        self._emit(root, None)
+
+    def _emit(self, s: Span, parent_ctx) -> None:
+        otel_span = self.tracer.start_span(s.name, context=parent_ctx, start_time=int(s.start * 1e9))
+        for k, v in s.attrs.items():
+            if isinstance(v, (str, bool, int, float)):
+                otel_span.set_attribute(k, v)
+        if s.error:
+            otel_span.set_attribute("error", s.error)
+        ctx = self._otel.set_span_in_context(otel_span)
+        for c in list(s.children):
+            self._emit(c, ctx)
+        otel_span.end(end_time=int((s.end or time.time()) * 1e9))
+
+
+_exporters: Optional[List[Any]] = None
+_exporters_lock = threading.Lock()
+
+
+def _get_exporters() -> List[Any]:
+    global _exporters
+    if _exporters is None:
+        with _exporters_lock:
+            if _exporters is None:
+                exporters: List[Any] = []
+                path = os.getenv("RAG_TRACE_FILE")
+                if path:
+                    exporters.append(FileExporter(path))
+                if os.getenv("RAG_OTEL_ENABLED", "false").lower() == "true":
+                    try:
+                        exporters.append(OTelExporter())
+                    except ImportError:
+                        logger.warning("RAG_OTEL_ENABLED=true 但未安装 opentelemetry-api，跳过 OTel 导出")
+                _exporters = exporters
+    return _exporters
+
+
+def set_exporters(exporters: Optional[List[Any]]) -> None:
+    """替换导出器（None 表示按环境变量重新构建）"""
+    global _exporters
+    with _exporters_lock:
+        _exporters = exporters
+
+
+def _export(root: Span) -> None:
+    for exp in _get_exporters():
+        try:
+            exp.export(root)
+        except Exception as e:
+            logger.warning("trace export failed (%s): %s", type(exp).__name__, e)
@@ -1 +1,351 @@
-# 文档切分与存储
\ No newline at end of file
+# -*- coding: utf-8 -*-
+"""
+IngestWorker
+---------
+消费 mem_jobs 持久化队列，把耗时操作从请求路径挪到后台：
+- summarize：主记忆摘要（PrimaryMemory.maybe_summarize），push 不再阻塞在 LLM 上
+- ingest：一条消息的完整写入（fetch → primary → summary → auxiliary），分阶段 checkpoint
+
+特性：
+1. SQLite 持久化：进程重启后任务不丢，running 任务租约过期后可被重新领取（at-least-once）
+2. 去重 / 幂等：同一 memory 的摘要触发在排队期间只保留一个任务；ingest 按 memory_id + url 幂等
+3. 断点续做：每个阶段完成后写 checkpoint，重放时跳过已完成阶段；
+   primary 阶段的 checkpoint 与主记忆写入在同一事务提交，计数不会因重放重复累加
+4. 失败重试：按 attempts 退避，超过 max_attempts（或 PermanentJobError）进入死信 dead，
+   可通过 POST /memory/jobs/{job_id}/requeue 重放
+5. 心跳续租：处理函数执行期间后台定时器每 heartbeat_s 秒续租一次（默认 lease_s / 3），
+   摘要这类耗时长、没有中间 checkpoint 的任务不会因租约过期被其它 worker 重复领取
+6. 有界并发：concurrency 个线程各自领取任务（RAG_WORKER_CONCURRENCY，默认 4）
+7. 定期维护：schedule() 注册的函数由空闲的 worker 线程按间隔执行（同一时刻只有一个线程执行），
+   默认注册摘要分块缓存清理（RAG_SUMMARY_CHUNK_TTL_DAYS，默认 30 天，0 关闭；
+   间隔 RAG_WORKER_MAINTENANCE_INTERVAL_S，默认 3600 秒）
+
+运行方式：
+- 独立进程：python -m rag.workers.ingest_worker
+- API 进程内：RAG_INPROC_WORKER=true（默认）时随 FastAPI 启动后台线程
+"""
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from rag.datasource.sqlstores.mem_jobs_store import MemJobsStore
+from rag.utils.logging import get_logger
+from rag.utils.messages import parse_messages
+from rag.utils.tracing import start_trace
+
+logger = get_logger(__name__)
+
+# 与 rag.memory.memory_manager 中的同名常量保持一致（此处不引入 memory 层依赖）
+JOB_SUMMARIZE = "summarize"
+JOB_INGEST = "ingest"
+
+
+class PermanentJobError(Exception):
+    """不可重试的错误（如源对象不存在），任务直接进入死信"""
+
+
+class LeaseLostError(Exception):
+    """租约已被其它 worker 接管，本 worker 放弃该任务"""
+
+
+class JobContext:
+    """
+    处理函数的运行上下文：读取 / 推进 checkpoint（写入时校验持有者并续租）
+    checkpoint 形如 {"stages": ["primary", ...], ...各阶段产物}
+    """
+
+    def __init__(self, jobs: MemJobsStore, job: Dict[str, Any], worker_id: str, lease_s: float):
+        self.jobs = jobs
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_s = lease_s
+        self.checkpoint: Dict[str, Any] = dict(job.get("checkpoint") or {})
+        self.checkpoint.setdefault("stages", [])
+        self.lease_lost = threading.Event()
+
+    def done(self, stage: str) -> bool:
+        return stage in self.checkpoint["stages"]
+
+    def mark(self, stage: str, **data: Any) -> None:
+        """记录阶段完成；可放在调用方的 transaction() 内，与业务写入一起提交"""
+        checkpoint = dict(self.checkpoint, **data)
+        checkpoint["stages"] = self.checkpoint["stages"] + [stage]
+        if not self.jobs.save_checkpoint(self.job["job_id"], self.worker_id, checkpoint, lease_s=self.lease_s):
+            raise LeaseLostError(f"job {self.job['job_id']} 租约已失效")
+        self.checkpoint = checkpoint
+
+
+class Heartbeat:
+    """处理函数执行期间定时续租；续租失败（租约已被接管）时设置 ctx.lease_lost 并停止"""
+
+    def __init__(self, ctx: JobContext, interval_s: float):
+        self.ctx = ctx
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-heartbeat-{ctx.job['job_id'][:8]}", daemon=True
+        )
+
+    def _run(self) -> None:
+        ctx = self.ctx
+        while not self._stop.wait(self.interval_s):
+            try:
+                if not ctx.jobs.heartbeat(ctx.job["job_id"], ctx.worker_id, lease_s=ctx.lease_s):
+                    logger.warning("job heartbeat rejected, lease lost: %s", ctx.job["job_id"])
+                    ctx.lease_lost.set()
+                    return
+            except Exception as e:  # 数据库暂时不可用：下一轮再试
+                logger.warning("job heartbeat error: %s %s", ctx.job["job_id"], e)
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+Handler = Callable[[Dict[str, Any], JobContext], Optional[Dict[str, Any]]]
+
+
+class IngestWorker:
+    def __init__(
+        self,
+        jobs: MemJobsStore,
+        poll_interval: float = 1.0,
+        lease_s: float = 300.0,
+        retry_delay_s: float = 5.0,
+        worker_id: Optional[str] = None,
+        concurrency: int = 1,
+        heartbeat_s: Optional[float] = None,
+    ):
+        """
+        :param jobs: 任务队列存储
+        :param poll_interval: 队列为空时的轮询间隔（秒）
+        :param lease_s: 领取租约时长；超过未完成视为崩溃，任务可被其它 worker 重领
+        :param retry_delay_s: 失败重试的基础退避（秒），实际为 retry_delay_s × attempts
+        :param concurrency: 后台线程数，每个线程以 {worker_id}-{i} 身份领取任务
+        :param heartbeat_s: 处理期间的续租间隔（秒），默认 lease_s / 3
+        """
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.lease_s = lease_s
+        self.retry_delay_s = retry_delay_s
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self.heartbeat_s = heartbeat_s if heartbeat_s is not None else lease_s / 3.0
+        self.handlers: Dict[str, Handler] = {}
+        self._periodic: List[Dict[str, Any]] = []
+        self._periodic_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def register(self, kind: str, handler: Handler) -> None:
+        """注册任务处理函数：handler(job, ctx) -> 结果 dict（写入 result_json）"""
+        self.handlers[kind] = handler
+
+    def schedule(self, name: str, interval_s: float, fn: Callable[[], Any]) -> None:
+        """注册定期维护函数：worker 启动后先执行一次，之后每 interval_s 秒执行一次"""
+        self._periodic.append({"name": name, "interval_s": interval_s, "fn": fn, "next_at": 0.0})
+
+    def run_periodic(self) -> int:
+        """执行已到期的维护函数，返回执行个数；其它线程正在执行时直接返回 0"""
+        if not self._periodic or not self._periodic_lock.acquire(blocking=False):
+            return 0
+        ran = 0
+        try:
+            for task in self._periodic:
+                now = time.monotonic()
+                if now < task["next_at"]:
+                    continue
+                task["next_at"] = now + task["interval_s"]
+                ran += 1
+                try:
+                    logger.info("IngestWorker periodic %s: %s", task["name"], task["fn"]())
+                except Exception as e:
+                    logger.warning("IngestWorker periodic %s failed: %s", task["name"], e)
+        finally:
+            self._periodic_lock.release()
+        return ran
+
+    # ===================== 主流程 =====================
+
+    def run_once(self, worker_id: Optional[str] = None) -> bool:
+        """领取并执行一个任务；队列为空返回 False"""
+        worker_id = worker_id or self.worker_id
+        job = self.jobs.claim(worker_id, self.handlers.keys(), lease_s=self.lease_s)
+        if job is None:
+            return False
+
+        handler = self.handlers[job["kind"]]
+        ctx = JobContext(self.jobs, job, worker_id, self.lease_s)
+        try:
+            with start_trace(f"job.{job['kind']}", job_id=job["job_id"], attempts=job.get("attempts")):
+                with Heartbeat(ctx, self.heartbeat_s):
+                    result = handler(job, ctx)
+            if self.jobs.complete(job["job_id"], result, worker_id=worker_id):
+                logger.info("job done: %s %s memory_id=%s", job["kind"], job["job_id"], job["memory_id"])
+            else:
+                logger.warning("job lease lost before completion: %s %s", job["kind"], job["job_id"])
+        except LeaseLostError as e:
+            logger.warning("job abandoned: %s", e)
+        except Exception as e:
+            status = self.jobs.fail(
+                job["job_id"],
+                str(e),
+                retry_delay_s=self.retry_delay_s,
+                permanent=isinstance(e, PermanentJobError),
+                worker_id=worker_id,
+            )
+            logger.warning(
+                "job failed (%s): %s %s memory_id=%s: %s",
+                status, job["kind"], job["job_id"], job["memory_id"], e,
+            )
+        return True
+
+    def run_forever(self, worker_id: Optional[str] = None) -> None:
+        worker_id = worker_id or self.worker_id
+        logger.info("IngestWorker %s started, kinds=%s", worker_id, list(self.handlers))
+        while not self._stop.is_set():
+            self.run_periodic()
+            try:
+                if self.run_once(worker_id):
+                    continue
+            except Exception as e:  # 队列本身异常（如数据库被锁），稍后重试
+                logger.warning("IngestWorker poll error: %s", e)
+            self._stop.wait(self.poll_interval)
+        logger.info("IngestWorker %s stopped", worker_id)
+
+    # ===================== 后台线程 =====================
+
+    def start(self) -> None:
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self.run_forever,
+                args=(f"{self.worker_id}-{i}",),
+                name=f"ingest-worker-{i}",
+                daemon=True,
+            )
+            for i in range(self.concurrency)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+
+# ===================== 处理函数 =====================
+
+class IngestPipeline:
+    """
+    ingest 任务处理函数，payload = {"url", "description"}：
+    primary（登记 + 计数，与 checkpoint 同事务）→ summary（按阈值入队摘要）→ auxiliary（先删后写向量）
+    """
+
+    def __init__(self, memory):
+        self.memory = memory
+
+    def _fetch(self, url: str) -> str:
+        try:
+            return self.memory.ds.minio.get_text(url)
+        except Exception as e:
+            if getattr(e, "code", None) in ("NoSuchKey", "NoSuchBucket"):
+                raise PermanentJobError(f"源对象不存在: {url}") from e
+            raise
+
+    def __call__(self, job: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+        memory = self.memory
+        memory_id, app = job["memory_id"], job["app"]
+        url = job["payload"]["url"]
+        raw_text = self._fetch(url)
+
+        progress = None
+        if not ctx.done("primary"):
+            with memory.ds.sqlite_conn.transaction():
+                row, progress = memory.primary.push_with_progress(
+                    memory_id=memory_id,
+                    app=app,
+                    url=url,
+                    description=job["payload"].get("description"),
+                    body=raw_text,
+                )
+                ctx.mark(
+                    "primary",
+                    uid=row.get("uid"),
+                    context_version=progress["context_version"] if progress else None,
+                )
+            # 提交之后再更新快照，避免事务回滚留下超前的版本
+            if progress:
+                memory.snapshots.on_push(memory_id, url, raw_text, progress["context_version"])
+
+        if not ctx.done("summary"):
+            summary_job_id = memory.ingest_summary(memory_id, app, progress, bodies={url: raw_text})
+            ctx.mark("summary", summary_job_id=summary_job_id)
+
+        if not ctx.done("auxiliary"):
+            # 上一次尝试可能已部分写入 Weaviate：先删后写（vector_version 在写入成功后才递增）
+            ids = memory.ingest_auxiliary(memory_id, app, url, parse_messages(raw_text), replace=True)
+            ctx.mark("auxiliary", vector_count=len(ids or []))
+
+        return {k: v for k, v in ctx.checkpoint.items() if k != "stages"}
+
+
+def build_worker(memory) -> IngestWorker:
+    """
+    基于 MemoryManager 装配默认 worker（注册 summarize / ingest 处理函数）
+    """
+    worker = IngestWorker(
+        jobs=memory.ds.mem_jobs,
+        poll_interval=float(os.getenv("RAG_WORKER_POLL_INTERVAL", "1.0")),
+        lease_s=float(os.getenv("RAG_WORKER_LEASE_S", "300")),
+        concurrency=int(os.getenv("RAG_WORKER_CONCURRENCY", "4")),
+    )
+
+    def _summarize(job: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+        summary_url = memory.primary.maybe_summarize(memory_id=job["memory_id"], app=job["app"])
+        if summary_url:
+            memory.snapshots.invalidate(job["memory_id"])
+        return {"summary_url": summary_url}
+
+    worker.register(JOB_SUMMARIZE, _summarize)
+    worker.register(JOB_INGEST, IngestPipeline(memory))
+
+    chunks = getattr(memory.ds, "mem_summary_chunks", None)
+    ttl_days = int(os.getenv("RAG_SUMMARY_CHUNK_TTL_DAYS", "30"))
+    if chunks is not None and ttl_days > 0:
+        worker.schedule(
+            "summary_chunks_ttl",
+            float(os.getenv("RAG_WORKER_MAINTENANCE_INTERVAL_S", "3600")),
+            lambda: chunks.delete_older_than(ttl_days),
+        )
+    return worker
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(override=False)
+
+    from rag.datasource.base import Datasource
+    from rag.memory.memory_manager import MemoryManager
+    from rag.utils.logging import setup_logging
+
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    w = build_worker(MemoryManager(Datasource()))
+    w.start()
+    try:
+        w._stop.wait()
+    except KeyboardInterrupt:
+        w.stop()
@@ -1 +1,264 @@
-# 断点续传与状态管理
\ No newline at end of file
+# rag/workers/resume_state.py
+# -*- coding: utf-8 -*-
+"""
+简历状态（断点续传与状态管理）：一份简历只解析一次，之后按 url + ETag 复用
+- ResumeState：规范化后的简历
+  - position / skills（去空白、大小写不敏感去重、保持原顺序）/ projects（字符串或 {name, description, tech} 统一为一行文本）
+  - skills_text / projects_text：面试题 prompt 直接使用的文本块
+  - embedding：职位 + 技能 + 项目拼成的文本向量（JD 匹配时直接作为 query 向量）
+- ResumeStateService.get(url)：
+  1) 进程内 LRU：RAG_RESUME_STAT_TTL_S（默认 30 秒）内直接复用，不访问 MinIO
+  2) 否则 HEAD 取 ETag：与进程内 / SQLite（resume_states）记录一致则复用
+  3) 都不一致才下载 + json 解析 + 计算 embedding，并写回 SQLite
+  embedding 失败不影响解析结果（embedding 为 None，之后命中时补算）；
+  失败记入进程内负缓存，按指数退避（RAG_RESUME_EMBED_RETRY_S 起步，翻倍至 RAG_RESUME_EMBED_RETRY_MAX_S）
+  到期前的命中不再重试，embedding 服务故障时不会每次请求都多等一次超时
+
+环境变量：
+- RAG_RESUME_CACHE_SIZE：进程内缓存的简历数，默认 256
+- RAG_RESUME_STAT_TTL_S：进程内条目免 ETag 校验的时长（秒），默认 30；0 表示每次都校验
+- RAG_RESUME_EMBED_CHARS：参与 embedding 的文本长度上限，默认 4000
+- RAG_RESUME_EMBED_RETRY_S：embedding 失败后首次重试的间隔（秒），默认 30
+- RAG_RESUME_EMBED_RETRY_MAX_S：重试间隔上限（秒），默认 600
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from rag.utils.logging import get_logger
+from rag.utils.metrics import record_cache
+from rag.utils.tracing import span
+
+logger = get_logger(__name__)
+
+
+# ===================== 规范化 =====================
+
+def normalize_skills(skills: Any) -> List[str]:
+    """技能列表：支持 list 或逗号/顿号分隔的字符串；去空白、大小写不敏感去重，保持原顺序"""
+    if isinstance(skills, str):
+        for sep in ("、", "，", ";", "；"):
+            skills = skills.replace(sep, ",")
+        skills = skills.split(",")
+    out, seen = [], set()
+    for s in skills or []:
+        s = str(s).strip()
+        if s and s.lower() not in seen:
+            seen.add(s.lower())
+            out.append(s)
+    return out
+
+
+def _project_line(p: Any) -> str:
+    if isinstance(p, dict):
+        name = str(p.get("name") or p.get("title") or "").strip()
+        desc = str(p.get("description") or p.get("desc") or "").strip()
+        tech = p.get("tech") or p.get("tech_stack") or p.get("skills")
+        line = f"{name}：{desc}" if name and desc else (name or desc)
+        if tech:
+            line += f"（技术：{', '.join(normalize_skills(tech))}）"
+        return line
+    return str(p or "").strip()
+
+
+def normalize_projects(projects: Any) -> List[str]:
+    """项目经历：字符串原样保留（去空白），dict 拼成「名称：描述（技术：...）」；空项丢弃"""
+    if isinstance(projects, (str, dict)):
+        projects = [projects]
+    return [line for line in (_project_line(p) for p in projects or []) if line]
+
+
+# ===================== 状态 =====================
+
+@dataclass
+class ResumeState:
+    url: str
+    etag: str
+    position: str = ""
+    skills: List[str] = field(default_factory=list)
+    projects: List[str] = field(default_factory=list)
+    raw: Dict[str, Any] = field(default_factory=dict)
+    embedding: Optional[List[float]] = None
+    embed_model: Optional[str] = None
+
+    @classmethod
+    def parse(cls, url: str, etag: str, data: Any) -> "ResumeState":
+        if not isinstance(data, dict):
+            raise ValueError("简历 JSON 顶层必须是对象")
+        return cls(
+            url=url,
+            etag=etag,
+            position=str(data.get("position") or "").strip(),
+            skills=normalize_skills(data.get("skills")),
+            projects=normalize_projects(data.get("projects")),
+            raw=data,
+        )
+
+    @property
+    def skills_text(self) -> str:
+        return ", ".join(self.skills)
+
+    @property
+    def projects_text(self) -> str:
+        return "\n".join(self.projects)
+
+    def embed_text(self, max_chars: int) -> str:
+        text = f"职位：{self.position}\n技能：{self.skills_text}\n项目经历：\n{self.projects_text}"
+        return text[:max_chars]
+
+    def to_row(self) -> Dict[str, Any]:
+        return {"position": self.position, "skills": self.skills, "projects": self.projects, "raw": self.raw}
+
+
+# ===================== 服务 =====================
+
+class ResumeStateService:
+    def __init__(
+        self,
+        minio,
+        store=None,
+        embedder: Optional[Callable[[], Any]] = None,
+        max_entries: Optional[int] = None,
+        stat_ttl_s: Optional[float] = None,
+        embed_retry_s: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param minio: MinIOStore（需要 etag / get_bytes）
+        :param store: ResumeStatesStore，None 时只用进程内缓存
+        :param embedder: 返回 embedder 的函数（延迟创建）；None 时不计算 embedding
+        """
+        self.minio = minio
+        self.store = store
+        self._embedder = embedder
+        self.max_entries = int(os.getenv("RAG_RESUME_CACHE_SIZE", "256")) if max_entries is None else max_entries
+        self.stat_ttl_s = float(os.getenv("RAG_RESUME_STAT_TTL_S", "30")) if stat_ttl_s is None else stat_ttl_s
+        self.embed_chars = int(os.getenv("RAG_RESUME_EMBED_CHARS", "4000"))
+        self.embed_retry_s = (
+            float(os.getenv("RAG_RESUME_EMBED_RETRY_S", "30")) if embed_retry_s is None else embed_retry_s
+        )
+        self.embed_retry_max_s = float(os.getenv("RAG_RESUME_EMBED_RETRY_MAX_S", "600"))
+        self._clock = clock
+        # {url: (state, 上次确认 ETag 的时刻)}
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        # embedding 负缓存 {url: (连续失败次数, 下次允许重试的时刻)}
+        self._embed_failures: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> ResumeState:
+        """返回 url 对应的简历状态；对象不存在或不是合法 JSON 时抛异常"""
+        with span("resume.get") as s:
+            now = self._clock()
+            with self._lock:
+                cached = self._lru.get(url)
+            if cached is not None and now - cached[1] < self.stat_ttl_s:
+                s.set(source="memory")
+                record_cache("resume", True)
+                return self._ensure_embedding(cached[0])
+
+            etag = self.minio.etag(url) or ""
+            if cached is not None and cached[0].etag == etag:
+                state, source = cached[0], "memory"
+            else:
+                state, source = (self._load(url, etag) if self.store is not None else None), "store"
+            if state is None:
+                source = "minio"
+                state = ResumeState.parse(url, etag, json.loads(self.minio.get_bytes(url).decode("utf-8")))
+                self._compute_embedding(state)
+                self._save(state)
+            s.set(source=source)
+            record_cache("resume", source != "minio")
+            self._remember(state, now)
+            return self._ensure_embedding(state)
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            self._lru.pop(url, None)
+            self._embed_failures.pop(url, None)
+        if self.store is not None:
+            self.store.delete(url)
+
+    # ---------- 内部 ----------
+    def _load(self, url: str, etag: str) -> Optional[ResumeState]:
+        row = self.store.get(url)
+        if row is None or row["etag"] != etag:
+            return None
+        st = row["state"]
+        return ResumeState(
+            url=url,
+            etag=etag,
+            position=st.get("position", ""),
+            skills=st.get("skills", []),
+            projects=st.get("projects", []),
+            raw=st.get("raw", {}),
+            embedding=row["embedding"],
+            embed_model=row["embed_model"],
+        )
+
+    def _save(self, state: ResumeState) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.upsert(state.url, state.etag, state.to_row(), state.embedding, state.embed_model)
+        except Exception as e:
+            logger.warning("resume state save failed: %s %s", state.url, e)
+
+    def _remember(self, state: ResumeState, now: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._lru[state.url] = (state, now)
+            self._lru.move_to_end(state.url)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _current_embedder(self):
+        return self._embedder() if self._embedder is not None else None
+
+    def _compute_embedding(self, state: ResumeState) -> bool:
+        embedder = self._current_embedder()
+        if embedder is None:
+            return False
+        try:
+            state.embedding = embedder.embed_query(state.embed_text(self.embed_chars))
+            state.embed_model = getattr(embedder, "model", None)
+        except Exception as e:
+            failures = self._record_embed_failure(state.url)
+            logger.warning("resume embedding failed (%d): %s %s", failures, state.url, e)
+            return False
+        with self._lock:
+            self._embed_failures.pop(state.url, None)
+        return True
+
+    def _record_embed_failure(self, url: str) -> int:
+        with self._lock:
+            failures = self._embed_failures.pop(url, (0, 0.0))[0] + 1
+            delay = min(self.embed_retry_s * 2 ** (failures - 1), self.embed_retry_max_s)
+            self._embed_failures[url] = (failures, self._clock() + delay)
+            while len(self._embed_failures) > max(self.max_entries, 1):
+                self._embed_failures.popitem(last=False)
+        return failures
+
+    def _embed_backoff(self, url: str) -> bool:
+        """上次 embedding 失败且尚未到重试时刻"""
+        with self._lock:
+            failed = self._embed_failures.get(url)
+        return failed is not None and self._clock() < failed[1]
+
+    def _ensure_embedding(self, state: ResumeState) -> ResumeState:
+        """缓存里没有 embedding（上次失败）或模型已变化时补算并写回；失败退避期内不重试"""
+        embedder = self._current_embedder()
+        if embedder is None:
+            return state
+        if state.embedding is None or state.embed_model != getattr(embedder, "model", None):
+            if self._embed_backoff(state.url):
+                return state
+            if self._compute_embedding(state):
+                self._save(state)
+        return state
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+from rag.api.container import Container
+from rag.core.pipeline import RAGPipeline
+
+
+class FakeEmbedder:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.closed = False
+        self.fail = fail
+
+    def embed_query(self, text):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("embedding down")
+        return [1.0, 0.0]
+
+    def close(self):
+        self.closed = True
+
+
+def _container(**kw):
+    ds = SimpleNamespace(
+        sqlite_conn=SimpleNamespace(query_one=lambda sql: {"ok": 1}),
+        weaviate=None,
+        minio=None,
+        close=lambda: None,
+    )
+    memory = SimpleNamespace(close=lambda: None)
+    kw.setdefault("embedder", FakeEmbedder())
+    return Container(SimpleNamespace(), ds=ds, memory=memory, llm=SimpleNamespace(), **kw)
+
+
+def test_components_are_built_once_and_shared():
+    c = _container()
+    assert c.pipeline is c.pipeline
+    assert isinstance(c.pipeline, RAGPipeline)
+    assert c.pipeline.memory is c.memory and c.pipeline.llm is c.llm
+    assert c.build() is c
+
+
+def test_unknown_override_rejected():
+    with pytest.raises(ValueError):
+        Container(SimpleNamespace(), cache=object())
+
+
+def test_warmup_reports_each_step_and_tolerates_failures():
+    c = _container(embedder=FakeEmbedder(fail=True))
+    report = c.warmup()
+    assert report["sqlite"]["status"] == "ok"
+    assert report["weaviate"]["status"] == "skipped" and report["minio"]["status"] == "skipped"
+    assert report["embedding"] == {"status": "error", "error": "embedding down", "ms": report["embedding"]["ms"]}
+    assert report["tokenizer"]["status"] == "ok"
+    assert c.warmup_report is report
+
+
+def test_warmup_primes_embedder_and_close_releases_components():
+    embedder = FakeEmbedder()
+    c = _container(embedder=embedder)
+    c.warmup()
+    assert embedder.calls == 1
+    c.close()
+    assert embedder.closed
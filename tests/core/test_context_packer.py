@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from rag.core.context_packer import ContextItem, ContextPacker, HeuristicTokenizer
+
+
+def _packer(**kw):
+    return ContextPacker(tokenizer=HeuristicTokenizer(), **kw)
+
+
+def test_skips_oversized_item_and_keeps_filling():
+    packer = _packer(shares={"recent": 1.0}, min_truncate_tokens=10_000)
+    items = [
+        ContextItem("a" * 40, "recent", score=3),
+        ContextItem("b" * 4000, "recent", score=2),   # 放不下：跳过而不是停止
+        ContextItem("c" * 40, "recent", score=1),
+    ]
+    packed = packer.pack(items, max_tokens=100)
+    assert packed.text == "a" * 40 + "\n\n" + "c" * 40
+    assert packed.dropped == 1
+    assert packed.tokens <= 100
+
+
+def test_dedupes_by_hash_and_by_covered_url():
+    packer = _packer()
+    items = [
+        ContextItem("完整对话 Q: 你好 A: 你好！", "recent", score=1, url="u1"),
+        ContextItem("你好！", "retrieved", score=0.9, url="u1"),       # 整篇已收录
+        ContextItem("另一条命中", "retrieved", score=0.8, url="u2"),
+        ContextItem("另一条命中 ", "retrieved", score=0.7, url="u3"),  # 规范化后重复
+    ]
+    packed = packer.pack(items, max_tokens=1000)
+    assert [it.url for it in packed.items] == ["u1", "u2"]
+    assert packed.duplicates == 2
+
+
+def test_per_source_budget_and_reclaim():
+    packer = _packer(shares={"summary": 0.5, "retrieved": 0.5})
+    items = [ContextItem(f"摘要{i}" * 10, "summary", score=i) for i in range(3)]
+    items += [ContextItem(f"hit {i} " * 5, "retrieved", score=1 - i / 10) for i in range(3)]
+    packed = packer.pack(items, max_tokens=90)
+
+    stats = packed.stats()
+    assert stats["tokens"] <= 90
+    # 两个来源都有条目入选，且输出保持来源顺序（摘要在前）
+    sources = [it.source for it in packed.items]
+    assert "summary" in sources and "retrieved" in sources
+    assert sources == sorted(sources, key=["summary", "retrieved"].index)
+    # 摘要来源内保持原始顺序
+    orders = [it.order for it in packed.items if it.source == "summary"]
+    assert orders == sorted(orders)
+
+
+def test_truncates_top_item_when_nothing_else_fits():
+    packer = _packer(shares={"summary": 1.0}, min_truncate_tokens=8)
+    packed = packer.pack([ContextItem("字" * 500, "summary", score=1)], max_tokens=50)
+    assert 0 < packed.tokens <= 50
+    assert packed.text.startswith("字")
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import time
+
+from rag.core.rerank import BM25Scorer, Reranker, lexical_tokens
+
+
+def _hits():
+    return [
+        {"content": "今天天气不错", "score": 0.9},
+        {"content": "Redis 缓存击穿怎么处理", "score": 0.8},
+        {"content": "缓存击穿可以用互斥锁或逻辑过期解决", "score": 0.7},
+    ]
+
+
+def test_lexical_tokens_mix_cjk_and_words():
+    assert lexical_tokens("Redis缓存") == ["redis", "缓", "存", "缓存"]
+
+
+def test_bm25_promotes_lexical_matches():
+    reranker = Reranker(BM25Scorer(), weight=1.0)
+    out = reranker.rerank("缓存击穿", _hits(), top_n=2)
+    assert [h["content"] for h in out][0] != "今天天气不错"
+    assert len(out) == 2 and all("rerank_score" in h for h in out)
+
+
+class _SlowScorer:
+    default_weight = 1.0
+    batched = True
+
+    def score(self, query, texts):
+        time.sleep(0.02)
+        return [float(len(t)) for t in texts]
+
+
+def test_over_budget_keeps_original_order():
+    reranker = Reranker(_SlowScorer(), batch_size=1, budget_ms=5)
+    hits = _hits()
+    assert reranker.rerank("缓存", hits, top_n=2) == hits[:2]
+
+
+def test_batched_scorer_sees_every_candidate():
+    reranker = Reranker(_SlowScorer(), batch_size=2)
+    out = reranker.rerank("q", _hits())
+    assert [h["content"] for h in out][0] == "缓存击穿可以用互斥锁或逻辑过期解决"
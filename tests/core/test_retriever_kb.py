@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from rag.core.pipeline import RAGPipeline
+from rag.core.retriever_kb import KBRetriever, parse_collections
+
+
+class FakeStore:
+    """collection -> [(text, score)]；slow 中的 collection 检索会阻塞直到 release"""
+
+    def __init__(self, data, slow=(), broken=()):
+        self.data = data
+        self.slow = set(slow)
+        self.broken = set(broken)
+        self.release = threading.Event()
+        self.vectors = []
+
+    def search(self, query_vector, top_k=8, collection=None, **kw):
+        self.vectors.append(query_vector)
+        if collection in self.broken:
+            raise RuntimeError("boom")
+        if collection in self.slow:
+            self.release.wait(2)
+        return [
+            {"properties": {"text": t, "meta": json.dumps({"filename": f"{collection}.md"})}, "score": s}
+            for t, s in self.data.get(collection, [])[:top_k]
+        ]
+
+
+def test_parse_collections():
+    assert parse_collections(" KbDefault, Docs:300 ,,", 800) == {"KbDefault": 800.0, "Docs": 300.0}
+    assert parse_collections("", 800) == {}
+
+
+def test_merge_caps_each_collection_and_dedups():
+    store = FakeStore({
+        "A": [("a1", 0.9), ("a2", 0.8), ("a3", 0.7)],
+        "B": [("a1", 0.85), ("b1", 0.75), ("", 0.99)],
+    })
+    kb = KBRetriever(lambda: store, collections={"A": 1000, "B": 1000}, top_k=2, min_score=0.0)
+    hits, report = kb.search([1.0, 0.0])
+    assert [(h["collection"], h["text"]) for h in hits] == [("A", "a1"), ("A", "a2"), ("B", "b1")]
+    assert hits[0]["meta"] == {"filename": "A.md"}
+    assert report["A"]["status"] == "ok" and report["B"]["hits"] == 2
+    assert store.vectors == [[1.0, 0.0], [1.0, 0.0]]
+    kb.close()
+
+
+def test_slow_and_broken_collections_are_skipped():
+    store = FakeStore({"Fast": [("f", 0.9)], "Slow": [("s", 0.99)]}, slow={"Slow"}, broken={"Bad"})
+    kb = KBRetriever(lambda: store, collections={"Fast": 1000, "Slow": 50, "Bad": 1000}, top_k=3, min_score=0.0)
+    t0 = time.perf_counter()
+    hits, report = kb.search([1.0])
+    assert time.perf_counter() - t0 < 1.0
+    store.release.set()
+    assert [h["text"] for h in hits] == ["f"]
+    assert report["Slow"] == {"status": "timeout", "hits": 0, "ms": 50}
+    assert report["Bad"]["status"] == "error"
+    kb.close()
+
+
+def test_disabled_without_collections_or_store():
+    assert not KBRetriever(lambda: None, collections={}).enabled
+    kb = KBRetriever(lambda: None, collections={"A": 100})
+    try:
+        kb.submit([1.0])
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+
+
+def test_pipeline_packs_kb_hits_with_shared_query_vector():
+    store = FakeStore({"Docs": [("Redis 持久化分为 RDB 与 AOF", 0.9)]})
+    kb = KBRetriever(lambda: store, collections={"Docs": 1000}, top_k=2, min_score=0.0, embed_model="emb-1")
+    seen = {}
+
+    def get_context(**kw):
+        seen["vector"] = kw["query_vector"]
+        return {"summary_urls": [], "recent_urls": [], "texts": {}, "retrieved": []}
+
+    def complete(prompt, **kw):
+        seen["prompt"] = prompt
+        return "ok"
+
+    memory = SimpleNamespace(
+        answers=SimpleNamespace(enabled=False),
+        embedding_model=lambda memory_id: "emb-1",
+        embed_query=lambda memory_id, query: [0.5, 0.5],
+        get_context=get_context,
+    )
+    pipeline = RAGPipeline(SimpleNamespace(), memory, SimpleNamespace(complete=complete), kb=kb)
+    out = pipeline.run("m1", "app", "Redis 怎么持久化")
+
+    assert seen["vector"] == [0.5, 0.5] and store.vectors == [[0.5, 0.5]]
+    assert "RDB 与 AOF" in seen["prompt"]
+    used = out["context_used"]
+    assert used["kb"]["collections"]["Docs"]["status"] == "ok"
+    assert used["kb"]["hits"] == [{"collection": "Docs", "score": 0.9, "meta": {"filename": "Docs.md"}}]
+    assert used["packing"]["by_source"]["kb"] > 0
+    pipeline.close()
+
+
+def test_busy_collection_is_skipped_until_previous_search_finishes():
+    store = FakeStore({"Fast": [("f", 0.9)], "Slow": [("s", 0.99)]}, slow={"Slow"})
+    kb = KBRetriever(lambda: store, collections={"Fast": 1000, "Slow": 50}, top_k=3, min_score=0.0, workers=4)
+
+    _, report = kb.search([1.0])
+    assert report["Slow"]["status"] == "timeout"
+    # 上一次 Slow 检索仍卡在 Weaviate：本次不再提交，不多占线程
+    _, report = kb.search([1.0])
+    assert report["Slow"] == {"status": "busy", "hits": 0}
+    assert report["Fast"]["status"] == "ok"
+    assert len(store.vectors) == 3
+
+    store.release.set()
+    time.sleep(0.05)
+    _, report = kb.search([1.0])
+    assert report["Slow"]["status"] == "ok" and len(store.vectors) == 5
+    kb.close()
+
+
+def test_pipeline_uses_kb_embedder_when_models_differ():
+    store = FakeStore({"Docs": [("doc", 0.9)]})
+    kb_embedder = SimpleNamespace(model="kb-emb", embed_query=lambda q: [9.0])
+    kb = KBRetriever(
+        lambda: store, collections={"Docs": 1000}, top_k=2, min_score=0.0,
+        embedder=lambda: kb_embedder, embed_model="kb-emb",
+    )
+    seen = {}
+
+    def get_context(**kw):
+        seen["vector"] = kw["query_vector"]
+        return {"summary_urls": [], "recent_urls": [], "texts": {}, "retrieved": []}
+
+    memory = SimpleNamespace(
+        answers=SimpleNamespace(enabled=False),
+        embedding_model=lambda memory_id: "mem-emb",
+        embed_query=lambda memory_id, query: [0.5, 0.5],
+        get_context=get_context,
+    )
+    pipeline = RAGPipeline(SimpleNamespace(), memory, SimpleNamespace(complete=lambda prompt, **kw: "ok"), kb=kb)
+    out = pipeline.run("m1", "app", "q")
+
+    # 知识库用自己的模型向量化；记忆检索不受影响（自行向量化）
+    assert store.vectors == [[9.0]]
+    assert seen["vector"] is None
+    assert out["context_used"]["kb"]["collections"]["Docs"]["status"] == "ok"
+    pipeline.close()
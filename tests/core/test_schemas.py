@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from rag.core.schemas import InterviewQueryReq
+
+
+def test_interview_max_chars_is_deprecated_alias_for_max_tokens():
+    # 旧客户端只传 max_chars：换算为 token 预算，不再被静默忽略
+    assert InterviewQueryReq(memory_id="m", max_chars=500).max_tokens == 500
+    # 同时传入时以 max_tokens 为准
+    assert InterviewQueryReq(memory_id="m", max_chars=500, max_tokens=120).max_tokens == 120
+    assert InterviewQueryReq(memory_id="m").max_tokens is None
+    assert InterviewQueryReq.model_json_schema()["properties"]["max_chars"]["deprecated"] is True
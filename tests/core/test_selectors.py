@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("numpy")
+
+from rag.core.selectors import cap_per_key, mmr, select, suppress_near_duplicates
+
+
+def _hit(content, url, score, vector):
+    return {"content": content, "url": url, "score": score, "vector": vector}
+
+
+def _hits():
+    return [
+        _hit("Redis 怎么做持久化？", "u1", 0.95, [1.0, 0.0, 0.0]),
+        _hit("Redis 持久化有 RDB 和 AOF", "u1", 0.94, [0.99, 0.05, 0.0]),  # 与上一条近重复
+        _hit("Kafka 分区怎么扩容", "u2", 0.80, [0.0, 1.0, 0.0]),
+        _hit("MySQL 索引下推", "u3", 0.70, [0.0, 0.0, 1.0]),
+    ]
+
+
+def test_near_duplicates_keep_highest_score():
+    out = suppress_near_duplicates(_hits(), threshold=0.95)
+    assert [h["content"] for h in out] == ["Redis 怎么做持久化？", "Kafka 分区怎么扩容", "MySQL 索引下推"]
+
+
+def test_near_duplicates_fall_back_to_text_without_vectors():
+    hits = [{"content": "a  b", "score": 1}, {"content": "A b", "score": 0.5}, {"content": "c", "score": 0.1}]
+    assert [h["content"] for h in suppress_near_duplicates(hits)] == ["a  b", "c"]
+
+
+def test_cap_per_key():
+    assert [h["url"] for h in cap_per_key(_hits(), 1)] == ["u1", "u2", "u3"]
+
+
+def test_mmr_prefers_diverse_candidates():
+    out = mmr(_hits(), 2, lambda_=0.5)
+    assert [h["url"] for h in out] == ["u1", "u2"]
+    # lambda = 1 退化为按得分
+    assert [h["score"] for h in mmr(_hits(), 2, lambda_=1.0)] == [0.95, 0.94]
+
+
+def test_select_strips_vectors():
+    out = select(_hits(), 3, lambda_=0.7, dup_threshold=0.95, max_per_key=2)
+    assert len(out) == 3 and all("vector" not in h for h in out)
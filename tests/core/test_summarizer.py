@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from rag.core.summarizer import MAP_INSTRUCTIONS, REDUCE_INSTRUCTIONS, MapReduceSummarizer
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, temperature=0.2, top_p=1.0, max_tokens=512, system=None):
+        with self._lock:
+            self.prompts.append(prompt)
+        return f"S{len(prompt)}"
+
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    def get_many(self, keys):
+        return {k: self.data[k] for k in keys if k in self.data}
+
+    def put(self, key, text):
+        self.data[key] = text
+
+
+def _maps(llm, language="zh"):
+    return [p for p in llm.prompts if p.startswith(MAP_INSTRUCTIONS[language])]
+
+
+def test_short_input_is_a_single_call():
+    llm = FakeLLM()
+    MapReduceSummarizer(llm, chunk_chars=1000).summarize("总结：", ["a", "b"])
+    assert len(llm.prompts) == 1 and llm.prompts[0].startswith("总结：")
+
+
+def test_split_packs_short_texts_and_cuts_long_ones():
+    s = MapReduceSummarizer(FakeLLM(), chunk_chars=100, overlap=10)
+    chunks = s.split(["x" * 30, "y" * 30, "z" * 250])
+    assert chunks[0].count("x") == 30 and "y" in chunks[0]
+    assert all(len(c) <= 100 for c in chunks)
+    assert sum(c.count("z") for c in chunks) >= 250
+
+
+def test_cached_chunks_are_not_summarized_again():
+    llm, cache = FakeLLM(), DictCache()
+    s = MapReduceSummarizer(llm, cache=cache, chunk_chars=100, overlap=0, max_workers=3)
+    texts = ["第%d轮：" % i + "内容" * 40 for i in range(4)]
+
+    s.summarize("总结：", texts)
+    first = len(_maps(llm))
+    assert first == 4 and len(cache.data) == 4
+
+    llm.prompts.clear()
+    s.summarize("总结：", texts + ["新一轮：" + "新" * 80])
+    assert len(_maps(llm)) == 1   # 只有新增的块调用 LLM
+
+
+def test_language_and_system_prompt_select_instructions_and_cache_keys():
+    llm, cache = FakeLLM(), DictCache()
+    s = MapReduceSummarizer(llm, cache=cache, chunk_chars=100, overlap=0)
+    texts = ["round %d: " % i + "content " * 10 for i in range(4)]
+
+    s.summarize("Summarize:", texts, system="sys-a", language="en")
+    assert len(_maps(llm, "en")) == 4 and not _maps(llm, "zh")
+
+    # 语言或 system prompt 不同都不复用缓存
+    llm.prompts.clear()
+    s.summarize("总结：", texts, system="sys-a", language="zh")
+    assert len(_maps(llm, "zh")) == 4
+    llm.prompts.clear()
+    s.summarize("Summarize:", texts, system="sys-b", language="en")
+    assert len(_maps(llm, "en")) == 4
+    llm.prompts.clear()
+    s.summarize("Summarize:", texts, system="sys-b", language="en")
+    assert _maps(llm, "en") == [] and len(cache.data) == 12
+
+
+def test_group_reduce_uses_language():
+    llm = FakeLLM()
+    s = MapReduceSummarizer(llm, chunk_chars=60, overlap=0)
+    s._map_reduce_groups(["a", "b"], 128, None, "en")
+    assert all(p.startswith(REDUCE_INSTRUCTIONS["en"]) for p in llm.prompts)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os, uuid, hashlib
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
+from rag.datasource.sqlstores.mem_primary_store import MemPrimaryStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def conn():
+    return SQLiteConnection(TEST_DB_PATH)
+
+
+def _create(store: MemContextsStore, memory_id: str, body: str):
+    url = f"app/{memory_id}/{uuid.uuid4().hex}.json"
+    return store.create(
+        uid=uuid.uuid4().hex[:16],
+        memory_id=memory_id,
+        app="test",
+        url=url,
+        content_sha256=hashlib.sha256(url.encode()).hexdigest(),
+        body=body,
+    )
+
+
+def test_small_body_inlined(conn):
+    store = MemContextsStore(conn, inline_max=1024)
+    memory_id = f"m-{uuid.uuid4()}"
+    row = _create(store, memory_id, "你好，RAG！" * 10)
+    assert "body_blob" not in row
+
+    rows = store.list_by_memory(memory_id, with_body=True)
+    assert rows[0]["body"] == "你好，RAG！" * 10
+
+
+def test_large_body_falls_back(conn):
+    store = MemContextsStore(conn, inline_max=16)
+    memory_id = f"m-{uuid.uuid4()}"
+    _create(store, memory_id, "x" * 100)
+
+    rows = store.list_by_memory(memory_id, with_body=True)
+    assert rows[0]["body"] is None
+
+
+def test_inline_disabled(conn):
+    store = MemContextsStore(conn, inline_max=0)
+    memory_id = f"m-{uuid.uuid4()}"
+    _create(store, memory_id, "short")
+    assert store.list_by_memory(memory_id, with_body=True)[0]["body"] is None
+
+
+def test_summary_inlined(conn):
+    store = MemPrimaryStore(conn, inline_max=1024)
+    memory_id = f"m-{uuid.uuid4()}"
+    store.upsert(memory_id)
+    store.update_summary(memory_id, f"app/{memory_id}/s.md", summary_text="摘要内容")
+
+    row = store.get(memory_id, with_summary=True)
+    assert row["summary_text"] == "摘要内容"
+    assert "summary_blob" not in store.get(memory_id)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os, uuid, hashlib
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
+from rag.datasource.sqlstores.mem_deleted_store import MemDeletedStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def conn():
+    return SQLiteConnection(TEST_DB_PATH)
+
+
+def _push(store: MemContextsStore, memory_id: str, url: str):
+    return store.create(
+        uid=uuid.uuid4().hex[:16],
+        memory_id=memory_id,
+        app="test",
+        url=url,
+        content_sha256=hashlib.sha256(f"{memory_id}:{url}".encode()).hexdigest(),
+    )
+
+
+def test_list_active_excludes_deleted(conn):
+    contexts, deleted = MemContextsStore(conn), MemDeletedStore(conn)
+    memory_id = f"m-{uuid.uuid4()}"
+    urls = [f"test/{memory_id}/{i}.json" for i in range(3)]
+    rows = [_push(contexts, memory_id, u) for u in urls]
+
+    deleted.mark_deleted(memory_id, urls[1])
+    contexts.mark_summarized(rows[0]["uid"])
+
+    active = [r["url"] for r in contexts.list_active_by_memory(memory_id)]
+    assert active == [urls[2], urls[0]]
+    oldest = [r["url"] for r in contexts.list_active_by_memory(memory_id, oldest_first=True)]
+    assert oldest == [urls[0], urls[2]]
+
+    window = [r["url"] for r in contexts.list_active_by_memory(memory_id, unsummarized_only=True)]
+    assert window == [urls[2]]
+
+
+def test_deletion_is_scoped_to_memory(conn):
+    contexts, deleted = MemContextsStore(conn), MemDeletedStore(conn)
+    m1, m2 = f"m-{uuid.uuid4()}", f"m-{uuid.uuid4()}"
+    url = f"shared/{uuid.uuid4().hex}.json"
+    _push(contexts, m1, url)
+    _push(contexts, m2, url)
+
+    deleted.mark_deleted(m1, url)
+    assert contexts.list_active_by_memory(m1) == []
+    assert [r["url"] for r in contexts.list_active_by_memory(m2)] == [url]
+    assert deleted.is_deleted(url, memory_id=m2) is False
+
+
+def test_mark_summarized_many(conn):
+    contexts = MemContextsStore(conn)
+    memory_id = f"m-{uuid.uuid4()}"
+    rows = [_push(contexts, memory_id, f"test/{memory_id}/{i}.json") for i in range(4)]
+
+    assert contexts.mark_summarized_many([r["uid"] for r in rows[:3]]) == 3
+    window = contexts.list_active_by_memory(memory_id, unsummarized_only=True)
+    assert [r["uid"] for r in window] == [rows[3]["uid"]]
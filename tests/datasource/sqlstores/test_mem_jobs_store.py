@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os, time, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_jobs_store import MemJobsStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return MemJobsStore(SQLiteConnection(TEST_DB_PATH))
+
+
+def _kind():
+    # 每个用例独立的 kind，避免与库中遗留任务互相领取
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+
+def test_enqueue_dedupe(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    j1 = store.enqueue(kind, memory_id, dedupe_key=f"{kind}:{memory_id}")
+    j2 = store.enqueue(kind, memory_id, dedupe_key=f"{kind}:{memory_id}")
+    assert j1["job_id"] == j2["job_id"]
+    assert j1["status"] == "queued"
+    assert len(store.list_by_memory(memory_id)) == 1
+
+
+def test_claim_and_complete(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id, app="test", payload={"a": 1})
+
+    claimed = store.claim("w1", [kind])
+    assert claimed["job_id"] == job["job_id"]
+    assert claimed["status"] == "running" and claimed["attempts"] == 1
+    assert claimed["payload"] == {"a": 1}
+    assert store.claim("w2", [kind]) is None
+
+    store.complete(job["job_id"], {"summary_url": "x.md"})
+    done = store.get(job["job_id"])
+    assert done["status"] == "done"
+    assert done["result"] == {"summary_url": "x.md"}
+
+
+def test_running_job_does_not_block_new_enqueue(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    key = f"{kind}:{memory_id}"
+    j1 = store.enqueue(kind, memory_id, dedupe_key=key)
+    store.claim("w1", [kind])
+    j2 = store.enqueue(kind, memory_id, dedupe_key=key)
+    assert j2["job_id"] != j1["job_id"]
+
+
+def test_fail_retries_then_gives_up(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id, max_attempts=2)
+
+    store.claim("w1", [kind])
+    assert store.fail(job["job_id"], "boom", retry_delay_s=0) == "queued"
+
+    store.claim("w1", [kind])
+    assert store.fail(job["job_id"], "boom again", retry_delay_s=0) == "dead"
+    row = store.get(job["job_id"])
+    assert row["status"] == "dead" and row["error"] == "boom again"
+    assert job["job_id"] in [r["job_id"] for r in store.list_by_status("dead", kind=kind)]
+
+    # 死信重放
+    assert store.requeue(job["job_id"])
+    assert store.claim("w1", [kind])["attempts"] == 1
+
+
+def test_expired_lease_is_reclaimed(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id)
+    store.claim("w1", [kind], lease_s=0.01)
+    time.sleep(0.05)
+
+    reclaimed = store.claim("w2", [kind])
+    assert reclaimed["job_id"] == job["job_id"]
+    assert reclaimed["locked_by"] == "w2" and reclaimed["attempts"] == 2
+    assert not store.heartbeat(job["job_id"], "w1")
+
+
+def test_idempotency_key_dedupes_only_unfinished_jobs(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    key = f"{kind}:{memory_id}:url"
+    job = store.enqueue(kind, memory_id, idempotency_key=key, checkpoint={"stages": ["primary"]})
+
+    # 排队 / 执行中：客户端重试返回同一个任务
+    assert store.enqueue(kind, memory_id, idempotency_key=key)["job_id"] == job["job_id"]
+    store.claim("w1", [kind])
+    again = store.enqueue(kind, memory_id, idempotency_key=key)
+    assert again["job_id"] == job["job_id"] and again["checkpoint"] == {"stages": ["primary"]}
+
+    # 已完成：同一条消息删除后重新 push / 补偿写入会新建任务
+    store.complete(job["job_id"], {})
+    fresh = store.enqueue(kind, memory_id, idempotency_key=key)
+    assert fresh["job_id"] != job["job_id"] and fresh["status"] == "queued"
+    assert store.get(job["job_id"])["status"] == "done"
+
+    # 死信重放时已有同 key 的任务在排队：不重复排队
+    store.claim("w1", [kind])
+    store.fail(fresh["job_id"], "boom", permanent=True)
+    newest = store.enqueue(kind, memory_id, idempotency_key=key)
+    assert not store.requeue(fresh["job_id"])
+    assert store.enqueue(kind, memory_id, idempotency_key=key)["job_id"] == newest["job_id"]
+
+
+def test_checkpoint_and_complete_are_fenced(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id)
+    store.claim("w1", [kind], lease_s=0.01)
+    time.sleep(0.05)
+    store.claim("w2", [kind])  # w1 租约过期被接管
+
+    assert not store.save_checkpoint(job["job_id"], "w1", {"stages": ["x"]})
+    assert store.save_checkpoint(job["job_id"], "w2", {"stages": ["y"]}, lease_s=60)
+    assert not store.complete(job["job_id"], {}, worker_id="w1")
+    assert store.complete(job["job_id"], {}, worker_id="w2")
+    assert store.get(job["job_id"])["checkpoint"] == {"stages": ["y"]}
+
+
+def test_fail_is_fenced(store):
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id, max_attempts=3)
+    store.claim("w1", [kind], lease_s=0.01)
+    time.sleep(0.05)
+    store.claim("w2", [kind], lease_s=60)  # w1 租约过期被接管
+
+    assert store.fail(job["job_id"], "stale", retry_delay_s=0, worker_id="w1") == "lost"
+    row = store.get(job["job_id"])
+    assert row["status"] == "running" and row["locked_by"] == "w2" and row["error"] is None
+    assert store.fail(job["job_id"], "boom", retry_delay_s=0, worker_id="w2") == "queued"
+
+
+def test_expired_lease_with_exhausted_attempts_goes_dead(store):
+    # 每次都让 worker 崩溃（租约过期、从不 fail）的毒任务
+    kind, memory_id = _kind(), f"m-{uuid.uuid4()}"
+    job = store.enqueue(kind, memory_id, max_attempts=2)
+    for _ in range(2):
+        assert store.claim("w1", [kind], lease_s=0.01)["job_id"] == job["job_id"]
+        time.sleep(0.03)
+
+    assert store.claim("w1", [kind]) is None
+    row = store.get(job["job_id"])
+    assert row["status"] == "dead" and row["attempts"] == 2
+    assert "租约过期" in row["error"]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os, time, uuid
+import threading
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_leases_store import MemLeasesStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return MemLeasesStore(SQLiteConnection(TEST_DB_PATH))
+
+
+def test_acquire_is_exclusive(store):
+    name = f"summarize:m-{uuid.uuid4()}"
+    assert store.acquire(name, "a")
+    assert not store.acquire(name, "b")
+    assert store.acquire(name, "a")  # 持有者可重入续期
+    assert store.get(name)["owner"] == "a"
+
+
+def test_release_only_by_owner(store):
+    name = f"summarize:m-{uuid.uuid4()}"
+    store.acquire(name, "a")
+    assert not store.release(name, "b")
+    assert store.release(name, "a")
+    assert store.acquire(name, "b")
+
+
+def test_expired_lease_can_be_taken(store):
+    name = f"summarize:m-{uuid.uuid4()}"
+    store.acquire(name, "a", ttl_s=0.01)
+    time.sleep(0.05)
+    assert store.acquire(name, "b")
+    assert not store.renew(name, "a")
+
+
+def test_concurrent_acquire_single_winner(store):
+    name = f"summarize:m-{uuid.uuid4()}"
+    wins = []
+
+    def worker(i):
+        if store.acquire(name, f"w{i}"):
+            wins.append(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(wins) == 1
@@ -41,3 +41,40 @@ def test_mem_primary_lifecycle(store: MemPrimaryStore):
     store.advance_index(memory_id, 3)
     row4 = store.get(memory_id)
     assert row4["last_summary_index"] == 3
+
+def test_bump_total_returns_progress(store: MemPrimaryStore):
+    memory_id = f"m-{uuid.uuid4()}"
+    store.upsert(memory_id)
+
+    row = store.bump_total(memory_id, 2)
+    assert row["total_qa_count"] == 2
+    assert row["recent_qa_count"] == 2
+    assert store.bump_total(f"m-{uuid.uuid4()}") is None
+
+def test_update_summary_keeps_messages_pushed_meanwhile(store: MemPrimaryStore):
+    memory_id = f"m-{uuid.uuid4()}"
+    store.upsert(memory_id)
+    store.bump_total(memory_id, 5)
+
+    # 摘要了 5 条，期间又 push 了 2 条
+    store.bump_total(memory_id, 2)
+    store.update_summary(memory_id, f"s3://bucket/{memory_id}/s.md", consumed=5)
+    assert store.get(memory_id)["recent_qa_count"] == 2
+
+def test_vector_version_only_moves_with_vector_writes(store: MemPrimaryStore):
+    memory_id = f"m-{uuid.uuid4()}"
+    store.upsert(memory_id)
+    assert store.get_vector_version(memory_id) == 0
+
+    # 登记 / 摘要 / 删除标记都不改变辅助记忆版本（向量尚未写入 Weaviate）
+    assert store.bump_total(memory_id, 1)["vector_version"] == 0
+    store.update_summary(memory_id, f"s3://bucket/{memory_id}/s.md", consumed=1)
+    store.bump_context_version(memory_id)
+    assert store.get_vector_version(memory_id) == 0
+    assert store.get_context_version(memory_id) == 3
+
+    # 向量写入 / 删除落库后由调用方显式递增
+    assert store.bump_vector_version(memory_id) == 1
+    assert store.get_vector_version(memory_id) == 1
+    assert store.bump_vector_version(f"m-{uuid.uuid4()}") is None
+    assert store.get_vector_version(f"m-{uuid.uuid4()}") is None
@@ -25,3 +25,28 @@ def test_mem_registry_upsert_and_get(store: MemRegistryStore):
 def test_mem_registry_list(store: MemRegistryStore):
     rows = store.list_by_app("grader")
     assert isinstance(rows, list)
+
+def test_mem_registry_params_typed_and_cached(store: MemRegistryStore):
+    mid = f"m-{uuid.uuid4()}"
+    store.upsert(mid, "interviewer", params={"summary_every_n": "3", "aux_score_threshold": 0.5, "foo": 1})
+
+    params = store.get_params(mid)
+    assert params.summary_every_n == 3
+    assert params.aux_score_threshold == 0.5
+    assert params.aux_top_k == 5  # 默认值
+    assert params.get("foo") == 1
+    assert store.get_params(mid) is params  # 命中缓存
+
+    store.update_params(mid, {"summary_every_n": 7})
+    assert store.get_params(mid).summary_every_n == 7
+    assert store.get_params(f"m-{uuid.uuid4()}") is None
+
+def test_mem_registry_params_version_coherence(store: MemRegistryStore):
+    # 模拟另一个 worker：独立的 store 实例（独立缓存），每次都校验版本号
+    other = MemRegistryStore(store.conn, revalidate_s=0)
+    mid = f"m-{uuid.uuid4()}"
+    store.upsert(mid, "interviewer", params={"aux_top_k": 2})
+    assert other.get_params(mid).aux_top_k == 2
+
+    store.update_params(mid, {"aux_top_k": 9})
+    assert other.get_params(mid).aux_top_k == 9
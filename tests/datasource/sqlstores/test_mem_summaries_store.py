@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_summaries_store import MemSummariesStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return MemSummariesStore(SQLiteConnection(TEST_DB_PATH), inline_max=1024)
+
+
+def _leaf(store, memory_id, i, n=5):
+    return store.create(
+        memory_id,
+        f"app/{memory_id}/leaf-{i}.md",
+        level=0,
+        start_index=i * n,
+        end_index=(i + 1) * n,
+        summary_text=f"窗口 {i}",
+    )
+
+
+def test_list_active_newest_first_with_text(store):
+    memory_id = f"m-{uuid.uuid4()}"
+    for i in range(3):
+        _leaf(store, memory_id, i)
+
+    rows = store.list_active(memory_id, with_text=True)
+    assert [r["summary_text"] for r in rows] == ["窗口 2", "窗口 1", "窗口 0"]
+    assert len(store.list_active(memory_id, limit=2)) == 2
+    assert "summary_blob" not in rows[0]
+
+
+def test_rollup_hides_children(store):
+    memory_id = f"m-{uuid.uuid4()}"
+    leaves = [_leaf(store, memory_id, i) for i in range(4)]
+    assert [r["summary_id"] for r in store.list_unrolled(memory_id, 0)] == [r["summary_id"] for r in leaves]
+
+    parent = store.create(memory_id, f"app/{memory_id}/l1.md", level=1, start_index=0, end_index=20)
+    assert store.mark_rolled_up([r["summary_id"] for r in leaves[:3]], parent["summary_id"]) == 3
+
+    active = store.list_active(memory_id)
+    assert [(r["level"], r["end_index"]) for r in active] == [(0, 20), (1, 20)]
+    assert store.list_unrolled(memory_id, 0)[0]["summary_id"] == leaves[3]["summary_id"]
+    assert store.count_by_memory(memory_id) == 5
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_summary_chunks_store import MemSummaryChunksStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return MemSummaryChunksStore(SQLiteConnection(TEST_DB_PATH))
+
+
+def test_put_and_get_many(store):
+    a, b = uuid.uuid4().hex, uuid.uuid4().hex
+    store.put(a, "要点 A")
+    store.put(a, "覆盖无效")
+    assert store.get_many([a, b, a]) == {a: "要点 A"}
+    assert store.get_many([]) == {}
+
+
+def test_delete_older_than(store):
+    old, new = uuid.uuid4().hex, uuid.uuid4().hex
+    store.put(old, "旧")
+    store.put(new, "新")
+    store.conn.execute(
+        "UPDATE mem_summary_chunks SET created_at = datetime('now', '-40 days') WHERE chunk_hash = ?", (old,)
+    )
+    assert store.delete_older_than(30) >= 1
+    assert store.get_many([old, new]) == {new: "新"}
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.resume_states_store import ResumeStatesStore
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return ResumeStatesStore(SQLiteConnection(TEST_DB_PATH))
+
+
+def test_upsert_get_delete(store):
+    url = f"resume/{uuid.uuid4().hex}.json"
+    assert store.get(url) is None
+
+    store.upsert(url, "e1", {"position": "后端", "skills": ["Go"]})
+    row = store.get(url)
+    assert row["etag"] == "e1"
+    assert row["state"] == {"position": "后端", "skills": ["Go"]}
+    assert row["embedding"] is None
+
+    store.upsert(url, "e2", {"position": "算法"}, [0.1, 0.2], "m")
+    row = store.get(url)
+    assert (row["etag"], row["state"], row["embedding"], row["embed_model"]) == ("e2", {"position": "算法"}, [0.1, 0.2], "m")
+
+    assert store.delete(url) is True
+    assert store.get(url) is None
+    assert store.delete(url) is False
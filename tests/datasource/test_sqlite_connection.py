@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os, sqlite3, threading, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection, PragmaProfile
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+@pytest.fixture(scope="module")
+def conn():
+    c = SQLiteConnection(TEST_DB_PATH, pragmas=PragmaProfile(cache_size=-2048, busy_timeout=1234))
+    yield c
+    c.close()
+
+
+def test_pragma_profile_applied(conn: SQLiteConnection):
+    assert conn.query_one("PRAGMA busy_timeout")["timeout"] == 1234
+    assert conn.query_one("PRAGMA cache_size")["cache_size"] == -2048
+    assert conn.query_one("PRAGMA journal_mode")["journal_mode"] == "wal"
+
+
+def test_readers_see_committed_writes_across_threads(conn: SQLiteConnection):
+    memory_id = f"m-{uuid.uuid4()}"
+    conn.execute("INSERT INTO mem_primary(memory_id) VALUES (?)", (memory_id,))
+
+    found = []
+
+    def read():
+        found.append(conn.query_one("SELECT memory_id FROM mem_primary WHERE memory_id = ?", (memory_id,)))
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(r and r["memory_id"] == memory_id for r in found)
+
+
+def test_reader_connection_is_read_only(conn: SQLiteConnection):
+    with pytest.raises(sqlite3.OperationalError):
+        conn.query_all("DELETE FROM mem_primary WHERE memory_id = 'nope'")
+
+
+def test_transaction_commits_once_and_reads_own_writes(conn: SQLiteConnection):
+    memory_id = f"m-{uuid.uuid4()}"
+    with conn.transaction():
+        conn.execute("INSERT INTO mem_primary(memory_id) VALUES (?)", (memory_id,))
+        rows = conn.execute_returning(
+            "UPDATE mem_primary SET total_qa_count = total_qa_count + 2 WHERE memory_id = ? RETURNING total_qa_count",
+            (memory_id,),
+        )
+        assert rows == [{"total_qa_count": 2}]
+        assert conn.query_one("SELECT 1 AS ok FROM mem_primary WHERE memory_id = ?", (memory_id,)) == {"ok": 1}
+    assert conn.query_one("SELECT total_qa_count FROM mem_primary WHERE memory_id = ?", (memory_id,))["total_qa_count"] == 2
+
+
+def test_transaction_rolls_back_on_error(conn: SQLiteConnection):
+    memory_id = f"m-{uuid.uuid4()}"
+    with pytest.raises(RuntimeError):
+        with conn.transaction():
+            conn.execute("INSERT INTO mem_primary(memory_id) VALUES (?)", (memory_id,))
+            with conn.transaction():  # 嵌套并入外层事务
+                conn.execute("UPDATE mem_primary SET total_qa_count = 1 WHERE memory_id = ?", (memory_id,))
+            raise RuntimeError("boom")
+    assert conn.in_transaction is False
+    assert conn.query_one("SELECT 1 FROM mem_primary WHERE memory_id = ?", (memory_id,)) is None
+
+
+def test_executemany(conn: SQLiteConnection):
+    ids = [f"m-{uuid.uuid4()}" for _ in range(3)]
+    assert conn.executemany("INSERT INTO mem_primary(memory_id) VALUES (?)", [(i,) for i in ids]) == 3
+    rows = conn.query_all(
+        "SELECT memory_id FROM mem_primary WHERE memory_id IN (?, ?, ?)", ids
+    )
+    assert {r["memory_id"] for r in rows} == set(ids)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from rag.core.pipeline import RAGPipeline
+from rag.memory.answer_cache import AnswerCache, answer_params_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(**kw):
+    kw.setdefault("clock", Clock())
+    return AnswerCache(enabled=True, threshold=0.9, ttl_s=60, **kw)
+
+
+def test_hit_on_similar_vector_same_version():
+    cache = _cache()
+    cache.put("m1", 3, "k", [1.0, 0.0], "Redis 怎么持久化", "RDB 和 AOF")
+    hit = cache.get("m1", 3, "k", [0.99, 0.05])
+    assert hit["answer"] == "RDB 和 AOF" and hit["query"] == "Redis 怎么持久化"
+    assert hit["similarity"] >= 0.9
+    assert cache.get("m1", 3, "k", [0.0, 1.0]) is None      # 不相似
+    assert cache.get("m1", 3, "other", [1.0, 0.0]) is None  # 参数不同
+    assert cache.get("m2", 3, "k", [1.0, 0.0]) is None      # 其它 memory
+
+
+def test_version_change_and_invalidate_drop_entries():
+    cache = _cache()
+    cache.put("m1", 3, "k", [1.0, 0.0], "q", "a")
+    assert cache.get("m1", 4, "k", [1.0, 0.0]) is None
+    assert cache.get("m1", 3, "k", [1.0, 0.0]) is None      # 旧版本条目已作废
+
+    cache.put("m1", 4, "k", [1.0, 0.0], "q", "a")
+    cache.invalidate("m1")
+    assert cache.get("m1", 4, "k", [1.0, 0.0]) is None
+
+
+def test_ttl_and_size_limits():
+    clock = Clock()
+    cache = _cache(clock=clock, max_per_memory=2, max_memories=1)
+    cache.put("m1", 1, "k", [1.0, 0.0], "q1", "a1")
+    clock.now = 61
+    assert cache.get("m1", 1, "k", [1.0, 0.0]) is None
+
+    for i, vec in enumerate(([1.0, 0.0], [0.0, 1.0], [0.7, 0.7])):
+        cache.put("m1", 1, "k", vec, f"q{i}", f"a{i}")
+    assert cache.get("m1", 1, "k", [1.0, 0.0]) is None      # 最旧的被淘汰
+    assert cache.get("m1", 1, "k", [0.0, 1.0])["answer"] == "a1"
+
+    cache.put("m2", 1, "k", [1.0, 0.0], "q", "a")
+    assert cache.get("m1", 1, "k", [0.0, 1.0]) is None      # memory 级 LRU
+
+
+def test_disabled_cache_is_noop():
+    cache = AnswerCache(enabled=False)
+    cache.put("m1", 1, "k", [1.0], "q", "a")
+    assert cache.get("m1", 1, "k", [1.0]) is None
+
+
+def test_pipeline_reuses_answer_until_version_changes():
+    version = {"v": 1}
+    calls = {"llm": 0, "context": 0, "embed": 0}
+
+    def get_context(**kw):
+        calls["context"] += 1
+        assert kw["query_vector"] is not None   # 缓存查询的向量复用于辅助检索
+        return {"summary_urls": [], "recent_urls": [], "texts": {}, "retrieved": []}
+
+    def embed_query(memory_id, query):
+        calls["embed"] += 1
+        return [1.0, 0.0] if "Redis" in query else [0.0, 1.0]
+
+    def complete(prompt, **kw):
+        calls["llm"] += 1
+        return f"answer-{calls['llm']}"
+
+    memory = SimpleNamespace(answers=_cache(), embed_query=embed_query, get_context=get_context)
+    ds = SimpleNamespace(mem_primary=SimpleNamespace(get_context_version=lambda mid: version["v"]))
+    pipeline = RAGPipeline(ds, memory, SimpleNamespace(complete=complete))
+
+    first = pipeline.run("m1", "app", "Redis 持久化?")
+    again = pipeline.run("m1", "app", "Redis 如何持久化")
+    assert first["context_used"]["answer_cache"] == {"hit": False}
+    assert again["answer"] == "answer-1" and again["context_used"]["answer_cache"]["hit"] is True
+    assert calls == {"llm": 1, "context": 1, "embed": 2}
+
+    version["v"] = 2   # push / 摘要提升版本
+    assert pipeline.run("m1", "app", "Redis 如何持久化")["answer"] == "answer-2"
+    assert pipeline.run("m1", "app", "MySQL 索引")["answer"] == "answer-3"
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from rag.datasource.sqlstores.mem_registry_store import MemoryParams
+from rag.memory.auxiliary_memory import AuxiliaryMemory
+
+
+class ModelEmbedder:
+    """向量第一维记录模型名，便于断言 query 由哪个模型向量化"""
+
+    models = {"default": 0.0, "m1": 1.0, "m2": 2.0}
+
+    def __init__(self, model):
+        self.model = model
+        self.closed = False
+
+    def embed_query(self, text):
+        time.sleep(0.001)   # 放大交错窗口
+        return [self.models[self.model], float(len(text))]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def close(self):
+        self.closed = True
+
+
+class Registry:
+    def __init__(self, models):
+        self.models = models
+
+    def get_params(self, memory_id):
+        return MemoryParams(embedding_model=self.models.get(memory_id))
+
+
+def test_embed_query_uses_one_embedder_per_model_concurrently():
+    created = []
+    lock = threading.Lock()
+
+    def factory(model):
+        with lock:
+            created.append(model)
+        return ModelEmbedder(model)
+
+    shared = ModelEmbedder("default")
+    ds = SimpleNamespace(weaviate=object(), mem_registry=Registry({"a": "m1", "b": "m2", "c": "default"}))
+    aux = AuxiliaryMemory(ds, embedder=shared, embedder_factory=factory)
+
+    jobs = [memory_id for _ in range(50) for memory_id in ("a", "b", "c", "d")]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(lambda m: aux.embed_query(m, "q"), jobs))
+
+    # 每个 query 都用自己 memory 的模型；共享实例不被修改，每个模型只创建一次
+    expected = {"a": 1.0, "b": 2.0, "c": 0.0, "d": 0.0}
+    assert [v[0] for v in vectors] == [expected[m] for m in jobs]
+    assert shared.model == "default"
+    assert sorted(created) == ["m1", "m2"]
+    assert aux.embedding_model("a") == "m1" and aux.embedding_model("d") == "default"
+
+    per_model = list(aux._embedders.values())
+    aux.close()
+    assert all(e.closed for e in per_model) and aux._embedders == {}
+    assert shared.closed is False
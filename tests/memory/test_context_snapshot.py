@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os, uuid
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_context_snapshots_store import MemContextSnapshotsStore
+from rag.memory.context_snapshot import ContextSnapshotCache, snapshot_shape
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+SHAPE = snapshot_shape(None, 2)
+
+
+@pytest.fixture(scope="module")
+def shared():
+    return MemContextSnapshotsStore(SQLiteConnection(TEST_DB_PATH))
+
+
+def _snap():
+    return {
+        "summary_urls": ["s.md"],
+        "recent_urls": ["b", "a"],
+        "texts": {"s.md": "摘要", "b": "B", "a": "A"},
+    }
+
+
+def test_version_mismatch_misses():
+    cache = ContextSnapshotCache(max_entries=8)
+    memory_id = f"m-{uuid.uuid4()}"
+    cache.put(memory_id, SHAPE, 3, _snap())
+    assert cache.get(memory_id, SHAPE, 3)["recent_urls"] == ["b", "a"]
+    assert cache.get(memory_id, SHAPE, 4) is None
+
+
+def test_on_push_prepends_and_trims():
+    cache = ContextSnapshotCache(max_entries=8)
+    memory_id = f"m-{uuid.uuid4()}"
+    cache.put(memory_id, SHAPE, 3, _snap())
+
+    cache.on_push(memory_id, "c", "C", version=4)
+    snap = cache.get(memory_id, SHAPE, 4)
+    assert snap["recent_urls"] == ["c", "b"]
+    assert snap["texts"] == {"s.md": "摘要", "c": "C", "b": "B"}
+
+
+def test_on_push_with_gap_drops_snapshot():
+    cache = ContextSnapshotCache(max_entries=8)
+    memory_id = f"m-{uuid.uuid4()}"
+    cache.put(memory_id, SHAPE, 3, _snap())
+    cache.on_push(memory_id, "c", "C", version=5)  # 中间漏了一次变更
+    assert cache.get(memory_id, SHAPE, 5) is None
+
+
+def test_returned_snapshot_is_a_copy():
+    cache = ContextSnapshotCache(max_entries=8)
+    memory_id = f"m-{uuid.uuid4()}"
+    cache.put(memory_id, SHAPE, 1, _snap())
+    cache.get(memory_id, SHAPE, 1)["texts"].clear()
+    assert cache.get(memory_id, SHAPE, 1)["texts"]["a"] == "A"
+
+
+def test_lru_bound():
+    cache = ContextSnapshotCache(max_entries=2)
+    ids = [f"m-{uuid.uuid4()}" for _ in range(3)]
+    for mid in ids:
+        cache.put(mid, SHAPE, 1, _snap())
+    assert cache.get(ids[0], SHAPE, 1) is None
+    assert cache.get(ids[2], SHAPE, 1) is not None
+
+
+def test_shared_layer_serves_other_process(shared):
+    memory_id = f"m-{uuid.uuid4()}"
+    ContextSnapshotCache(shared=shared, max_entries=8).put(memory_id, SHAPE, 7, _snap())
+
+    other = ContextSnapshotCache(shared=shared, max_entries=8)
+    assert other.get(memory_id, SHAPE, 7)["texts"]["b"] == "B"
+
+    other.invalidate(memory_id)
+    assert shared.get(memory_id, SHAPE) is None
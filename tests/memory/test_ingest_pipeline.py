@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_context_snapshots_store import MemContextSnapshotsStore
+from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
+from rag.datasource.sqlstores.mem_deleted_store import MemDeletedStore
+from rag.datasource.sqlstores.mem_jobs_store import MemJobsStore
+from rag.datasource.sqlstores.mem_leases_store import MemLeasesStore
+from rag.datasource.sqlstores.mem_primary_store import MemPrimaryStore
+from rag.datasource.sqlstores.mem_registry_store import MemRegistryStore
+from rag.datasource.sqlstores.mem_summaries_store import MemSummariesStore
+from rag.memory.memory_manager import JOB_INGEST, MemoryManager
+from rag.workers.ingest_worker import build_worker
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+class FakeMinio:
+    def __init__(self):
+        self.objects = {}
+
+    def get_text(self, key):
+        if key not in self.objects:
+            err = RuntimeError(f"NoSuchKey: {key}")
+            err.code = "NoSuchKey"
+            raise err
+        return self.objects[key]
+
+
+class FakeEmbedder:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+class FakeWeaviate:
+    def __init__(self):
+        self.objects = []
+        self.fail_adds = 0
+
+    def add_texts(self, texts, vectors, metadatas, memory_id, app, collection=None):
+        if self.fail_adds:
+            self.fail_adds -= 1
+            raise RuntimeError("weaviate unavailable")
+        ids = []
+        for t, m in zip(texts, metadatas):
+            oid = str(uuid.uuid4())
+            self.objects.append({"id": oid, "text": t, "memory_id": memory_id, "app": app, "url": m["url"]})
+            ids.append(oid)
+        return ids
+
+    def delete_by_filter(self, collection, filters):
+        keep = [o for o in self.objects if any(o.get(k) != v for k, v in filters.items())]
+        deleted = len(self.objects) - len(keep)
+        self.objects = keep
+        return deleted
+
+    def count(self, memory_id, url):
+        return sum(1 for o in self.objects if o["memory_id"] == memory_id and o["url"] == url)
+
+
+@pytest.fixture(scope="module")
+def conn():
+    return SQLiteConnection(TEST_DB_PATH)
+
+
+@pytest.fixture()
+def memory(conn):
+    # 测试库共享：清掉此前用例遗留的待处理 ingest 任务，保证 run_once 领到的是本用例的任务
+    conn.execute("DELETE FROM mem_jobs WHERE kind = ? AND status IN ('queued', 'running')", (JOB_INGEST,))
+    ds = SimpleNamespace(
+        sqlite_conn=conn,
+        mem_contexts=MemContextsStore(conn),
+        mem_primary=MemPrimaryStore(conn),
+        mem_registry=MemRegistryStore(conn),
+        mem_deleted=MemDeletedStore(conn),
+        mem_jobs=MemJobsStore(conn),
+        mem_leases=MemLeasesStore(conn),
+        mem_summaries=MemSummariesStore(conn),
+        mem_snapshots=MemContextSnapshotsStore(conn),
+        minio=FakeMinio(),
+        weaviate=FakeWeaviate(),
+    )
+    return MemoryManager(ds, embedder=FakeEmbedder(), summary_mode="queue")
+
+
+def _put(memory, text="Q"):
+    url = f"qa/{uuid.uuid4().hex}.json"
+    memory.ds.minio.objects[url] = json.dumps(
+        [{"role": "user", "content": text}, {"role": "assistant", "content": text + "!"}]
+    )
+    return url
+
+
+def _worker(memory):
+    w = build_worker(memory)
+    w.retry_delay_s = 0
+    return w
+
+
+def test_queued_ingest_runs_all_stages(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+
+    job = memory.enqueue_ingest(memory_id, "test", url, "d")
+    assert _worker(memory).run_once() is True
+
+    done = memory.get_job(job["job_id"])
+    assert done["status"] == "done"
+    assert done["checkpoint"]["stages"] == ["primary", "summary", "auxiliary"]
+    assert done["result"]["vector_count"] == 2
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 1
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+
+def test_enqueue_ingest_is_idempotent(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+    a = memory.enqueue_ingest(memory_id, "test", url)
+    b = memory.enqueue_ingest(memory_id, "test", url)
+    assert a["job_id"] == b["job_id"]
+
+
+def test_repush_after_delete_creates_new_job(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+    first = memory.enqueue_ingest(memory_id, "test", url)
+    _worker(memory).run_once()
+    assert memory.get_job(first["job_id"])["status"] == "done"
+
+    memory.delete_message(memory_id, "test", url)
+    assert memory.ds.weaviate.count(memory_id, url) == 0
+
+    # 幂等键只约束未结束的任务：删除后重新 push 会重新写入
+    second = memory.enqueue_ingest(memory_id, "test", url)
+    assert second["job_id"] != first["job_id"]
+    _worker(memory).run_once()
+    assert memory.get_job(second["job_id"])["status"] == "done"
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+
+def test_replay_after_auxiliary_failure_does_not_double_count(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+    memory.ds.weaviate.fail_adds = 1
+
+    job = memory.enqueue_ingest(memory_id, "test", url)
+    worker = _worker(memory)
+    worker.run_once()
+
+    failed = memory.get_job(job["job_id"])
+    assert failed["status"] == "queued"
+    assert failed["checkpoint"]["stages"] == ["primary", "summary"]
+
+    worker.run_once()
+    assert memory.get_job(job["job_id"])["status"] == "done"
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 1
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+
+def test_vector_version_moves_only_after_weaviate_writes(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+    versions = memory.ds.mem_primary.get_vector_version
+    memory.ds.weaviate.fail_adds = 1
+
+    # 主记忆已提交、向量尚未写入：版本不动，其他进程此时加载的小索引在写入后会失效
+    memory.push_message(memory_id, "test", url)
+    assert versions(memory_id) == 0
+
+    # 补偿任务先删后写，两次 Weaviate 操作各递增一次
+    _worker(memory).run_once()
+    assert versions(memory_id) == 2
+
+    memory.delete_message(memory_id, "test", url)
+    assert versions(memory_id) == 3
+    memory.clear_memory(memory_id, "test")
+    assert versions(memory_id) == 4
+
+
+def test_missing_object_goes_to_dead_letter_and_requeues(memory):
+    memory_id = memory.create_memory("test")
+    url = f"qa/{uuid.uuid4().hex}.json"  # 未写入 MinIO
+
+    job = memory.enqueue_ingest(memory_id, "test", url)
+    _worker(memory).run_once()
+    dead = memory.get_job(job["job_id"])
+    assert dead["status"] == "dead" and dead["attempts"] == 1
+    assert any(j["job_id"] == job["job_id"] for j in memory.list_jobs_by_status("dead", kind=JOB_INGEST))
+
+    memory.ds.minio.objects[url] = json.dumps([{"role": "user", "content": "late"}])
+    assert memory.requeue_job(job["job_id"]) is True
+    _worker(memory).run_once()
+    assert memory.get_job(job["job_id"])["status"] == "done"
+
+
+def test_push_message_compensates_partial_failure(memory):
+    memory_id = memory.create_memory("test")
+    url = _put(memory)
+    memory.ds.weaviate.fail_adds = 1
+
+    row = memory.push_message(memory_id, "test", url)
+    assert row["ingest_job_id"]
+    assert memory.ds.weaviate.count(memory_id, url) == 0
+
+    _worker(memory).run_once()
+    assert memory.get_job(row["ingest_job_id"])["status"] == "done"
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 1
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+
+def test_concurrent_workers_process_each_job_once(memory):
+    memory_id = memory.create_memory("test")
+    urls = [_put(memory, f"q{i}") for i in range(8)]
+    jobs = [memory.enqueue_ingest(memory_id, "test", u) for u in urls]
+
+    worker = _worker(memory)
+    worker.concurrency = 4
+    worker.poll_interval = 0.05
+    worker.start()
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if all(memory.get_job(j["job_id"])["status"] == "done" for j in jobs):
+                break
+            time.sleep(0.05)
+    finally:
+        worker.stop()
+
+    assert all(memory.get_job(j["job_id"])["status"] == "done" for j in jobs)
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 8
+    assert all(memory.ds.weaviate.count(memory_id, u) == 2 for u in urls)
+
+
+def test_long_handler_keeps_lease_alive(memory):
+    from rag.workers.ingest_worker import IngestWorker
+
+    jobs, kind = memory.ds.mem_jobs, f"slow-{uuid.uuid4().hex[:8]}"
+    worker = IngestWorker(jobs, lease_s=0.3, heartbeat_s=0.05, retry_delay_s=0)
+    stolen = []
+
+    def _slow(job, ctx):
+        # 处理时长是租约的数倍：期间其它 worker 不应领到该任务
+        for _ in range(8):
+            time.sleep(0.1)
+            stolen.append(jobs.claim("w-other", [kind], lease_s=0.3))
+        return {"lost": ctx.lease_lost.is_set()}
+
+    worker.register(kind, _slow)
+    job = jobs.enqueue(kind, f"m-{uuid.uuid4()}", app="test")
+    assert worker.run_once("w-main")
+
+    assert stolen == [None] * 8
+    done = jobs.get(job["job_id"])
+    assert done["status"] == "done" and done["attempts"] == 1
+    assert done["result"] == {"lost": False}
+
+
+def test_push_messages_skips_duplicate_urls(memory):
+    memory_id = memory.create_memory("test")
+    a, b = _put(memory, "A"), _put(memory, "B")
+    embedded = []
+    embed = memory.auxiliary.embedder.embed_documents
+    memory.auxiliary.embedder.embed_documents = lambda texts: embedded.append(list(texts)) or embed(texts)
+
+    # 批内重复：只登记、计数、向量化一次
+    out = memory.push_messages(memory_id, "test", [{"url": a}, {"url": b}, {"url": a}])
+    assert [r["url"] for r in out["rows"]] == [a, b] and out["inserted"] == 2
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 2
+    assert embedded == [["A", "A!", "B", "B!"]]
+    assert memory.ds.weaviate.count(memory_id, a) == 2
+
+    # 已登记过的 url：不计数、不重新向量化 / 写入
+    c = _put(memory, "C")
+    out = memory.push_messages(memory_id, "test", [{"url": a}, {"url": c}])
+    assert out["inserted"] == 1
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 3
+    assert embedded[1:] == [["C", "C!"]]
+    assert memory.ds.weaviate.count(memory_id, a) == 2
+
+    out = memory.push_messages(memory_id, "test", [{"url": b}])
+    assert out == {"rows": out["rows"], "inserted": 0, "summary_job_id": None}
+    assert len(embedded) == 2
+    assert memory.ds.mem_primary.get(memory_id)["total_qa_count"] == 3
+
+
+def test_repushing_a_url_does_not_bump_counters_on_either_path(memory):
+    memory_id = memory.create_memory("test", {"summary_every_n": 2})
+    url = _put(memory)
+    primary = memory.ds.mem_primary
+
+    memory.push_message(memory_id, "test", url)
+    before = primary.get(memory_id)
+    assert before["total_qa_count"] == 1
+
+    # 单条路径重复 push：返回已有记录，计数 / 版本不变，不触发摘要，向量替换而非重复写入
+    row = memory.push_message(memory_id, "test", url)
+    after = primary.get(memory_id)
+    assert row["url"] == url and "summary_job_id" not in row
+    assert (after["total_qa_count"], after["recent_qa_count"], after["context_version"]) == (
+        before["total_qa_count"], before["recent_qa_count"], before["context_version"]
+    )
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+    # 批量路径同样不计数
+    out = memory.push_messages(memory_id, "test", [{"url": url}])
+    assert out["inserted"] == 0
+    after = primary.get(memory_id)
+    assert (after["total_qa_count"], after["context_version"]) == (1, before["context_version"])
+    assert memory.ds.weaviate.count(memory_id, url) == 2
+
+
+def test_periodic_maintenance_runs_on_interval(memory, monkeypatch):
+    from rag.datasource.sqlstores.mem_summary_chunks_store import MemSummaryChunksStore
+
+    monkeypatch.setenv("RAG_WORKER_MAINTENANCE_INTERVAL_S", "0.2")
+    chunks = MemSummaryChunksStore(memory.ds.sqlite_conn)
+    memory.ds.mem_summary_chunks = chunks
+    stale = uuid.uuid4().hex
+    chunks.put(stale, "旧")
+    chunks.conn.execute(
+        "UPDATE mem_summary_chunks SET created_at = datetime('now', '-40 days') WHERE chunk_hash = ?", (stale,)
+    )
+
+    w = _worker(memory)
+    assert w.run_periodic() == 1          # 启动后先执行一次
+    assert chunks.get_many([stale]) == {}
+    assert w.run_periodic() == 0          # 未到间隔
+    time.sleep(0.25)
+    assert w.run_periodic() == 1
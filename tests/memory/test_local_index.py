@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from rag.memory.local_index import LocalVectorIndex
+
+
+def _objs(vectors):
+    return [{"properties": {"url": f"u{i}"}, "vector": v} for i, v in enumerate(vectors)]
+
+
+def test_search_ranks_by_cosine():
+    index = LocalVectorIndex(max_vectors=8, max_memories=4)
+    entry = index.get("m", 1, lambda limit: _objs([[1, 0], [0, 1], [1, 1]]))
+
+    hits = index.search(entry, [1, 0.1], top_k=2)
+    assert [h["properties"]["url"] for h in hits] == ["u0", "u2"]
+    assert hits[0]["score"] == pytest.approx(1 / (2 - np.cos(np.arctan(0.1))), rel=1e-5)
+
+
+def test_large_memory_falls_back():
+    index = LocalVectorIndex(max_vectors=2, max_memories=4)
+    calls = []
+
+    def loader(limit):
+        calls.append(limit)
+        return _objs([[1, 0]] * limit)
+
+    assert index.get("m", 1, loader) is None
+    assert index.get("m", 1, loader) is None
+    assert calls == [3]  # 过大标记被缓存，不重复拉取
+
+
+def test_add_advances_version_and_gap_invalidates():
+    index = LocalVectorIndex(max_vectors=8, max_memories=4)
+    index.get("m", 1, lambda limit: _objs([[1, 0]]))
+
+    index.add("m", [[0, 1]], [{"url": "new"}], version=2)
+    entry = index.get("m", 2, lambda limit: pytest.fail("should not reload"))
+    assert index.search(entry, [0, 1], top_k=1)[0]["properties"]["url"] == "new"
+
+    index.add("m", [[1, 1]], [{"url": "x"}], version=5)
+    reloaded = []
+    index.get("m", 5, lambda limit: reloaded.append(limit) or [])
+    assert reloaded
+
+
+def test_load_overlapping_add_is_not_cached():
+    index = LocalVectorIndex(max_vectors=8, max_memories=4)
+
+    # 版本已前移到 2，但加载读到的是写入前的 Weaviate；加载期间 add 落在空缓存上
+    def slow_loader(limit):
+        index.add("m", [[0, 1]], [{"url": "new"}], version=2)
+        return _objs([[1, 0]])
+
+    entry = index.get("m", 2, slow_loader)
+    assert [p["url"] for p in entry.props] == ["u0"]   # 本次检索照常使用
+
+    reloaded = []
+    index.get("m", 2, lambda limit: reloaded.append(limit) or _objs([[1, 0], [0, 1]]))
+    assert reloaded, "与写入重叠的加载结果不应写回缓存"
+    assert not index._loading and not index._stale
+
+
+def test_load_overlapping_invalidate_is_not_cached():
+    index = LocalVectorIndex(max_vectors=8, max_memories=4)
+
+    def loader(limit):
+        index.invalidate("m")
+        return _objs([[1, 0]])
+
+    index.get("m", 3, loader)
+    reloaded = []
+    index.get("m", 3, lambda limit: reloaded.append(limit) or [])
+    assert reloaded
+
+
+def test_stale_load_does_not_replace_newer_entry():
+    index = LocalVectorIndex(max_vectors=8, max_memories=4)
+    index.get("m", 1, lambda limit: _objs([[1, 0]]))
+    index.add("m", [[0, 1]], [{"url": "new"}], version=2)
+
+    # 读取版本 1 的请求晚到：不覆盖已前移到 2 的条目
+    index.get("m", 1, lambda limit: _objs([[1, 0]]))
+    assert index._entries["m"].version == 2
+    assert index.get("m", 2, lambda limit: pytest.fail("should not reload")) is not None
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from types import SimpleNamespace
+
+from rag.memory.memory_manager import MemoryManager
+from rag.utils import deadline
+
+
+class SlowMinio:
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_text(self, key):
+        with self._lock:
+            self.calls.append(key)
+        time.sleep(self.delay_s)
+        return f"body:{key}"
+
+
+def _memory(monkeypatch, minio, workers=1, fetch_workers=None):
+    monkeypatch.setenv("RAG_CONTEXT_WORKERS", str(workers))
+    monkeypatch.setenv("RAG_CONTEXT_FETCH_WORKERS", str(fetch_workers or workers))
+    ds = SimpleNamespace(minio=minio, weaviate=object())
+    return MemoryManager(ds, embedder=SimpleNamespace(), summary_mode="queue", reranker=None)
+
+
+def test_fetch_bodies_cancels_pending_at_reserve_line(monkeypatch):
+    monkeypatch.setenv("RAG_DEADLINE_RESERVE_MS", "100")
+    minio = SlowMinio(delay_s=0.2)
+    memory = _memory(monkeypatch, minio, workers=1)
+
+    with deadline.start_deadline(150) as dl:
+        t0 = time.perf_counter()
+        got = memory._fetch_missing(["a", "b", "c"], {})
+        assert time.perf_counter() - t0 < 0.15
+    time.sleep(0.3)   # 等正在执行的那一个结束
+
+    # 只有第一个任务真正读取了 MinIO，排队的任务被取消，不再占用线程池
+    assert got == {} and minio.calls == ["a"]
+    assert dl.degraded == [{"stage": "fetch_bodies", "reason": "timeout"}]
+    memory.close()
+
+
+def test_queued_fetch_exits_once_reserve_line_passed(monkeypatch):
+    monkeypatch.setenv("RAG_DEADLINE_RESERVE_MS", "100")
+    minio = SlowMinio()
+    memory = _memory(monkeypatch, minio)
+    with deadline.start_deadline(50):
+        assert memory._fetch_missing(["a"], {}) == {}
+    assert minio.calls == []
+    memory.close()
+
+
+def test_fetch_bodies_not_starved_by_auxiliary_search(monkeypatch):
+    minio = SlowMinio(delay_s=0.1)
+    memory = _memory(monkeypatch, minio, workers=1, fetch_workers=4)
+    release = threading.Event()
+    # 辅助检索占满 get_context 线程池
+    blocker = memory._pool.submit(release.wait, 2)
+
+    t0 = time.perf_counter()
+    got = memory._fetch_missing(["a", "b", "c", "d"], {"b": "inline"})
+    elapsed = time.perf_counter() - t0
+    release.set()
+    blocker.result()
+
+    # 正文并发读取，不排在辅助检索之后
+    assert got == {"a": "body:a", "c": "body:c", "d": "body:d"}
+    assert sorted(minio.calls) == ["a", "c", "d"]
+    assert elapsed < 0.25
+    memory.close()
+
+
+def test_get_context_overlaps_auxiliary_search_and_body_fetch(monkeypatch):
+    monkeypatch.setenv("RAG_CONTEXT_CACHE_SIZE", "0")
+    minio = SlowMinio(delay_s=0.2)
+    memory = _memory(monkeypatch, minio, workers=1, fetch_workers=2)
+    memory.primary = SimpleNamespace(
+        get_context=lambda **kw: {"summary_urls": ["s"], "recent_urls": ["r"], "texts": {}}
+    )
+
+    def _slow_search(**kw):
+        time.sleep(0.2)
+        return [{"content": "hit", "url": "x", "score": 1.0}]
+
+    monkeypatch.setattr(memory, "_search_auxiliary", _slow_search)
+
+    t0 = time.perf_counter()
+    ctx = memory.get_context("m1", "app", "q")
+    elapsed = time.perf_counter() - t0
+
+    # 关键路径 ≈ max(辅助检索, 正文读取)，而不是两者之和
+    assert ctx["texts"] == {"s": "body:s", "r": "body:r"}
+    assert ctx["retrieved"] == [{"content": "hit", "url": "x", "score": 1.0}]
+    assert elapsed < 0.35
+    memory.close()
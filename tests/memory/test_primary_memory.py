@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.mem_contexts_store import MemContextsStore
+from rag.datasource.sqlstores.mem_context_snapshots_store import MemContextSnapshotsStore
+from rag.datasource.sqlstores.mem_deleted_store import MemDeletedStore
+from rag.datasource.sqlstores.mem_jobs_store import MemJobsStore
+from rag.datasource.sqlstores.mem_leases_store import MemLeasesStore
+from rag.datasource.sqlstores.mem_primary_store import MemPrimaryStore
+from rag.datasource.sqlstores.mem_registry_store import MemRegistryStore
+from rag.datasource.sqlstores.mem_summaries_store import MemSummariesStore
+from rag.memory.memory_manager import MemoryManager
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+class FakeMinio:
+    def __init__(self):
+        self.objects = {}
+        self.reads = Counter()
+        self._lock = threading.Lock()
+
+    def get_text(self, key):
+        with self._lock:
+            self.reads[key] += 1
+        return self.objects[key]
+
+    def put_text(self, key, text):
+        self.objects[key] = text
+        return key
+
+    def make_key(self, app, memory_id, ext=None):
+        return f"{app}/{memory_id}/{uuid.uuid4().hex}.{ext}"
+
+
+class FakeLLM:
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def complete(self, prompt, temperature=0.2, top_p=1.0, max_tokens=512, system=None):
+        if self.gate is not None:
+            self.gate.wait(2)
+        self.calls.append(prompt)
+        return f"摘要{len(self.calls)}"
+
+
+class FakeEmbedder:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class FakeWeaviate:
+    def add_texts(self, texts, vectors, metadatas, memory_id, app, collection=None):
+        return [str(uuid.uuid4()) for _ in texts]
+
+
+@pytest.fixture(scope="module")
+def conn():
+    return SQLiteConnection(TEST_DB_PATH)
+
+
+def _memory(conn, inline_max=0, llm=None):
+    ds = SimpleNamespace(
+        sqlite_conn=conn,
+        mem_contexts=MemContextsStore(conn, inline_max=inline_max),
+        mem_primary=MemPrimaryStore(conn, inline_max=inline_max),
+        mem_registry=MemRegistryStore(conn),
+        mem_deleted=MemDeletedStore(conn),
+        mem_jobs=MemJobsStore(conn),
+        mem_leases=MemLeasesStore(conn),
+        mem_summaries=MemSummariesStore(conn, inline_max=inline_max),
+        mem_snapshots=MemContextSnapshotsStore(conn),
+        minio=FakeMinio(),
+        weaviate=FakeWeaviate(),
+    )
+    return MemoryManager(ds, embedder=FakeEmbedder(), llm=llm or FakeLLM(), summary_mode="inline")
+
+
+def _put(memory, text="Q"):
+    url = f"qa/{uuid.uuid4().hex}.json"
+    memory.ds.minio.objects[url] = json.dumps(
+        [{"role": "user", "content": text}, {"role": "assistant", "content": text + "!"}]
+    )
+    return url
+
+
+@pytest.mark.parametrize("inline_max", [0, 32768])
+def test_inline_summary_reuses_pushed_body(conn, inline_max):
+    memory = _memory(conn, inline_max=inline_max)
+    memory_id = memory.create_memory("test", {"summary_every_n": 2})
+    a, b = _put(memory, "A"), _put(memory, "B")
+
+    memory.push_message(memory_id, "test", a)
+    memory.push_message(memory_id, "test", b)
+    assert memory.primary.llm.calls, "达到阈值应同步摘要"
+
+    # 触发摘要的消息只读取一次；更早的消息未内联时摘要才回读 MinIO
+    assert memory.ds.minio.reads[b] == 1
+    assert memory.ds.minio.reads[a] == (1 if inline_max else 2)
+    memory.close()
+
+
+def test_concurrent_summarize_runs_once_and_releases_lock(conn):
+    from rag.memory.primary_memory import PrimaryMemory
+
+    gate = threading.Event()
+    memory = _memory(conn, inline_max=32768, llm=FakeLLM(gate=gate))
+    memory_id = memory.create_memory("test", {"summary_every_n": 2})
+    for text in ("A", "B"):
+        url = _put(memory, text)
+        memory.primary.push(memory_id, "test", url, body=memory.ds.minio.objects[url])
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(memory.primary.maybe_summarize(memory_id, "test")))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)   # 第一个调用卡在 LLM，其余调用此时都在争锁
+    gate.set()
+    for t in threads:
+        t.join()
+
+    # 同一 memory 并发触发只生成一份摘要，其余调用直接返回 None
+    assert len([r for r in results if r]) == 1
+    assert len(memory.primary.llm.calls) == 1
+    assert len(memory.ds.mem_summaries.list_active(memory_id)) == 1
+    # 锁在无人持有后自动回收
+    assert memory_id not in PrimaryMemory._summary_locks
+    memory.close()
+
+
+class SlowLLM(FakeLLM):
+    def __init__(self, delay_s, during=None):
+        super().__init__()
+        self.delay_s = delay_s
+        self.during = during
+
+    def complete(self, prompt, **kwargs):
+        time.sleep(self.delay_s)
+        if self.during is not None:
+            self.during()
+        return super().complete(prompt, **kwargs)
+
+
+def _lease_memory(conn, llm):
+    memory = _memory(conn, inline_max=32768, llm=llm)
+    memory.primary.summary_lease_s = 0.3
+    memory.primary.summary_lease_renew_s = 0.05
+    memory_id = memory.create_memory("test", {"summary_every_n": 2})
+    for text in ("A", "B"):
+        url = _put(memory, text)
+        memory.primary.push(memory_id, "test", url, body=memory.ds.minio.objects[url])
+    return memory, memory_id
+
+
+def test_summary_lease_is_renewed_while_llm_runs(conn):
+    taken = []
+    llm = SlowLLM(0.8)
+    memory, memory_id = _lease_memory(conn, llm)
+    # LLM 调用远超租约时长，期间其他 worker 抢不到租约
+    llm.during = lambda: taken.append(memory.ds.mem_leases.acquire(f"summarize:{memory_id}", "other", ttl_s=1))
+
+    assert memory.primary.maybe_summarize(memory_id, "test")
+    assert taken == [False]
+    assert len(memory.ds.mem_summaries.list_active(memory_id)) == 1
+    assert memory.ds.mem_leases.get(f"summarize:{memory_id}") is None
+    memory.close()
+
+
+def test_summary_is_discarded_when_lease_is_taken_over(conn):
+    llm = SlowLLM(0.1)
+    memory, memory_id = _lease_memory(conn, llm)
+    name = f"summarize:{memory_id}"
+
+    def _take_over():
+        memory.ds.sqlite_conn.execute("UPDATE mem_leases SET owner = 'other' WHERE name = ?", (name,))
+
+    llm.during = _take_over
+    assert memory.primary.maybe_summarize(memory_id, "test") is None
+    # 租约被接管后不写入：窗口留给接管者，租约也不被误删
+    assert memory.ds.mem_summaries.list_active(memory_id) == []
+    assert memory.ds.mem_primary.get(memory_id)["recent_qa_count"] == 2
+    assert memory.ds.mem_leases.get(name)["owner"] == "other"
+    memory.close()
+
+
+def _push_and_summarize(memory, memory_id, text):
+    url = _put(memory, text)
+    memory.primary.push(memory_id, "test", url, body=memory.ds.minio.objects[url])
+    return url, memory.primary.maybe_summarize(memory_id, "test")
+
+
+def test_rollup_builds_summary_tree(conn):
+    memory = _memory(conn, inline_max=32768)
+    memory_id = memory.create_memory("test", {"summary_every_n": 1, "summary_rollup_n": 2})
+    summaries = memory.ds.mem_summaries
+
+    for text in "ABCD":
+        _push_and_summarize(memory, memory_id, text)
+    # 4 个叶子 → 2 个一层 → 1 个二层；LLM 调用 4 + 2 + 1 次
+    assert len(memory.primary.llm.calls) == 7
+    [root] = summaries.list_active(memory_id, with_text=True)
+    assert (root["level"], root["start_index"], root["end_index"]) == (2, 0, 4)
+    assert root["summary_text"] == "摘要7"
+    assert len(summaries.list_unrolled(memory_id, 0)) == 0
+
+    _push_and_summarize(memory, memory_id, "E")
+    assert [(r["level"], r["end_index"]) for r in summaries.list_active(memory_id)] == [(0, 5), (2, 4)]
+    assert len(memory.primary.llm.calls) == 8
+    memory.close()
+
+
+def test_get_context_returns_active_summaries_and_recent_messages(conn):
+    memory = _memory(conn, inline_max=32768)
+    memory_id = memory.create_memory("test", {"summary_every_n": 1, "summary_rollup_n": 2})
+    for text in "ABC":
+        _push_and_summarize(memory, memory_id, text)
+    recent = _put(memory, "D")
+    memory.primary.push(memory_id, "test", recent, body=memory.ds.minio.objects[recent])
+
+    active = memory.ds.mem_summaries.list_active(memory_id)
+    ctx = memory.primary.get_context(memory_id)
+    # 默认 summary_k=None：全部活跃摘要，旧 → 新
+    assert ctx["summary_urls"] == [r["url"] for r in reversed(active)]
+    assert len(ctx["summary_urls"]) == 2
+    assert ctx["recent_urls"] == [recent]
+    assert ctx["texts"][recent] == memory.ds.minio.objects[recent]
+    assert all(ctx["texts"][u].startswith("摘要") for u in ctx["summary_urls"])
+
+    assert memory.primary.get_context(memory_id, summary_k=1)["summary_urls"] == [active[0]["url"]]
+    assert memory.primary.get_context(memory_id, summary_k=0)["summary_urls"] == []
+    memory.close()
+
+
+def test_get_context_falls_back_to_legacy_rolling_summary(conn):
+    memory = _memory(conn, inline_max=32768)
+    memory_id = memory.create_memory("test")
+    memory.ds.mem_primary.update_summary(memory_id, "legacy.md", summary_text="旧摘要", consumed=0)
+
+    ctx = memory.primary.get_context(memory_id)
+    assert ctx["summary_urls"] == ["legacy.md"]
+    assert ctx["texts"] == {"legacy.md": "旧摘要"}
+    assert memory.primary.get_context(memory_id, summary_k=0)["summary_urls"] == []
+    memory.close()
+
+
+def test_large_batch_is_summarized_window_by_window(conn):
+    memory = _memory(conn, inline_max=32768)
+    memory_id = memory.create_memory("test", {"summary_every_n": 2, "summary_rollup_n": 10})
+    urls = [_put(memory, text) for text in "ABCDEFG"]
+
+    # 一次写入 7 条 > 2 × 阈值：从最早的消息开始逐窗口摘要，不跳过任何一条
+    result = memory.push_messages(memory_id, "test", [{"url": u} for u in urls])
+    assert result["inserted"] == 7
+
+    calls = memory.primary.llm.calls
+    assert len(calls) == 2
+    assert all(f'"{t}"' in calls[0] for t in "ABCD") and '"E"' not in calls[0]
+    assert all(f'"{t}"' in calls[1] for t in "EFG") and '"D"' not in calls[1]
+
+    leaves = memory.ds.mem_summaries.list_active(memory_id)
+    assert [(r["start_index"], r["end_index"]) for r in reversed(leaves)] == [(0, 4), (4, 7)]
+    progress = memory.ds.mem_primary.get(memory_id)
+    assert (progress["last_summary_index"], progress["recent_qa_count"]) == (7, 0)
+    assert memory.primary.get_context(memory_id)["recent_urls"] == []
+    memory.close()
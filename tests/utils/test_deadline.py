@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from rag.core.pipeline import RAGPipeline
+from rag.core.retriever_kb import KBRetriever
+from rag.utils import deadline
+from rag.utils.tracing import wrap
+
+
+def test_noop_without_deadline():
+    assert deadline.current() is None
+    assert deadline.allow("auxiliary") is True
+    assert deadline.timeout(60) == 60
+    assert deadline.wait_s() is None
+    deadline.check("llm")
+    deadline.degrade("kb", "timeout")
+    assert deadline.degraded() == []
+
+
+def test_request_budget(monkeypatch):
+    monkeypatch.setenv("RAG_REQUEST_TIMEOUT_MS", "0")
+    monkeypatch.setenv("RAG_REQUEST_TIMEOUT_MAX_MS", "5000")
+    assert deadline.request_budget_ms(None) is None
+    assert deadline.request_budget_ms("800") == 800
+    assert deadline.request_budget_ms("900000") == 5000
+    monkeypatch.setenv("RAG_REQUEST_TIMEOUT_MS", "3000")
+    assert deadline.request_budget_ms("abc") == 3000
+
+
+def test_optional_stages_skip_and_required_stages_raise(monkeypatch):
+    monkeypatch.setenv("RAG_DEADLINE_RESERVE_MS", "100")
+    with deadline.start_deadline(150) as dl:
+        assert deadline.allow("auxiliary") is True
+        assert deadline.timeout(60) <= 0.15
+        assert 0 < deadline.wait_s() <= 0.05
+        time.sleep(0.06)
+        assert deadline.allow("jd") is False
+        assert deadline.wait_s() == 0.0
+        deadline.degrade("jd", "timeout")   # 同一阶段只记一次
+        time.sleep(0.1)
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check("llm")
+        assert dl.degraded == [{"stage": "jd", "reason": "skipped"}]
+    assert deadline.current() is None
+
+
+def test_wrap_propagates_deadline_to_pool():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with deadline.start_deadline(1000) as dl:
+            assert pool.submit(wrap(deadline.current)).result() is dl
+            pool.submit(wrap(deadline.degrade), "auxiliary", "timeout").result()
+            assert dl.degraded == [{"stage": "auxiliary", "reason": "timeout"}]
+        assert pool.submit(wrap(deadline.current)).result() is None
+
+
+class SlowStore:
+    def search(self, query_vector, top_k=8, collection=None, **kw):
+        time.sleep(0.3)
+        return []
+
+
+def _pipeline(kb):
+    memory = SimpleNamespace(
+        answers=SimpleNamespace(enabled=False),
+        embedding_model=lambda memory_id: "emb-1",
+        embed_query=lambda memory_id, query: [1.0],
+        get_context=lambda **kw: {"summary_urls": [], "recent_urls": [], "texts": {}, "retrieved": []},
+    )
+    return RAGPipeline(SimpleNamespace(), memory, SimpleNamespace(complete=lambda prompt, **kw: "ok"), kb=kb)
+
+
+def test_pipeline_reports_degraded_stages(monkeypatch):
+    monkeypatch.setenv("RAG_DEADLINE_RESERVE_MS", "100")
+    kb = KBRetriever(lambda: SlowStore(), collections={"Docs": 5000}, top_k=2, min_score=0.0, embed_model="emb-1")
+    pipeline = _pipeline(kb)
+
+    # 知识库超出「剩余 - 预留」被截断，答案照常返回
+    with deadline.start_deadline(200):
+        t0 = time.perf_counter()
+        out = pipeline.run("m1", "app", "q")
+        assert time.perf_counter() - t0 < 0.25
+    assert out["answer"] == "ok"
+    assert out["context_used"]["degraded"] == [{"stage": "kb", "reason": "timeout"}]
+    assert out["context_used"]["kb"]["collections"]["Docs"]["status"] == "timeout"
+
+    # 剩余时间一开始就不足预留：知识库直接跳过
+    with deadline.start_deadline(50):
+        out = pipeline.run("m1", "app", "q")
+    assert out["context_used"]["degraded"] == [{"stage": "kb", "reason": "skipped"}]
+    assert "kb" not in out["context_used"]
+
+    # 未设截止时间：不返回 degraded
+    assert "degraded" not in _pipeline(KBRetriever(lambda: None, collections={})).run("m1", "app", "q")["context_used"]
+    pipeline.close()
+
+
+def _slow_llm(delay_s, max_retries):
+    import httpx
+    from rag.llm.providers.openai_client import OpenAIClient
+
+    def handler(request):
+        time.sleep(delay_s)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = OpenAIClient(model="m", api_base="http://llm.test", api_key="k", max_retries=max_retries)
+    client._http = httpx.Client(base_url="http://llm.test", transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_llm_retry_stops_at_deadline():
+    # 最后一次尝试超时：抛 DeadlineExceeded（而不是 RuntimeError），且不在截止时间之后继续退避
+    client = _slow_llm(0.12, max_retries=1)
+    with deadline.start_deadline(100):
+        t0 = time.perf_counter()
+        with pytest.raises(deadline.DeadlineExceeded):
+            client.complete("hi")
+    assert time.perf_counter() - t0 < 0.3
+
+    # 多次重试：退避不超过剩余时间
+    client = _slow_llm(0.05, max_retries=3)
+    with deadline.start_deadline(150):
+        t0 = time.perf_counter()
+        with pytest.raises(deadline.DeadlineExceeded):
+            client.complete("hi")
+    assert time.perf_counter() - t0 < 0.35
+
+
+def test_llm_timeout_on_last_attempt_maps_to_504(monkeypatch):
+    from fastapi.testclient import TestClient
+    from rag.api.main import create_app
+
+    monkeypatch.setenv("RAG_INPROC_WORKER", "false")
+    monkeypatch.setenv("RAG_WARMUP", "false")
+    app = create_app()
+    client = _slow_llm(0.12, max_retries=1)
+
+    @app.get("/_llm")
+    def call_llm():
+        return {"answer": client.complete("hi")}
+
+    with TestClient(app) as http:
+        r = http.get("/_llm", headers={deadline.HEADER: "100"})
+    assert r.status_code == 504
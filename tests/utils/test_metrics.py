@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from rag.utils import metrics, tracing
+from rag.utils.metrics import Counter, Histogram, Registry
+from rag.utils.tracing import set_exporters, span, start_trace
+
+
+@pytest.fixture
+def listener():
+    set_exporters([])
+    metrics.install()
+    yield
+    tracing.remove_listener(metrics._on_span)
+    set_exporters(None)
+
+
+def test_counter_and_histogram_exposition():
+    reg = Registry()
+    c = Counter("x_total", "X.", ["kind"], registry=reg)
+    h = Histogram("y_seconds", "Y.", ["op"], buckets=(0.1, 1.0), registry=reg)
+    c.inc(2, kind='a"b')
+    h.observe(0.05, op="get")
+    h.observe(0.5, op="get")
+    text = reg.render()
+    assert '# TYPE x_total counter\nx_total{kind="a\\"b"} 2\n' in text
+    assert 'y_seconds_bucket{op="get",le="0.1"} 1' in text
+    assert 'y_seconds_bucket{op="get",le="1"} 2' in text
+    assert 'y_seconds_bucket{op="get",le="+Inf"} 2' in text
+    assert 'y_seconds_sum{op="get"} 0.55' in text and 'y_seconds_count{op="get"} 2' in text
+    with pytest.raises(ValueError):
+        Counter("x_total", "dup", registry=reg)
+
+
+def test_dependency_spans_record_latency_and_tokens(listener):
+    before = metrics.DEPENDENCY_SECONDS.count(dependency="minio", operation="get")
+    tokens = metrics.LLM_TOKENS.value(model="m-test", type="completion")
+
+    # trace 之外的 span 也计入指标
+    with span("minio.get", key="k"):
+        pass
+    with start_trace("POST /query"):
+        with span("llm.chat", model="m-test") as s:
+            s.set(prompt_tokens=7, completion_tokens=3)
+        with pytest.raises(RuntimeError), span("weaviate.search"):
+            raise RuntimeError("down")
+
+    assert metrics.DEPENDENCY_SECONDS.count(dependency="minio", operation="get") == before + 1
+    assert metrics.LLM_TOKENS.value(model="m-test", type="completion") == tokens + 3
+    assert metrics.DEPENDENCY_ERRORS.value(dependency="weaviate", operation="search") >= 1
+
+
+def test_record_cache_counts_hits_and_misses():
+    hit = metrics.CACHE_REQUESTS.value(cache="t", result="hit")
+    metrics.record_cache("t", True, 2)
+    metrics.record_cache("t", False, 0)
+    assert metrics.CACHE_REQUESTS.value(cache="t", result="hit") == hit + 2
+    assert metrics.CACHE_REQUESTS.value(cache="t", result="miss") == 0
+
+
+def test_metrics_endpoint_uses_route_templates(monkeypatch):
+    from fastapi.testclient import TestClient
+    from rag.api.main import create_app
+
+    monkeypatch.setenv("RAG_INPROC_WORKER", "false")
+    monkeypatch.setenv("RAG_WARMUP", "false")
+    with TestClient(create_app()) as client:
+        assert client.get("/health").status_code == 200
+        client.get("/no/such/path")
+        r = client.get("/metrics")
+    tracing.remove_listener(metrics._on_span)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    assert 'rag_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in r.text
+    assert 'route="unmatched",status="404"' in r.text
+    assert "# TYPE rag_queue_jobs gauge" in r.text
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from rag.utils import tracing
+from rag.utils.timing import StageTimer
+from rag.utils.tracing import FileExporter, set_exporters, span, start_trace, trace_tree, traced, wrap
+
+
+@pytest.fixture(autouse=True)
+def no_exporters():
+    set_exporters([])
+    yield
+    set_exporters(None)
+
+
+def test_span_without_trace_is_noop():
+    with span("minio.get", key="k") as s:
+        s.set(bytes=3).add("bytes", 1)
+    assert tracing.current_span() is None
+    assert trace_tree() is None
+
+
+def test_nested_spans_form_tree():
+    @traced("llm.chat")
+    def call():
+        tracing.current_span().add("prompt_tokens", 10).add("prompt_tokens", 5)
+
+    with start_trace("POST /query") as root:
+        with span("memory.get_context"):
+            with span("minio.get", key="a") as s:
+                s.set(bytes=42)
+        call()
+        tree = trace_tree()
+
+    assert tree["name"] == "POST /query"
+    mem, llm = tree["children"]
+    assert mem["children"][0] == {"name": "minio.get", "duration_ms": mem["children"][0]["duration_ms"],
+                                  "attrs": {"key": "a", "bytes": 42}}
+    assert llm["attrs"] == {"prompt_tokens": 15}
+    assert root.end is not None and tracing.current_span() is None
+
+
+def test_wrap_binds_parent_in_pool_threads():
+    with start_trace("root") as root, ThreadPoolExecutor(max_workers=2) as pool:
+        def work(i):
+            with span("task", i=i):
+                pass
+            return i
+
+        assert list(pool.map(wrap(work), range(3))) == [0, 1, 2]
+        pool.submit(work, 9).result()  # 未 wrap 的任务不挂到树上
+    assert sorted(c.attrs["i"] for c in root.children) == [0, 1, 2]
+
+
+def test_error_recorded_and_reraised():
+    with pytest.raises(ValueError):
+        with start_trace("root") as root:
+            with span("weaviate.search"):
+                raise ValueError("boom")
+    assert root.children[0].error == "ValueError: boom"
+    assert root.error == "ValueError: boom"
+
+
+def test_stage_timer_opens_spans():
+    with start_trace("root") as root:
+        t = StageTimer("push_message")
+        with t.stage("fetch"):
+            pass
+    assert [c.name for c in root.children] == ["push_message.fetch"]
+    assert "fetch" in t.stages
+
+
+def test_file_exporter_writes_one_line_per_trace(tmp_path):
+    path = tmp_path / "traces" / "t.jsonl"
+    set_exporters([FileExporter(str(path))])
+    for name in ("a", "b"):
+        with start_trace(name, route=name):
+            with span("child"):
+                pass
+    lines = [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines()]
+    assert [l["name"] for l in lines] == ["a", "b"]
+    assert lines[0]["attrs"] == {"route": "a"} and lines[0]["children"][0]["name"] == "child"
+    assert lines[0]["trace_id"] != lines[1]["trace_id"]
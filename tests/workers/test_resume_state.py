@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import uuid
+
+import pytest
+
+from rag.datasource.connections.sqlite_connection import SQLiteConnection
+from rag.datasource.sqlstores.resume_states_store import ResumeStatesStore
+from rag.workers.resume_state import ResumeState, ResumeStateService, normalize_projects, normalize_skills
+
+TEST_DB_PATH = os.path.join(os.getcwd(), "db/rag_test.sqlite3")
+
+
+class FakeMinio:
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def put(self, key, data, etag):
+        self.objects[key] = (json.dumps(data, ensure_ascii=False).encode("utf-8"), etag)
+
+    def etag(self, key, bucket=None):
+        return self.objects[key][1]
+
+    def get_bytes(self, key, bucket=None):
+        self.downloads += 1
+        return self.objects[key][0]
+
+
+class FakeEmbedder:
+    def __init__(self, model="emb-1", fail=False):
+        self.model = model
+        self.fail = fail
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("embedding down")
+        return [float(len(text)), 1.0]
+
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture(scope="module")
+def store():
+    return ResumeStatesStore(SQLiteConnection(TEST_DB_PATH))
+
+
+RESUME = {
+    "position": " 后端工程师 ",
+    "skills": ["Python", " python", "Go", ""],
+    "projects": ["网关重构", {"name": "推荐系统", "description": "召回优化", "tech": "Faiss、Python"}],
+}
+
+
+def test_normalize():
+    assert normalize_skills("Python、Go，python; Rust") == ["Python", "Go", "Rust"]
+    assert normalize_projects({"title": "A"}) == ["A"]
+    st = ResumeState.parse("u", "e", RESUME)
+    assert st.position == "后端工程师"
+    assert st.skills_text == "Python, Go"
+    assert st.projects_text == "网关重构\n推荐系统：召回优化（技术：Faiss, Python）"
+    with pytest.raises(ValueError):
+        ResumeState.parse("u", "e", ["not", "a", "dict"])
+
+
+def test_memory_hit_within_ttl_and_etag_change():
+    minio, clock, emb = FakeMinio(), Clock(), FakeEmbedder()
+    svc = ResumeStateService(minio, embedder=lambda: emb, stat_ttl_s=30, clock=clock)
+    minio.put("r.json", RESUME, "e1")
+
+    first = svc.get("r.json")
+    assert first.embedding is not None and first.embed_model == "emb-1"
+    clock.t = 10
+    assert svc.get("r.json") is first
+    assert minio.downloads == 1
+
+    # TTL 过后只校验 ETag，未变化不重新下载
+    clock.t = 100
+    assert svc.get("r.json") is first
+    assert minio.downloads == 1
+
+    minio.put("r.json", dict(RESUME, position="算法工程师"), "e2")
+    clock.t = 200
+    assert svc.get("r.json").position == "算法工程师"
+    assert minio.downloads == 2
+    assert emb.calls == 2
+
+
+def test_store_reuse_across_instances(store):
+    url = f"resume/{uuid.uuid4().hex}.json"
+    minio = FakeMinio()
+    minio.put(url, RESUME, "e1")
+    ResumeStateService(minio, store, embedder=lambda: FakeEmbedder()).get(url)
+
+    emb = FakeEmbedder()
+    st = ResumeStateService(minio, store, embedder=lambda: emb).get(url)
+    assert minio.downloads == 1 and emb.calls == 0
+    assert st.skills == ["Python", "Go"] and st.embedding is not None
+
+    # 模型变化时补算 embedding，解析结果仍复用
+    emb2 = FakeEmbedder(model="emb-2")
+    st = ResumeStateService(minio, store, embedder=lambda: emb2).get(url)
+    assert minio.downloads == 1 and emb2.calls == 1
+    assert store.get(url)["embed_model"] == "emb-2"
+
+
+def test_embedding_failure_is_filled_later(store):
+    url = f"resume/{uuid.uuid4().hex}.json"
+    minio, clock = FakeMinio(), Clock()
+    minio.put(url, RESUME, "e1")
+    emb = FakeEmbedder(fail=True)
+    svc = ResumeStateService(minio, store, embedder=lambda: emb, stat_ttl_s=0, embed_retry_s=10, clock=clock)
+
+    st = svc.get(url)
+    assert st.embedding is None and st.position == "后端工程师"
+
+    emb.fail = False
+    clock.t = 11
+    st = svc.get(url)
+    assert st.embedding is not None
+    assert store.get(url)["embedding"] == st.embedding
+    assert minio.downloads == 1
+
+
+def test_embedding_failure_backs_off(store):
+    url = f"resume/{uuid.uuid4().hex}.json"
+    minio, clock = FakeMinio(), Clock()
+    minio.put(url, RESUME, "e1")
+    emb = FakeEmbedder(fail=True)
+    svc = ResumeStateService(minio, store, embedder=lambda: emb, stat_ttl_s=0, embed_retry_s=10, clock=clock)
+
+    svc.get(url)
+    assert emb.calls == 1
+    # 退避期内的命中不再调用 embedding
+    for t in (1, 5, 9):
+        clock.t = t
+        assert svc.get(url).embedding is None
+    assert emb.calls == 1
+
+    # 到期重试仍失败：间隔翻倍（10 → 20）
+    clock.t = 10
+    svc.get(url)
+    assert emb.calls == 2
+    clock.t = 29
+    svc.get(url)
+    assert emb.calls == 2
+    clock.t = 30
+    emb.fail = False
+    assert svc.get(url).embedding is not None
+    assert emb.calls == 3
+
+    # 成功后清除负缓存
+    assert url not in svc._embed_failures